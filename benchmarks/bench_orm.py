@@ -0,0 +1,127 @@
+import random
+
+import pytest
+
+AQUARIUMS = 100
+
+
+def seed(Fish, Aquarium, rows):
+    """Fills tables with COPY, fish are spread evenly over aquariums"""
+    Aquarium.objects().copy_from((f"color{i}", i) for i in range(AQUARIUMS))
+    names = Fish.__columns__.insertable_names
+    Fish.objects().copy_from(tuple({"name": f"fish{i}", "age": i % 90, "aquarium_id": i % AQUARIUMS + 1}[name]
+                                   for name in names) for i in range(rows))
+    Fish.db.commit()
+    with Fish.db.cursor() as cursor:
+        cursor.execute("analyze")
+
+
+@pytest.fixture
+def stocked(models):
+    seed(*models, rows=10000)
+    return models
+
+
+@pytest.fixture
+def stocked_large(models):
+    seed(*models, rows=1000000)
+    return models
+
+
+class BenchInstances:
+
+    def bench_model_instantiation(self, bench, models):
+        Fish, Aquarium = models
+        bench(lambda: [Fish(name="lily", age=2, aquarium_id=1) for _ in range(10000)], ops=10000)
+
+    def bench_from_namedtuple(self, bench, stocked):
+        Fish, Aquarium = stocked
+        rows = Fish.objects().get_all()
+        bench(lambda: [Fish.from_namedtuple(row) for row in rows], ops=len(rows))
+
+
+class BenchWrites:
+
+    def bench_save(self, bench, models):
+        Fish, Aquarium = models
+        bench.each(lambda _: Fish(name="lily", age=2).objects().save(), range(200), rounds=5)
+
+    def bench_bulk_save(self, bench, models):
+        Fish, Aquarium = models
+        bench(lambda: Fish.objects().bulk_save([Fish(name="lily", age=2) for _ in range(10000)]), ops=10000,
+              rounds=5)
+
+    def bench_copy_from(self, bench, models):
+        Fish, Aquarium = models
+        bench(lambda: Fish.objects().copy_from(Fish(name="lily", age=2) for _ in range(10000)), ops=10000,
+              rounds=5)
+
+    def bench_bulk_update(self, bench, stocked):
+        Fish, Aquarium = stocked
+        fishes = Fish.objects().all()
+
+        def update():
+            for fish in fishes:
+                fish.age.value += 1
+            Fish.objects().bulk_update(fishes, fields=["age"])
+
+        bench(update, ops=len(fishes), rounds=5)
+
+
+class BenchReads:
+
+    def bench_get(self, bench, stocked):
+        Fish, Aquarium = stocked
+        pks = random.Random(0).sample(range(1, 10001), 1000)
+        bench.each(Fish.objects().get, pks, rounds=5)
+
+    def bench_get_many(self, bench, stocked):
+        Fish, Aquarium = stocked
+        pks = random.Random(0).sample(range(1, 10001), 1000)
+        bench(lambda: Fish.objects().get_many(pks), ops=len(pks))
+
+    def bench_get_all_10k(self, bench, stocked):
+        Fish, Aquarium = stocked
+        bench(lambda: Fish.objects().get_all(), ops=10000)
+
+    def bench_all_10k(self, bench, stocked):
+        Fish, Aquarium = stocked
+        bench(lambda: Fish.objects().all(), ops=10000)
+
+    @pytest.mark.large
+    def bench_get_all_1m(self, bench, stocked_large):
+        Fish, Aquarium = stocked_large
+        bench(lambda: Fish.objects().get_all(), ops=1000000, rounds=3)
+
+    @pytest.mark.large
+    def bench_iterate_1m(self, bench, stocked_large):
+        Fish, Aquarium = stocked_large
+        bench(lambda: sum(1 for _ in Fish.objects().iterate(chunk_size=10000)), ops=1000000, rounds=3)
+
+    def bench_filtered_join(self, bench, stocked):
+        Fish, Aquarium = stocked
+        query = Fish.objects().filter("aquarium_id__price", "<", 10).filter("age", ">=", 45)
+        bench(lambda: query.get_all(), ops=1)
+
+    def bench_count(self, bench, stocked):
+        Fish, Aquarium = stocked
+        query = Fish.objects().filter("age", "<", 30)
+        bench(lambda: query.count(), ops=1, rounds=50)
+
+
+class BenchRelated:
+
+    def bench_select_related(self, bench, stocked):
+        Fish, Aquarium = stocked
+        bench(lambda: [fish.aquarium.color.value for fish in Fish.objects().select_related("aquarium_id").all()],
+              ops=10000)
+
+    def bench_prefetch_related(self, bench, stocked):
+        Fish, Aquarium = stocked
+        bench(lambda: [fish.aquarium.color.value for fish in Fish.objects().prefetch_related("aquarium_id").all()],
+              ops=10000)
+
+    def bench_lazy_related(self, bench, stocked):
+        Fish, Aquarium = stocked
+        query = Fish.objects().filter("id", "<=", 500)
+        bench(lambda: [fish.aquarium.color.value for fish in query.all()], ops=500, rounds=3)
@@ -0,0 +1,207 @@
+"""Benchmarks of ORM hot paths, run against the throwaway server of pytest-postgresql:
+
+    python -m pytest benchmarks --bench-save=baseline.json
+    python -m pytest benchmarks --bench-compare=baseline.json --bench-threshold=0.2
+
+Every benchmark reports ops/sec at median latency, p50/p99 latency, peak memory and number of statements
+per round. Point paths (get, save) time every operation on its own, batch paths time whole rounds and report
+per-round means per operation, marked by the latency column. Compared with a baseline, a benchmark fails when
+its ops/sec drop or its peak memory grows by more than the threshold, or when it runs more statements than
+before. Benchmarks over a million rows run only with --bench-large"""
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+import psycopg2
+import pytest
+
+from towel import *
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("towel benchmarks")
+    group.addoption("--bench-save", metavar="PATH", help="save results as JSON baseline")
+    group.addoption("--bench-compare", metavar="PATH", help="fail benchmarks regressed against JSON baseline")
+    group.addoption("--bench-threshold", type=float, default=0.2,
+                    help="tolerated relative drop of ops/sec and growth of peak memory, 0.2 by default")
+    group.addoption("--bench-rounds", type=int, default=None, help="timed rounds of every benchmark")
+    group.addoption("--bench-large", action="store_true", help="run benchmarks over a million rows as well")
+
+
+def pytest_configure(config):
+    config.bench_results = {}
+    config.addinivalue_line("markers", "large: benchmark over a million rows, run only with --bench-large")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("bench_large"):
+        return
+    skip = pytest.mark.skip(reason="needs --bench-large")
+    for item in items:
+        if "large" in item.keywords:
+            item.add_marker(skip)
+
+
+def pytest_sessionfinish(session):
+    path = session.config.getoption("bench_save")
+    results = session.config.bench_results
+    if path and results:
+        with open(path, "w") as f:
+            json.dump({"environment": environment(), "benchmarks": results}, f, indent=2, sort_keys=True)
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = config.bench_results
+    if not results:
+        return
+    terminalreporter.section("towel benchmarks")
+    terminalreporter.write_line(f"{'benchmark':<40}{'ops/sec':>14}{'p50 ms':>10}{'p99 ms':>10}"
+                                f"{'latency':>15}{'peak KiB':>12}{'statements':>12}")
+    for name, result in sorted(results.items()):
+        terminalreporter.write_line(f"{name:<40}{result['ops_per_sec']:>14,.1f}{result['p50_ms']:>10.3f}"
+                                    f"{result['p99_ms']:>10.3f}{result['latency']:>15}"
+                                    f"{result['peak_memory_kib']:>12,.1f}{result['statements']:>12}")
+
+
+def environment():
+    return {"python": platform.python_version(), "psycopg2": psycopg2.__version__.split()[0],
+            "machine": platform.machine(), "system": platform.system()}
+
+
+class Bench:
+    """Measures a callable: one profiled round counting statements and peak memory, then timed rounds"""
+
+    def __init__(self, name, db, rounds, baseline, threshold):
+        self.name = name
+        self.db = db
+        self.rounds = rounds
+        self.baseline = baseline
+        self.threshold = threshold
+        self.result = None
+
+    def __call__(self, func, ops=1, rounds=10, setup=None):
+        """Batch benchmark: func does ops operations per round. Setup runs before each round and isn't timed.
+        Individual operations can't be timed here, latencies are per-round means per operation"""
+        def timed():
+            started = time.perf_counter()
+            func()
+            return [(time.perf_counter() - started) / ops]
+
+        return self._measure(func, timed, ops, rounds, setup, "per operation" if ops == 1 else "round mean")
+
+    def each(self, func, items, rounds=3, setup=None):
+        """Point benchmark: func(item) for every item, each call timed on its own, so p50/p99 are latencies
+        of single operations"""
+        items = list(items)
+
+        def run():
+            for item in items:
+                func(item)
+
+        def timed():
+            latencies = []
+            for item in items:
+                started = time.perf_counter()
+                func(item)
+                latencies.append(time.perf_counter() - started)
+            return latencies
+
+        return self._measure(run, timed, len(items), rounds, setup, "per operation")
+
+    def _measure(self, run, timed, ops, rounds, setup, latency):
+        rounds = self.rounds or rounds
+        statements, peak = self._profile(run, setup)
+        assert not self.db.instrumentation, "timed rounds have to run without listeners"
+
+        latencies = []
+        for _ in range(rounds):
+            if setup is not None:
+                setup()
+            latencies.extend(timed())
+
+        latencies.sort()
+        self.result = {"ops_per_sec": 1 / statistics.median(latencies),
+                       "p50_ms": statistics.median(latencies) * 1000,
+                       "p99_ms": latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000,
+                       "latency": latency, "peak_memory_kib": peak / 1024, "statements": statements,
+                       "rounds": rounds, "ops": ops}
+        self._check()
+        return self.result
+
+    def _profile(self, func, setup):
+        if setup is not None:
+            setup()
+        events = []
+        listener = self.db.add_listener(events.append)
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            self.db.remove_listener(listener)
+        return len(events), peak
+
+    def _check(self):
+        baseline = self.baseline.get(self.name)
+        if baseline is None:
+            return
+
+        result, failures = self.result, []
+        if result["ops_per_sec"] < baseline["ops_per_sec"] * (1 - self.threshold):
+            failures.append(f"ops/sec {result['ops_per_sec']:,.1f} < {baseline['ops_per_sec']:,.1f}")
+        if result["peak_memory_kib"] > baseline["peak_memory_kib"] * (1 + self.threshold):
+            failures.append(f"peak memory {result['peak_memory_kib']:,.1f} KiB > {baseline['peak_memory_kib']:,.1f}")
+        if result["statements"] > baseline["statements"]:
+            failures.append(f"statements {result['statements']} > {baseline['statements']}")
+        if failures:
+            pytest.fail(f"{self.name} regressed: " + ", ".join(failures), pytrace=False)
+
+
+@pytest.fixture(scope="session")
+def baseline(request):
+    path = request.config.getoption("bench_compare")
+    if not path:
+        return {}
+    with open(path) as f:
+        return json.load(f)["benchmarks"]
+
+
+@pytest.fixture
+def db(postgresql):
+    data = Database(postgresql)
+    yield data
+    data.kill()
+
+
+@pytest.fixture
+def models(db):
+    data = db
+
+    class Base(AbstractBaseModel):
+        db = data
+
+    class Aquarium(Base):
+        color = Column(VarChar, length=50)
+        price = Column(Integer)
+
+    class Fish(Base):
+        name = Column(VarChar, length=50)
+        age = Column(Integer, index=True)
+        aquarium_id = Column(ForeignKey, table=Aquarium, entity_name="aquarium")
+
+    Aquarium.objects().create_table()
+    Fish.objects().create_table()
+    return Fish, Aquarium
+
+
+@pytest.fixture
+def bench(request, db, baseline):
+    config = request.config
+    benchmark = Bench(request.node.name, db, config.getoption("bench_rounds"), baseline,
+                      config.getoption("bench_threshold"))
+    yield benchmark
+    if benchmark.result is not None:
+        config.bench_results[benchmark.name] = benchmark.result
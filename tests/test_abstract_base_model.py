@@ -61,3 +61,108 @@ class TestModelTest:
 
         with pytest.raises(TowelValueError):
             Fish(age=age)
+
+
+class TestColumnRegistry:
+
+    def test_orders_columns(self, base):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+            age = Column(Integer)
+
+        registry = Fish.__columns__
+        assert registry.names == ("age", "id", "name")
+        assert registry.insertable_names == ("age", "name")
+        assert registry.index["name"] == 2
+        assert registry.primary_key is Fish.id
+
+    def test_includes_inherited_columns(self, base):
+        class Animal(base):
+            name = Column(VarChar, length=50)
+
+        class Fish(Animal):
+            age = Column(Integer)
+
+        assert Fish.__columns__.names == ("age", "id", "name")
+        assert "age" not in Animal.__columns__
+
+    def test_resolves_foreign_keys(self, base, fish_and_aquarium):
+        Fish, Aquarium = fish_and_aquarium
+
+        assert tuple(col.column_name for col in Fish.__columns__.foreign_keys) == ("aquarium_id",)
+        assert Aquarium.__columns__.foreign_keys == ()
+
+
+class TestCompactLayout:
+
+    def test_instances_have_no_dict(self, base):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+
+        assert not hasattr(Fish(name="lily"), "__dict__")
+
+    def test_validates_on_assignment(self, base):
+        class Fish(base):
+            age = Column(Integer)
+
+        f = Fish(age=1)
+        f.age = 2
+        assert f.age.value == 2
+
+        with pytest.raises(TowelValueError):
+            f.age = "fjsk"
+
+    def test_validates_through_view(self, base):
+        class Fish(base):
+            age = Column(Integer)
+
+        f = Fish(age=1)
+        f.age.value = 3
+        assert f.age.value == 3
+
+        with pytest.raises(TowelValueError):
+            f.age.value = "fjsk"
+
+    def test_instances_do_not_share_values(self, base):
+        class Fish(base):
+            age = Column(Integer)
+
+        first, second = Fish(age=1), Fish(age=2)
+        assert (first.age.value, second.age.value) == (1, 2)
+        assert isinstance(Fish.age, Column)
+
+
+class TestLazyManager:
+
+    def test_instances_do_not_create_managers(self, base):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+
+        Fish(name="lily")
+        assert "_objects" not in Fish.__dict__
+
+    def test_manager_is_reused(self, base):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+
+        manager = Fish.objects()
+        assert Fish.objects() is manager
+        assert Fish(name="lily").objects() is not manager
+
+    def test_bound_handle_uses_instance(self, base):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+
+        fish = Fish(name="lily")
+        assert fish.objects().model is fish
+        assert Fish.objects().model is Fish
+
+    def test_subclasses_have_own_managers(self, base):
+        class Animal(base):
+            pass
+
+        class Fish(Animal):
+            pass
+
+        assert Animal.objects().model is Animal
+        assert Fish.objects().model is Fish
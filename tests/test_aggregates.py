@@ -0,0 +1,109 @@
+import pytest
+
+from towel import *
+
+
+@pytest.fixture
+def stocked(base, fish_and_aquarium):
+    Fish, Aquarium = fish_and_aquarium
+    green, blue = Aquarium(color="green", price=10), Aquarium(color="blue", price=50)
+    Aquarium.objects().bulk_save([green, blue])
+    Fish.objects().bulk_save([Fish(name="lily", age=2, aquarium_id=green.id.value),
+                              Fish(name="sam", age=3, aquarium_id=green.id.value),
+                              Fish(name="dody", age=10, aquarium_id=blue.id.value),
+                              Fish(name="nemo", age=1)])
+    return Fish, Aquarium
+
+
+class TestCount:
+
+    def test_counts_in_database(self, base, cursor, fish_fixtures, monkeypatch):
+        Fish, elements = fish_fixtures
+        monkeypatch.setattr(Fish, "from_namedtuple", classmethod(lambda cls, row: pytest.fail("rows fetched")))
+
+        assert Fish.objects().count() == 4
+        assert Fish.objects().filter("age", "<", 10).count() == 2
+        assert Fish.objects().filter("age", ">", 1000).count() == 0
+
+    def test_counts_across_join(self, base, cursor, stocked):
+        Fish, Aquarium = stocked
+        assert Fish.objects().filter("aquarium_id__color", "=", "green").count() == 2
+
+    def test_exists(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        statement, params = Fish.objects().filter("age", ">", 3).compile(cursor, "exists")
+
+        assert statement.startswith(b"select exists(") and statement.endswith(b" limit 1)")
+        assert Fish.objects().filter("age", ">", 3).exists() is True
+        assert Fish.objects().filter("age", ">", 1000).exists() is False
+
+    def test_counts_within_window(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        fishes = Fish.objects().order_by("age")
+
+        assert fishes.limit(3).count() == 3
+        assert fishes.offset(3).count() == 1
+        assert fishes.limit(2).offset(3).count() == 1
+        assert fishes.filter("age", "<", 10).limit(0).exists() is False
+        assert fishes.limit(1).offset(3).exists() is True
+        assert fishes.offset(4).exists() is False
+
+    def test_table_empty(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        assert Fish.objects().table_empty is False
+
+        Fish.objects().remove()
+        assert Fish.objects().table_empty is True
+
+    def test_estimated_count(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        assert Fish.objects().estimated_count() == 4
+
+        base.db.commit()
+        base.db.connection.autocommit = True
+        cursor.execute("analyze fish")
+        assert Fish.objects().estimated_count() == 4
+
+
+class TestAggregate:
+
+    def test_aggregates(self, base, cursor, stocked):
+        Fish, Aquarium = stocked
+        result = Fish.objects().filter("age", ">", 1).aggregate(sum="age", max=("age", "name"), count="id")
+
+        assert result == {"age__sum": 15, "age__max": 10, "name__max": "sam", "id__count": 3}
+
+    def test_aggregates_across_join(self, base, cursor, stocked):
+        Fish, Aquarium = stocked
+        assert Fish.objects().aggregate(sum="aquarium_id__price") == {"aquarium_id__price__sum": 70}
+
+    def test_join_keeps_null_foreign_key(self, base, cursor, stocked):
+        Fish, Aquarium = stocked
+        assert Fish.objects().aggregate(sum="age", max="aquarium_id__price") == \
+               {"age__sum": 16, "aquarium_id__price__max": 50}
+        assert Fish.objects().filter("aquarium_id__color", "=", "green").aggregate(sum="age", count="id") == \
+               {"age__sum": 5, "id__count": 2}
+
+    def test_group_by(self, base, cursor, stocked):
+        Fish, Aquarium = stocked
+        rows = Fish.objects().group_by("aquarium_id__color").annotate(count="id", avg="age")
+
+        assert [(row.aquarium_id__color, row.id__count, float(row.age__avg)) for row in rows] == \
+               [("blue", 1, 10.0), ("green", 2, 2.5), (None, 1, 1.0)]
+
+    def test_group_by_with_filter(self, base, cursor, stocked):
+        Fish, Aquarium = stocked
+        rows = Fish.objects().filter("age", "<", 10).group_by("aquarium_id").annotate(min="age")
+
+        assert [tuple(row) for row in rows] == [(1, 2), (None, 1)]
+
+    def test_raises_on_invalid_arguments(self, base, cursor, stocked):
+        Fish, Aquarium = stocked
+        with pytest.raises(TowelAttributeError):
+            Fish.objects().aggregate(median="age")
+        with pytest.raises(TowelAttributeError):
+            Fish.objects().aggregate(sum="weight")
+        with pytest.raises(TowelAttributeError):
+            Fish.objects().aggregate()
+        with pytest.raises(TowelAttributeError):
+            Fish.objects().group_by("weight")
@@ -0,0 +1,200 @@
+import asyncio
+
+import pytest
+
+from towel import *
+
+
+@pytest.fixture
+def run(postgresql):
+    """Runs test coroutine with async Fish and Aquarium models bound to a fresh AsyncDatabase"""
+
+    def runner(test, **kwargs):
+        async def main():
+            data = await AsyncDatabase.connect(postgresql.dsn, minconn=1, maxconn=8, **kwargs)
+
+            class Base(AbstractBaseModel):
+                db = data
+                _objects = AsyncObjectManager
+
+            class Aquarium(Base):
+                color = Column(VarChar, length=50)
+
+            class Fish(Base):
+                name = Column(VarChar, length=50)
+                age = Column(Integer)
+                aquarium_id = Column(ForeignKey, table=Aquarium, entity_name="aquarium")
+
+            await Aquarium.objects().create_table()
+            await Fish.objects().create_table()
+            try:
+                return await test(Fish, Aquarium)
+            finally:
+                await data.kill()
+
+        return asyncio.run(main())
+
+    return runner
+
+
+class TestAsyncManager:
+
+    def test_save_and_get(self, run):
+        async def test(Fish, Aquarium):
+            fish = Fish(name="lily", age=2)
+            await fish.objects().save()
+            found = await Fish.objects().get(fish.id.value)
+            assert (found.name.value, found.age.value) == ("lily", 2)
+            assert await Fish.objects().get(100) is None
+
+        run(test)
+
+    def test_upsert(self, run):
+        async def test(Fish, Aquarium):
+            await Fish(name="lily", age=2).objects().save()
+            await Fish(name="sam", age=3, id=1).objects().save(on_conflict="update")
+            await Fish.objects().bulk_upsert([Fish(name="alex", age=4, id=1), Fish(name="dody", age=5)],
+                                             on_conflict="ignore")
+            assert sorted((row.id, row.name) for row in await Fish.objects().get_all()) == [(1, "sam"), (2, "dody")]
+            assert await Fish.objects().get_all(limit=0) == []
+
+            await Fish.objects().bulk_upsert([Fish(name="mia", age=6, id=10)])
+            fish = Fish(name="bob", age=7)
+            await fish.objects().save()
+            assert fish.id.value == 11
+
+        run(test)
+
+    def test_filter_update_remove(self, run):
+        async def test(Fish, Aquarium):
+            await Fish.objects().bulk_save([Fish(name=f"fish{i}", age=i) for i in range(10)])
+            older = Fish.objects().filter("age", ">=", Param("age"))
+
+            assert len(await older.bind(age=5).all()) == 5
+            await older.bind(age=5).update(name="old")
+            assert {row.name for row in await Fish.objects().filter("age", ">=", 5).get_all()} == {"old"}
+
+            with pytest.raises(TowelOperationalError):
+                await older.bind(age=8).limit(1).remove()
+            with pytest.raises(TowelOperationalError):
+                await older.bind(age=8).limit(1).update(name="young")
+            await older.bind(age=8).remove()
+            assert len(await Fish.objects().get_all()) == 8
+
+            fish = await Fish.objects().get(1)
+            await fish.objects().update(age=100)
+            assert (await Fish.objects().get(1)).age.value == 100
+            await fish.objects().remove()
+            assert await Fish.objects().get(1) is None
+
+        run(test)
+
+    def test_aggregates(self, run):
+        async def test(Fish, Aquarium):
+            assert await Fish.objects().table_empty is True
+            await Fish.objects().bulk_save([Fish(name=f"fish{i}", age=i % 3) for i in range(9)])
+
+            assert await Fish.objects().filter("age", ">", 0).count() == 6
+            assert await Fish.objects().filter("age", ">", 5).exists() is False
+            assert await Fish.objects().aggregate(sum="age") == {"age__sum": 9}
+            rows = await Fish.objects().group_by("age").annotate(count="id")
+            assert [tuple(row) for row in rows] == [(0, 3), (1, 3), (2, 3)]
+
+        run(test)
+
+    def test_queries_run_concurrently(self, run):
+        async def test(Fish, Aquarium):
+            async def slow(n):
+                async with Fish.db.cursor() as cursor:
+                    await Fish.db.execute(cursor, "select pg_sleep(0.3), %s", (n,))
+                    return cursor.fetchone()[1]
+
+            started = asyncio.get_running_loop().time()
+            assert await asyncio.gather(*(slow(n) for n in range(8))) == list(range(8))
+            assert asyncio.get_running_loop().time() - started < 1.5
+
+        run(test)
+
+    def test_async_iteration(self, run):
+        async def test(Fish, Aquarium):
+            await Fish.objects().bulk_save([Fish(name=f"fish{i}", age=i) for i in range(25)])
+
+            rows = [row async for row in Fish.objects().filter("age", "<", 20).iterate(chunk_size=3)]
+            assert [row.age for row in rows] == list(range(20))
+            instances = [fish async for fish in Fish.objects().iterate(chunk_size=7, instances=True)]
+            assert all(isinstance(fish, Fish) for fish in instances) and len(instances) == 25
+
+        run(test)
+
+    def test_related_entities(self, run):
+        async def test(Fish, Aquarium):
+            green = Aquarium(color="green")
+            await green.objects().save()
+            await Fish.objects().bulk_save([Fish(name="lily", age=2, aquarium_id=green.id.value),
+                                            Fish(name="sam", age=3)])
+
+            lily, sam = await Fish.objects().prefetch_related("aquarium_id").all()
+            assert lily.aquarium.color.value == "green"
+            assert sam.aquarium is None
+
+            lily = await Fish.objects().get(lily.id.value)
+            assert (await lily.aquarium).color.value == "green"
+            assert lily.aquarium.color.value == "green"
+
+        run(test)
+
+    def test_transaction_rolls_back(self, run):
+        async def test(Fish, Aquarium):
+            with pytest.raises(ValueError):
+                async with Fish.db.transaction():
+                    await Fish(name="lily", age=2).objects().save()
+                    raise ValueError
+
+            async with Fish.db.transaction():
+                await Fish(name="sam", age=3).objects().save()
+            assert [row.name for row in await Fish.objects().get_all()] == ["sam"]
+
+        run(test)
+
+    def test_exhausted_pool_times_out(self, run):
+        async def test(Fish, Aquarium):
+            pool = Fish.db.pool
+            conns = [await pool.getconn() for _ in range(pool.maxconn)]
+            with pytest.raises(TowelOperationalError):
+                await pool.getconn(timeout=0.1)
+            for conn in conns:
+                await pool.putconn(conn)
+
+        run(test)
+
+    def test_ensure_schema(self, run):
+        async def test(Fish, Aquarium):
+            class Tank(Fish.__bases__[0]):
+                size = Column(Integer, index=True)
+                aquarium_id = Column(ForeignKey, table=Aquarium, entity_name="aquarium")
+
+            assert await Tank.objects().ensure_schema() == ["tank_size_idx", "tank_aquarium_id_idx"]
+            assert await Fish.objects().ensure_schema() == []
+            await Fish.objects().create_indexes(concurrently=True)
+
+        run(test)
+
+    def test_listeners(self, run):
+        async def test(Fish, Aquarium):
+            events = []
+            Fish.db.add_listener(events.append)
+            await Fish(name="lily", age=2).objects().save()
+            assert await Fish.objects().filter("age", "=", 2).count() == 1
+
+            assert [(event.model, event.operation, event.rows) for event in events] == [("fish", "save", 1),
+                                                                                        ("fish", "count", 1)]
+
+        run(test)
+
+    def test_explain(self, run):
+        async def test(Fish, Aquarium):
+            await Fish.objects().bulk_save([Fish(name=f"fish{i}", age=i) for i in range(10)])
+            plan = await Fish.objects().filter("age", "<", 4).explain_analyze()
+            assert plan.analyzed and plan.rows == 4 and plan.root.relation == "fish"
+
+        run(test)
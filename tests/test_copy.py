@@ -0,0 +1,85 @@
+import datetime
+from collections import namedtuple
+
+import pytest
+from towel import *
+from towel.copy_stream import CopyStream
+
+
+class TestCopyFrom:
+
+    def test_copies_instances_namedtuples_and_tuples(self, base, cursor):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+            age = Column(Integer)
+
+        fish_nt = namedtuple("fish", ("name", "age"))
+        count = Fish.objects().copy_from([Fish(name="lily", age=1), fish_nt("sam", 2), (3, "clark")])
+
+        cursor.execute("select name, age from fish order by age")
+        assert count == 3
+        assert [tuple(row) for row in cursor.fetchall()] == [("lily", 1), ("sam", 2), ("clark", 3)]
+
+    def test_encodes_types(self, base, cursor, fish_and_aquarium):
+        Fish, Aquarium = fish_and_aquarium
+
+        class Tank(base):
+            name = Column(VarChar, length=50)
+            weight = Column(Real)
+            bought = Column(Date)
+
+        Tank.objects().copy_from([Tank(name="tab\there\\\nnew", weight=1.25, bought=datetime.date(2019, 6, 1)),
+                                  Tank(name=None)])
+
+        cursor.execute("select * from tank order by id")
+        first, second = cursor.fetchall()
+        assert first.name == "tab\there\\\nnew"
+        assert first.weight == 1.25
+        assert first.bought == datetime.date(2019, 6, 1)
+        assert second.name is None
+
+        aq = Aquarium(color="green")
+        aq.objects().save()
+        Fish.objects().copy_from([(2, aq.id.value, "lily")])
+
+        cursor.execute("select * from fish")
+        assert cursor.fetchone().aquarium_id == aq.id.value
+
+    def test_reads_incrementally(self, base):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+            age = Column(Integer)
+
+        consumed = []
+
+        def rows():
+            for i in range(1000):
+                consumed.append(i)
+                yield (i, "fish")
+
+        stream = CopyStream(Fish, rows())
+        assert stream.read(16) == "0\tfish\n1\tfish\n2\t"
+        assert len(consumed) == 3
+
+    def test_raises_on_illegal_value(self, base):
+        class Fish(base):
+            age = Column(Integer)
+
+        with pytest.raises(TowelValueError):
+            CopyStream(Fish, [("fjsk",)]).read()
+
+    def test_raises_on_none_row(self, base, fish_fixtures):
+        Fish, elements = fish_fixtures
+        with pytest.raises(TowelAttributeError):
+            CopyStream(Fish, [(3, "sam"), None, (4, "alex")]).read()
+        with pytest.raises(TowelAttributeError):
+            Fish.objects().copy_from([(3, "sam"), None, (4, "alex")])
+
+    def test_raises_on_deferred_columns(self, base, fish_fixtures):
+        Fish, elements = fish_fixtures
+        lily = Fish.objects().filter("name", "=", "lily").only("name").all()[0]
+
+        with pytest.raises(TowelOperationalError):
+            CopyStream(Fish, [lily]).read()
+        with pytest.raises(TowelOperationalError):
+            Fish.objects().copy_from([lily])
@@ -0,0 +1,80 @@
+import pytest
+
+from towel import *
+
+
+@pytest.fixture
+def stocked(base, fish_and_aquarium):
+    Fish, Aquarium = fish_and_aquarium
+    aquariums = [Aquarium(color=f"color{i}", price=i) for i in range(6)]
+    Aquarium.objects().bulk_save(aquariums)
+    Fish.objects().bulk_save([Fish(name=f"fish{i}", age=i % 7, aquarium_id=aquariums[i % 6].id.value)
+                              for i in range(300)])
+    return Fish, Aquarium
+
+
+class TestExplain:
+
+    def test_plan_of_executed_statement(self, base, cursor, stocked):
+        Fish, Aquarium = stocked
+        query = Fish.objects().filter("age", "=", 3).filter("aquarium_id__color", "=", "color1")
+        plan = query.explain()
+
+        assert plan.statement.encode() == query.compile(cursor)[0]
+        assert not plan.analyzed and plan.actual_time is None and plan.buffers is None
+        assert plan.total_cost > 0 and plan.rows >= 1
+        assert {node.relation for node in plan if node.relation} == {"fish", "aquarium"}
+
+    def test_explain_analyze(self, base, stocked):
+        Fish, Aquarium = stocked
+        plan = Fish.objects().filter("age", "<", 3).explain_analyze(buffers=True)
+
+        assert plan.analyzed and plan.actual_time > 0 and plan.planning_time > 0
+        assert plan.rows == len(Fish.objects().filter("age", "<", 3).get_all())
+        assert plan.root.actual_time is not None
+        assert set(plan.buffers) == {"hit", "read"}
+
+    def test_sequential_scans_of_large_tables(self, base, stocked):
+        Fish, Aquarium = stocked
+        scans = Fish.objects().filter("age", "=", 3).explain(analyze=True).sequential_scans(min_rows=100)
+        assert [(node.node_type, node.relation, node.rows_scanned) for node in scans] == [("Seq Scan", "fish", 300)]
+
+        plan = Fish.objects().filter("age", "=", 3).explain()
+        assert plan.table_sizes.keys() == {"fish"}
+        assert plan.sequential_scans() == []
+
+    def test_bound_parameters(self, base, stocked):
+        Fish, Aquarium = stocked
+        plan = Fish.objects().filter("id", "in", Param("ids")).bind(ids=[1, 2, 3]).explain(analyze=True)
+        assert plan.rows == 3
+
+
+class TestNPlusOneDetector:
+
+    def test_warns_on_related_entities_loaded_per_row(self, base, stocked):
+        Fish, Aquarium = stocked
+        detector = base.db.add_listener(NPlusOneDetector(threshold=3))
+
+        with detector.operation() as statements:
+            with pytest.warns(TowelNPlusOneWarning, match="select_related"):
+                colors = {fish.aquarium.color.value for fish in Fish.objects().filter("age", "=", 1).all()}
+        assert len(colors) == 6
+        assert sorted(statements.values()) == [1, 43]
+
+        with detector.operation() as statements:
+            Fish.objects().filter("age", "=", 1).prefetch_related("aquarium_id").all()
+        assert sorted(statements.values()) == [1, 1]
+
+    def test_raises_and_counts_per_operation(self, base, stocked):
+        Fish, Aquarium = stocked
+        detector = base.db.add_listener(NPlusOneDetector(threshold=3, raise_error=True))
+
+        for pk in (1, 2, 3, 4):
+            with detector.operation():
+                Fish.objects().get(pk)
+        Fish.objects().get(1)
+
+        with pytest.raises(TowelOperationalError, match="get_many"):
+            with detector.operation():
+                for pk in (1, 2, 3):
+                    Fish.objects().get(pk)
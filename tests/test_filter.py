@@ -1,3 +1,5 @@
+import threading
+
 from towel import *
 import pytest
 
@@ -39,6 +41,96 @@ class TestFiltered:
         fish_class, elements = fish_fixtures
         result = fish_class.objects().filter("age", ">", 3).get_all(limit=1)
 
-        assert len(result) == 2
+        assert len(result) == 1
         assert result[0].age > 3
-        assert result[1].age > 3
+
+
+class TestQuerySet:
+
+    def test_filter_returns_new_query(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        query = Fish.objects().filter("age", ">", 3)
+        narrowed = query.filter("name", "=", "alexdwop")
+
+        assert narrowed is not query
+        assert len(query.get_all()) == 2
+        assert len(narrowed.get_all()) == 1
+        assert len(Fish.objects().get_all()) == 4
+
+    def test_failed_filter_does_not_leak(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        with pytest.raises(TowelAttributeError):
+            Fish.objects().filter("age", ">", 3).filter("jfsdlow", "<", 10)
+
+        assert len(Fish.objects().get_all()) == 4
+
+    def test_params_are_bound_later(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        older = Fish.objects().filter("age", ">", Param("age"))
+
+        assert len(older.bind(age=3).get_all()) == 2
+        assert len(older.bind(age=200).get_all()) == 1
+        with pytest.raises(TowelAttributeError):
+            older.get_all()
+
+    def test_statement_rendered_once(self, base, cursor, fish_fixtures, monkeypatch):
+        Fish, elements = fish_fixtures
+        older = Fish.objects().filter("age", ">", Param("age"))
+        older.bind(age=3).get_all()
+
+        monkeypatch.setattr(QuerySet, "_select", lambda *args: pytest.fail("statement rendered again"))
+        statement, params = older.bind(age=200).compile(cursor)
+        assert params == [200]
+        assert statement == b'select "fish".* from "fish" where  "fish"."age" > %s'
+
+    def test_shared_between_threads(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        older = Fish.objects().filter("age", ">", Param("age"))
+        statements, results = [], {}
+
+        def work(age):
+            statement, params = older.bind(age=age).compile(cursor)
+            statements.append(statement)
+            results[age] = params
+
+        threads = [threading.Thread(target=work, args=(age,)) for age in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(set(statements)) == 1
+        assert all(params == [age] for age, params in results.items())
+
+
+class TestInFilter:
+
+    def test_filters_by_list(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        result = Fish.objects().filter("name", "in", ["lily", "sam", "nemo"]).get_all()
+
+        assert sorted(row.name for row in result) == ["lily", "sam"]
+
+    def test_statement_does_not_depend_on_length(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        ids = Fish.objects().filter("id", "in", Param("ids"))
+
+        short, short_params = ids.bind(ids=[1]).compile(cursor)
+        long, long_params = ids.bind(ids=list(range(1, 100))).compile(cursor)
+        assert short == long
+        assert short_params == [[1]] and long_params == [list(range(1, 100))]
+
+    def test_empty_list_matches_nothing(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        assert Fish.objects().filter("id", "in", []).get_all() == []
+
+    def test_removes_set_of_ids(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        Fish.objects().filter("id", "in", {elements[0].id.value, elements[1].id.value}).remove()
+
+        assert sorted(row.name for row in Fish.objects().get_all()) == ["alexdwop", "dody clark"]
+
+    def test_raises_on_scalar(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        with pytest.raises(TowelAttributeError):
+            Fish.objects().filter("id", "in", 1)
@@ -137,3 +137,128 @@ class TestCreateTableWithForeignKey:
         Fish.objects().filter("aquarium_id__color", "=", "green").filter("aquarium_id__price", ">", 10).remove()
         new_fish = Fish.objects().get_all()
         assert len(new_fish) == 2
+
+
+class TestLazyForeignEntity:
+
+    def test_construction_runs_no_queries(self, base, fish_and_aquarium):
+        Fish, Aquarium = fish_and_aquarium
+
+        fish = Fish(name="lily", age=2, aquarium_id=22222)
+        assert fish._related is None
+
+    def test_loads_and_caches(self, base, cursor, fish_and_aquarium):
+        Fish, Aquarium = fish_and_aquarium
+
+        aq = Aquarium(color="green")
+        aq.objects().save()
+        fish = Fish(name="lily", age=2, aquarium_id=aq.id.value)
+
+        first = fish.aquarium
+        assert first.color.value == "green"
+        assert fish.aquarium is first
+
+    def test_resets_on_key_change(self, base, cursor, fish_and_aquarium):
+        Fish, Aquarium = fish_and_aquarium
+
+        aq = Aquarium(color="green")
+        aq2 = Aquarium(color="blue")
+        aq.objects().save()
+        aq2.objects().save()
+        fish = Fish(name="lily", age=2, aquarium_id=aq.id.value)
+        assert fish.aquarium.color.value == "green"
+
+        fish.aquarium_id = aq2.id.value
+        assert fish.aquarium.color.value == "blue"
+
+    def test_assigns_entity(self, base, cursor, fish_and_aquarium):
+        Fish, Aquarium = fish_and_aquarium
+
+        aq = Aquarium(color="green")
+        aq.objects().save()
+        fish = Fish(name="lily", age=2)
+        assert fish.aquarium is None
+
+        fish.aquarium = aq
+        assert fish.aquarium_id.value == aq.id.value
+        assert fish.aquarium is aq
+
+        with pytest.raises(TowelValueError):
+            fish.aquarium = fish
+
+
+@pytest.fixture
+def stocked_aquariums(base, fish_and_aquarium):
+    Fish, Aquarium = fish_and_aquarium
+
+    aq = Aquarium(color="green", price=10)
+    aq2 = Aquarium(color="blue", price=12)
+    aq.objects().save()
+    aq2.objects().save()
+
+    Fish(name="lily", age=2, aquarium_id=aq.id.value).objects().save()
+    Fish(name="dodie", age=4, aquarium_id=aq.id.value).objects().save()
+    Fish(name="clark", age=1, aquarium_id=aq2.id.value).objects().save()
+    Fish(name="sam", age=3).objects().save()
+    return Fish, Aquarium
+
+
+def forbid_lookups(monkeypatch, model):
+    def get(pk, *args, **kwargs):
+        raise AssertionError("related entity was fetched per row")
+
+    monkeypatch.setattr(model.objects(), "_get_one", get)
+
+
+class TestRelatedLoading:
+
+    def test_select_related(self, base, monkeypatch, stocked_aquariums):
+        Fish, Aquarium = stocked_aquariums
+        forbid_lookups(monkeypatch, Aquarium)
+
+        fishes = {f.name.value: f for f in Fish.objects().select_related("aquarium_id").all()}
+
+        assert fishes["lily"].aquarium.color.value == "green"
+        assert fishes["clark"].aquarium.color.value == "blue"
+        assert fishes["sam"].aquarium is None
+
+    def test_select_related_with_join_filter(self, base, monkeypatch, stocked_aquariums):
+        Fish, Aquarium = stocked_aquariums
+        forbid_lookups(monkeypatch, Aquarium)
+
+        fishes = Fish.objects().filter("aquarium_id__color", "=", "green").select_related("aquarium_id").all()
+
+        assert sorted(f.name.value for f in fishes) == ["dodie", "lily"]
+        assert all(f.aquarium.color.value == "green" for f in fishes)
+
+    def test_prefetch_related(self, base, monkeypatch, stocked_aquariums):
+        Fish, Aquarium = stocked_aquariums
+        forbid_lookups(monkeypatch, Aquarium)
+
+        fishes = {f.name.value: f for f in Fish.objects().prefetch_related("aquarium_id").all()}
+
+        assert fishes["dodie"].aquarium.price.value == 10
+        assert fishes["lily"].aquarium is fishes["dodie"].aquarium
+        assert fishes["sam"].aquarium is None
+
+    def test_iterate_prefetches_per_chunk(self, base, monkeypatch, stocked_aquariums):
+        Fish, Aquarium = stocked_aquariums
+        forbid_lookups(monkeypatch, Aquarium)
+
+        fishes = list(Fish.objects().prefetch_related("aquarium_id").iterate(chunk_size=2, instances=True))
+
+        assert len(fishes) == 4
+        assert all(f.aquarium is None or isinstance(f.aquarium, Aquarium) for f in fishes)
+
+    def test_raises_on_non_foreign_column(self, base, fish_and_aquarium):
+        Fish, Aquarium = fish_and_aquarium
+
+        with pytest.raises(TowelAttributeError):
+            Fish.objects().select_related("age")
+
+    def test_get_all_refuses_related(self, base, stocked_aquariums):
+        Fish, Aquarium = stocked_aquariums
+
+        with pytest.raises(TowelOperationalError):
+            Fish.objects().select_related("aquarium_id").get_all()
+        assert len(Fish.objects().get_all()) == 4
@@ -1,3 +1,4 @@
+import pytest
 from towel import *
 
 
@@ -35,3 +36,64 @@ class TestCreateTable:
         Fish, fixes = fish_fixtures
         result = Fish.objects().get_all(limit=2)
         assert len(result) == 2
+        assert Fish.objects().get_all(limit=0) == []
+
+
+class TestIterate:
+
+    def test_iterates_rows(self, base, cursor, fish_fixtures):
+        Fish, fixes = fish_fixtures
+        result = list(Fish.objects().iterate(chunk_size=3))
+
+        assert sorted(x.name for x in result) == sorted(f.name.value for f in fixes)
+
+    def test_iterates_instances_with_filter(self, base, cursor, fish_fixtures):
+        Fish, fixes = fish_fixtures
+        result = list(Fish.objects().filter("age", ">", 3).iterate(chunk_size=1, instances=True))
+
+        assert len(result) == 2
+        assert all(isinstance(x, Fish) and x.age.value > 3 for x in result)
+
+    def test_closes_cursor_on_early_stop(self, base, cursor, fish_fixtures):
+        Fish, fixes = fish_fixtures
+        rows = Fish.objects().iterate(chunk_size=1)
+        next(rows)
+
+        cursor.execute("select count(*) from pg_cursors where name like 'towel_%%'")
+        assert cursor.fetchone()[0] == 1
+
+        rows.close()
+        cursor.execute("select count(*) from pg_cursors where name like 'towel_%%'")
+        assert cursor.fetchone()[0] == 0
+
+    def test_raises_on_invalid_chunk_size(self, base, fish_fixtures):
+        Fish, fixes = fish_fixtures
+        with pytest.raises(TowelAttributeError):
+            Fish.objects().iterate(chunk_size=0)
+
+
+class TestGetMany:
+
+    def test_returns_in_requested_order(self, base, cursor, fish_fixtures):
+        Fish, fixes = fish_fixtures
+        ids = [fish.id.value for fish in reversed(fixes)]
+
+        result = Fish.objects().get_many(ids)
+        assert [fish.id.value for fish in result] == ids
+        assert all(isinstance(fish, Fish) for fish in result)
+
+    def test_skips_missing_and_duplicate_ids(self, base, cursor, fish_fixtures):
+        Fish, fixes = fish_fixtures
+        result = Fish.objects().get_many([fixes[1].id.value, 1000, fixes[1].id.value, fixes[0].id.value])
+
+        assert [fish.name.value for fish in result] == ["sam", "lily"]
+        assert Fish.objects().get_many([]) == []
+
+    def test_single_round_trip(self, base, cursor, fish_fixtures, monkeypatch):
+        Fish, fixes = fish_fixtures
+        calls = []
+        select_many = Fish.objects()._select_many
+        monkeypatch.setattr(Fish.objects(), "_select_many", lambda pks: calls.append(pks) or select_many(pks))
+
+        Fish.objects().get_many([fish.id.value for fish in fixes])
+        assert len(calls) == 1
@@ -0,0 +1,85 @@
+import pytest
+from towel import *
+
+
+@pytest.fixture()
+def cached_fish(postgresql):
+    data = Database(postgresql, identity_map_size=2)
+
+    class Fish(AbstractBaseModel):
+        db = data
+        name = Column(VarChar, length=50)
+        age = Column(Integer)
+
+    Fish.objects().create_table()
+    fishes = [Fish(name=name, age=age) for name, age in (("lily", 1), ("sam", 2), ("clark", 3))]
+    for fish in fishes:
+        fish.objects().save()
+
+    yield Fish, fishes
+    data.kill()
+
+
+class TestIdentityMap:
+
+    def test_disabled_by_default(self, base):
+        assert base.db.identity_map is None
+
+    def test_returns_cached_instance(self, cached_fish):
+        Fish, fishes = cached_fish
+        identity_map = Fish.db.identity_map
+
+        first = Fish.objects().get(fishes[0].id.value)
+        assert Fish.objects().get(fishes[0].id.value) is first
+        assert (identity_map.hits, identity_map.misses) == (1, 1)
+
+    def test_evicts_least_recently_used(self, cached_fish):
+        Fish, fishes = cached_fish
+        identity_map = Fish.db.identity_map
+
+        first = Fish.objects().get(fishes[0].id.value)
+        Fish.objects().get(fishes[1].id.value)
+        Fish.objects().get(fishes[2].id.value)
+
+        assert len(identity_map) == 2
+        assert identity_map.evictions == 1
+        assert Fish.objects().get(fishes[0].id.value) is not first
+
+    def test_invalidates_on_instance_update(self, cached_fish):
+        Fish, fishes = cached_fish
+
+        cached = Fish.objects().get(fishes[0].id.value)
+        fishes[0].objects().update(name="new name")
+
+        fetched = Fish.objects().get(fishes[0].id.value)
+        assert fetched is not cached
+        assert fetched.name.value == "new name"
+        assert Fish.objects().get(fishes[1].id.value).name.value == "sam"
+
+    def test_invalidates_on_class_update_and_remove(self, cached_fish):
+        Fish, fishes = cached_fish
+
+        Fish.objects().get(fishes[0].id.value)
+        Fish.objects().filter("age", "<", 10).update(name="new name")
+        assert Fish.objects().get(fishes[0].id.value).name.value == "new name"
+
+        Fish.objects().remove()
+        assert Fish.objects().get(fishes[0].id.value) is None
+
+    def test_serves_foreign_keys(self, postgresql):
+        data = Database(postgresql, identity_map_size=10)
+
+        class Aquarium(AbstractBaseModel):
+            db = data
+            color = Column(VarChar, length=50)
+
+        class Fish(AbstractBaseModel):
+            db = data
+            aquarium_id = Column(ForeignKey, table=Aquarium, entity_name="aquarium")
+
+        aq = Aquarium(color="green")
+        aq.objects().save()
+        first, second = Fish(aquarium_id=aq.id.value), Fish(aquarium_id=aq.id.value)
+
+        assert first.aquarium is second.aquarium
+        assert data.identity_map.stats["hits"] == 1
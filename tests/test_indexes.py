@@ -0,0 +1,111 @@
+import pytest
+
+from towel import *
+
+
+def indexes(cursor, tablename):
+    cursor.execute("select indexname, indexdef from pg_indexes where tablename = %s", (tablename,))
+    return {row.indexname: row.indexdef for row in cursor.fetchall()}
+
+
+class TestIndexDeclarations:
+
+    def test_column_and_model_indexes(self, base):
+        class Fish(base):
+            name = Column(VarChar, length=50, unique=True)
+            age = Column(Integer, index=True)
+            weight = Column(Integer)
+            __indexes__ = (Index("age", "-weight"), Index("weight", where="age > 1", name="heavy_adults"))
+
+        assert [(index.name, index.columns, index.unique) for index in Fish.__indexes__] == [
+            ("fish_age_idx", ("age",), False), ("fish_name_key", ("name",), True),
+            ("fish_age_weight_idx", ("age", "-weight"), False), ("heavy_adults", ("weight",), False)]
+
+    def test_foreign_keys_are_indexed(self, base, fish_and_aquarium):
+        Fish, Aquarium = fish_and_aquarium
+        assert [index.name for index in Fish.__indexes__] == ["fish_aquarium_id_idx"]
+        assert Aquarium.__indexes__ == ()
+
+        class Tank(base):
+            aquarium_id = Column(ForeignKey, table=Aquarium, entity_name="aquarium")
+            size = Column(Integer)
+            __indexes__ = (Index("aquarium_id", "size"),)
+
+        assert [index.name for index in Tank.__indexes__] == ["tank_aquarium_id_size_idx"]
+
+    def test_raises_on_invalid_declarations(self, base):
+        with pytest.raises(TowelAttributeError):
+            class Fish(base):
+                age = Column(Integer)
+                __indexes__ = (Index("weight"),)
+        with pytest.raises(TowelAttributeError):
+            class Fish(base):
+                age = Column(Integer, index=True)
+                __indexes__ = (Index("age"),)
+        with pytest.raises(TowelAttributeError):
+            class Fish(base):
+                age = Column(Integer)
+                __indexes__ = ("age",)
+        with pytest.raises(TowelAttributeError):
+            Index()
+
+
+class TestCreateIndexes:
+
+    def test_create_table_creates_indexes(self, base, cursor):
+        class Fish(base):
+            name = Column(VarChar, length=50, unique=True)
+            age = Column(Integer)
+            __indexes__ = (Index("-age", where="age > 1"),)
+
+        Fish.objects().create_table()
+        created = indexes(cursor, "fish")
+
+        assert created["fish_name_key"].startswith("CREATE UNIQUE INDEX")
+        assert created["fish_age_idx"].endswith("(age DESC) WHERE (age > 1)")
+        with pytest.raises(TowelOperationalError):
+            Fish.objects().bulk_save([Fish(name="lily", age=2), Fish(name="lily", age=3)])
+
+    def test_unique_column_is_conflict_target(self, base, cursor):
+        class Fish(base):
+            name = Column(VarChar, length=50, unique=True)
+            age = Column(Integer)
+
+        Fish(name="lily", age=2).objects().save()
+        Fish(name="lily", age=5).objects().save(on_conflict="update", conflict_target=("name",))
+        assert [(row.name, row.age) for row in Fish.objects().get_all()] == [("lily", 5)]
+
+    def test_ensure_schema_creates_missing_indexes(self, base, cursor):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+            age = Column(Integer)
+
+        assert Fish.objects().ensure_schema() == []
+        Fish(name="lily", age=2).objects().save()
+
+        class Fish(base):
+            name = Column(VarChar, length=50, index=True)
+            age = Column(Integer)
+            __indexes__ = (Index("age", "name"),)
+
+        assert Fish.objects().ensure_schema() == ["fish_name_idx", "fish_age_name_idx"]
+        assert Fish.objects().ensure_schema() == []
+        assert set(indexes(cursor, "fish")) == {"fish_pkey", "fish_name_idx", "fish_age_name_idx"}
+
+    def test_create_indexes_concurrently(self, base, cursor):
+        class Fish(base):
+            age = Column(Integer)
+
+        Fish.objects().bulk_save([Fish(age=i) for i in range(10)])
+
+        class Fish(base):
+            age = Column(Integer, index=True)
+
+        Fish.objects().create_indexes(concurrently=True)
+        Fish.objects().create_indexes(concurrently=True)
+        assert "fish_age_idx" in indexes(cursor, "fish")
+        assert base.db.connection.autocommit is False
+
+        with pytest.raises(TowelOperationalError):
+            with base.db.transaction():
+                Fish.objects().create_indexes(concurrently=True)
@@ -0,0 +1,126 @@
+import logging
+
+import pytest
+
+from towel import *
+from towel.prepared import PreparedStatements
+
+
+@pytest.fixture
+def events(base):
+    recorded = []
+    listener = base.db.add_listener(recorded.append)
+    yield recorded
+    base.db.remove_listener(listener)
+
+
+class TestListeners:
+
+    def test_reports_statements(self, base, fish_fixtures, events):
+        Fish, elements = fish_fixtures
+        events.clear()
+        Fish.objects().filter("age", ">", 3).get_all()
+
+        event, = events
+        assert event.statement == 'select "fish".* from "fish" where  "fish"."age" > %s'
+        assert (event.params, event.model, event.operation, event.rows, event.probe) == (1, "fish", "get_all", 2,
+                                                                                          False)
+        assert event.duration > 0 and event.error is None
+
+    def test_every_operation_is_reported(self, base, fish_and_aquarium, events):
+        Fish, Aquarium = fish_and_aquarium
+        green = Aquarium(color="green", price=10)
+        green.objects().save()
+        Fish.objects().bulk_save([Fish(name="lily", age=2, aquarium_id=green.id.value)])
+        lily, = Fish.objects().only("name").all()
+        lily.age.value, lily.aquarium.color.value
+        Fish.objects().count()
+        list(Fish.objects().iterate())
+
+        assert [(event.model, event.operation, event.probe) for event in events] == [
+            ("aquarium", "table_exists", True), ("aquarium", "create_table", False),
+            ("aquarium", "save", False),
+            ("fish", "table_exists", True), ("fish", "create_table", False), ("fish", "create_table", False),
+            ("fish", "bulk_save", False), ("fish", "all", False), ("fish", "load_deferred", True),
+            ("aquarium", "related", True), ("fish", "count", False), ("fish", "iterate", False)]
+
+    def test_reports_executemany_and_failures(self, base, fish_fixtures, events):
+        Fish, elements = fish_fixtures
+        Fish.objects().save_from_namedtuple([Fish(name="sam", age=3).as_namedtuple()] * 3)
+        assert (events[-1].operation, events[-1].params) == ("save_from_namedtuple", 6)
+
+        with pytest.raises(TowelOperationalError):
+            Fish(name="sam", age=3, id=1).objects().save()
+        assert events[-1].rows is None and events[-1].error is not None
+
+    def test_reports_copy(self, base, fish_fixtures, events):
+        Fish, elements = fish_fixtures
+        assert Fish.objects().copy_from([(3, "sam"), (4, "alex")]) == 2
+
+        event = events[-1]
+        assert (event.model, event.operation, event.rows) == ("fish", "copy_from", 2)
+        assert event.statement.startswith('copy "fish"')
+
+    def test_prepared_statements_are_reported_once(self, base, fish_fixtures, events):
+        Fish, elements = fish_fixtures
+        base.db.prepared = PreparedStatements()
+        Fish.objects().get(1)
+        Fish.objects().get(1)
+
+        assert [(event.operation, event.rows) for event in events[-2:]] == [("get", 1), ("get", 1)]
+        assert events[-1].statement == 'select * from "fish" where id = %s'
+
+
+    def test_remove_listener(self, base, fish_fixtures):
+        Fish, elements = fish_fixtures
+        recorded = []
+        base.db.add_listener(recorded.append)
+        base.db.remove_listener(recorded.append)
+
+        assert not base.db.instrumentation
+        Fish.objects().get(1)
+        assert recorded == []
+
+
+class TestSlowQueryLog:
+
+    def test_logs_slow_statements(self, base, fish_fixtures, caplog):
+        Fish, elements = fish_fixtures
+        base.db.add_listener(SlowQueryLog(threshold=0.05))
+        with caplog.at_level(logging.WARNING, logger="towel.queries"):
+            Fish.objects().get(1)
+            Fish.objects().filter("age", ">", 0).filter("id", "<", 0).count()
+            with base.db.cursor() as cursor:
+                base.db.execute(cursor, "select pg_sleep(0.1)", operation="sleep")
+
+        record, = caplog.records
+        assert "None.sleep" in record.getMessage() and "pg_sleep" in record.getMessage()
+
+
+class TestQueryMetrics:
+
+    def test_counts_calls_per_model(self, base, fish_and_aquarium):
+        Fish, Aquarium = fish_and_aquarium
+        Aquarium.objects().create_table()
+        Fish.objects().create_table()
+        metrics = base.db.add_listener(QueryMetrics())
+        for _ in range(5):
+            Fish.objects().get_all()
+        Aquarium.objects().get(1)
+
+        assert metrics.calls == {"fish": 5, "aquarium": 1}
+        assert 0 < metrics.quantile("fish", 0.5) <= metrics.quantile("fish", 0.99) <= metrics.seconds["fish"]
+
+    def test_renders_prometheus_summary(self, base, fish_fixtures):
+        Fish, elements = fish_fixtures
+        metrics = base.db.add_listener(QueryMetrics())
+        Fish.objects().get(1)
+        Fish.objects().get(2)
+
+        lines = metrics.render().splitlines()
+        assert lines[:2] == ["# HELP towel_query_seconds Latency of statements run by the ORM, per model",
+                             "# TYPE towel_query_seconds summary"]
+        assert lines[2].startswith('towel_query_seconds{model="fish",quantile="0.5"} ')
+        assert lines[3].startswith('towel_query_seconds{model="fish",quantile="0.99"} ')
+        assert lines[4].startswith('towel_query_seconds_sum{model="fish"} ')
+        assert lines[5] == 'towel_query_seconds_count{model="fish"} 2'
@@ -0,0 +1,113 @@
+import pytest
+
+from towel import *
+from towel.sql_composer import SQL
+
+
+@pytest.fixture
+def school(base):
+    class Fish(base):
+        name = Column(VarChar, length=50)
+        age = Column(Integer)
+
+    Fish.objects().create_table()
+    Fish.objects().bulk_save([Fish(name=f"fish{i}", age=i % 4) for i in range(20)])
+    return Fish
+
+
+class TestOrderBy:
+
+    def test_orders_rows(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        assert [row.age for row in Fish.objects().order_by("age").get_all()] == [2, 3, 123, 432]
+        assert [row.name for row in Fish.objects().order_by("-age").get_all()] == \
+               ["dody clark", "alexdwop", "sam", "lily"]
+
+    def test_orders_by_many_columns(self, base, cursor, school):
+        rows = school.objects().filter("age", "<", 2).order_by("-age", "name").values_list("age", "name")
+        assert rows[:3] == [(1, "fish1"), (1, "fish13"), (1, "fish17")]
+        assert rows[-1] == (0, "fish8")
+
+    def test_orders_across_join(self, base, cursor, fish_and_aquarium):
+        Fish, Aquarium = fish_and_aquarium
+        green, blue = Aquarium(color="green", price=10), Aquarium(color="blue", price=50)
+        Aquarium.objects().bulk_save([green, blue])
+        Fish.objects().bulk_save([Fish(name="lily", age=2, aquarium_id=green.id.value),
+                                  Fish(name="dody", age=10, aquarium_id=blue.id.value)])
+
+        assert [row.name for row in Fish.objects().order_by("aquarium_id__color").get_all()] == ["dody", "lily"]
+        assert [fish.aquarium.color.value for fish in
+                Fish.objects().select_related("aquarium_id").order_by("-aquarium_id__price").all()] == ["blue", "green"]
+
+    def test_ordering_across_join_keeps_null_foreign_key(self, base, cursor, fish_and_aquarium):
+        Fish, Aquarium = fish_and_aquarium
+        green = Aquarium(color="green", price=10)
+        green.objects().save()
+        Fish.objects().bulk_save([Fish(name="lily", age=2, aquarium_id=green.id.value), Fish(name="nemo", age=1)])
+
+        query = Fish.objects().order_by("aquarium_id__price")
+        assert [row.name for row in query.get_all()] == ["lily", "nemo"]
+        assert query.count() == query.limit(5).count() == 2
+        assert [row.name for row in query.filter("aquarium_id__color", "=", "green").get_all()] == ["lily"]
+
+    def test_limit_and_offset_with_filter(self, base, cursor, school):
+        query = school.objects().filter("age", "=", 1).order_by("id").limit(2).offset(1)
+        statement, params = query.compile(cursor)
+
+        assert statement.endswith(b' order by "fish"."id" limit %s offset %s')
+        assert params == [1, 2, 1]
+        assert [row.name for row in query.get_all()] == ["fish5", "fish9"]
+        assert [fish.name.value for fish in query.all()] == ["fish5", "fish9"]
+
+    def test_limit_with_param(self, base, cursor, school):
+        query = school.objects().order_by("id").limit(Param("rows"))
+        assert len(query.bind(rows=3).get_all()) == 3
+        assert len(query.bind(rows=5).get_all()) == 5
+
+    def test_raises_on_invalid_arguments(self, base, cursor, school):
+        with pytest.raises(TowelAttributeError):
+            school.objects().order_by("weight")
+        with pytest.raises(TowelAttributeError):
+            school.objects().limit(-1)
+        with pytest.raises(TowelAttributeError):
+            school.objects().offset("1")
+
+
+class TestPaginate:
+
+    def test_compiles_to_keyset(self, base, cursor, school):
+        first = school.objects().order_by("age").paginate(size=5)
+        assert first.compile(cursor)[0].endswith(b' order by "fish"."age", "fish"."id" limit %s')
+
+        last = first.get_all()[-1]
+        statement, params = school.objects().order_by("age").paginate(after=last, size=5).compile(cursor)
+        assert b' where  ("fish"."age", "fish"."id") > (%s, %s) order by' in statement
+        assert params == [last.age, last.id, 5]
+
+    def test_walks_all_pages(self, base, cursor, school):
+        query = school.objects().filter("age", ">", 0).order_by("-age")
+        seen, page = [], query.paginate(size=4).get_all()
+        while page:
+            seen.extend(page)
+            page = query.paginate(after=page[-1], size=4).get_all()
+
+        assert [row.id for row in seen] == [row.id for row in query.order_by("-age", "-id").get_all()]
+        assert len(seen) == 15
+
+    def test_paginates_after_instance(self, base, cursor, school):
+        fish = school.objects().get(3)
+        assert [fish.id.value for fish in school.objects().paginate(after=fish, size=3).all()] == [4, 5, 6]
+
+    def test_pages_share_statement(self, base, cursor, school, monkeypatch):
+        query = school.objects().order_by("name")
+        first = query.paginate(size=3).get_all()
+        query.paginate(after=first[-1], size=3).get_all()
+
+        monkeypatch.setattr(SQL, "keyset", classmethod(lambda cls, *args: pytest.fail("statement rendered again")))
+        assert len(query.paginate(after=first[0], size=3).get_all()) == 3
+
+    def test_raises_on_invalid_ordering(self, base, cursor, school):
+        with pytest.raises(TowelAttributeError):
+            school.objects().order_by("age", "-name").paginate()
+        with pytest.raises(TowelAttributeError):
+            school.objects().order_by("age").paginate(after=(1, 2))
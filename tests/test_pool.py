@@ -0,0 +1,140 @@
+import threading
+
+import psycopg2
+import pytest
+
+from towel import *
+
+
+@pytest.fixture
+def pool(postgresql):
+    pool = ConnectionPool(postgresql.dsn, minconn=1, maxconn=4, timeout=5)
+    yield pool
+    pool.closeall()
+
+
+@pytest.fixture
+def pooled_fish(pool):
+    data = Database(pool=pool)
+
+    class Base(AbstractBaseModel):
+        db = data
+
+    class Fish(Base):
+        name = Column(VarChar, length=50)
+        age = Column(Integer)
+
+    Fish.objects().create_table()
+    return Fish
+
+
+class TestConnectionPool:
+
+    def test_reuses_returned_connections(self, pool):
+        conn = pool.getconn()
+        pool.putconn(conn)
+        assert pool.getconn() is conn
+        assert pool.stats["size"] == 1
+
+    def test_exhausted_pool_times_out(self, pool):
+        conns = [pool.getconn() for _ in range(pool.maxconn)]
+        with pytest.raises(TowelOperationalError):
+            pool.getconn(timeout=0.1)
+
+        pool.putconn(conns.pop())
+        assert pool.getconn(timeout=0.1)
+
+    def test_waiting_checkout_gets_released_connection(self, pool):
+        conns = [pool.getconn() for _ in range(pool.maxconn)]
+        timer = threading.Timer(0.1, pool.putconn, (conns[0],))
+        timer.start()
+        assert pool.getconn(timeout=5) is conns[0]
+        timer.join()
+
+    def test_expired_connections_are_replaced(self, postgresql):
+        pool = ConnectionPool(postgresql.dsn, minconn=1, maxconn=1, max_lifetime=0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        assert conn.closed
+        assert pool.getconn() is not conn
+        pool.closeall()
+
+    def test_broken_connections_are_replaced(self, postgresql):
+        pool = ConnectionPool(postgresql.dsn, minconn=1, maxconn=1, health_check_interval=0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.close()
+
+        assert pool.getconn() is not conn
+        pool.closeall()
+
+    def test_returned_connections_are_rolled_back(self, pool):
+        conn = pool.getconn()
+        conn.cursor().execute("select 1")
+        pool.putconn(conn)
+        assert conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def test_invalid_size(self, postgresql):
+        with pytest.raises(TowelAttributeError):
+            ConnectionPool(postgresql.dsn, minconn=2, maxconn=1)
+
+
+class TestPooledDatabase:
+
+    def test_requires_connection_or_pool(self, pool, postgresql):
+        with pytest.raises(TowelAttributeError):
+            Database()
+        with pytest.raises(TowelAttributeError):
+            Database(postgresql, pool=pool)
+
+    def test_operations_commit_on_their_own(self, pooled_fish, cursor):
+        pooled_fish(name="lily", age=2).objects().save()
+        cursor.execute("select name from fish")
+        assert [row.name for row in cursor.fetchall()] == ["lily"]
+
+    def test_concurrent_saves_and_gets(self, pooled_fish):
+        errors = []
+
+        def work(n):
+            try:
+                for i in range(20):
+                    fish = pooled_fish(name=f"fish{n}_{i}", age=i)
+                    fish.objects().save()
+                    assert pooled_fish.objects().get(fish.id.value).name.value == fish.name.value
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not errors
+        assert len(pooled_fish.objects().get_all()) == 160
+        assert pooled_fish.db.pool.stats["size"] <= pooled_fish.db.pool.maxconn
+
+    def test_transaction_commits(self, pooled_fish):
+        with pooled_fish.db.transaction():
+            pooled_fish(name="lily", age=2).objects().save()
+            pooled_fish(name="sam", age=3).objects().save()
+        assert len(pooled_fish.objects().get_all()) == 2
+
+    def test_transaction_rolls_back(self, pooled_fish):
+        with pytest.raises(ValueError):
+            with pooled_fish.db.transaction():
+                pooled_fish(name="lily", age=2).objects().save()
+                raise ValueError
+        assert pooled_fish.objects().get_all() == []
+
+    def test_connection_outside_transaction(self, pooled_fish):
+        with pytest.raises(TowelOperationalError):
+            pooled_fish.db.connection
+        with pooled_fish.db.transaction() as conn:
+            assert pooled_fish.db.connection is conn
+
+    def test_iterate_holds_one_connection(self, pooled_fish):
+        pooled_fish.objects().bulk_save([pooled_fish(name=f"fish{i}", age=i) for i in range(50)])
+        assert len(list(pooled_fish.objects().iterate(chunk_size=7))) == 50
+        assert pooled_fish.db.pool.stats["idle"] == pooled_fish.db.pool.stats["size"]
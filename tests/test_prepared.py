@@ -0,0 +1,75 @@
+import pytest
+from towel import *
+from towel.prepared import PreparedStatements
+
+
+@pytest.fixture()
+def prepared_fish(postgresql):
+    data = Database(postgresql, prepare=True)
+
+    class Fish(AbstractBaseModel):
+        db = data
+        name = Column(VarChar, length=50)
+        age = Column(Integer)
+
+    Fish.objects().create_table()
+    yield Fish
+    data.kill()
+
+
+def prepared_count(cursor):
+    cursor.execute("select count(*) from pg_prepared_statements where name like 'towel_%%'")
+    return cursor.fetchone()[0]
+
+
+class TestPreparedStatements:
+
+    def test_converts_placeholders(self):
+        assert PreparedStatements.to_positional("select * from t where a = %s and b like 'x%%' and c = %s") == \
+            "select * from t where a = $1 and b like 'x%' and c = $2"
+
+    def test_runs_hot_operations(self, prepared_fish, cursor):
+        Fish = prepared_fish
+        fish = Fish(name="lily", age=2)
+        fish.objects().save()
+
+        fetched = Fish.objects().get(fish.id.value)
+        assert (fetched.name.value, fetched.age.value) == ("lily", 2)
+
+        fish.objects().update(name="sam")
+        assert Fish.objects().get(fish.id.value).name.value == "sam"
+
+        fish.objects().remove()
+        assert Fish.objects().get(fish.id.value) is None
+        assert prepared_count(cursor) == 4
+
+    def test_prepares_each_shape_once(self, prepared_fish, cursor):
+        Fish = prepared_fish
+        for i in range(3):
+            Fish(name="lily", age=i).objects().save()
+            Fish.objects().get(i)
+
+        assert prepared_count(cursor) == 2
+
+    def test_prepares_again_after_schema_change(self, prepared_fish, cursor):
+        Fish = prepared_fish
+        Fish.objects().get(1)
+        cursor.execute("deallocate all")
+
+        Fish.db.invalidate_schema()
+        assert Fish.objects().get(1) is None
+        assert prepared_count(cursor) == 1
+
+    def test_deallocates_previous_generation(self, prepared_fish, cursor):
+        Fish = prepared_fish
+        Fish(name="lily", age=2).objects().save()
+        Fish.objects().get(1)
+        assert prepared_count(cursor) == 2
+
+        Fish.db.invalidate_schema()
+        Fish.db.invalidate_schema()
+        assert Fish.objects().get(1).name.value == "lily"
+        assert prepared_count(cursor) == 1
+
+    def test_disabled_by_default(self, base):
+        assert base.db.prepared is None
@@ -0,0 +1,95 @@
+import pytest
+
+from towel import *
+from towel.columns import DEFERRED
+
+
+class TestOnlyDefer:
+
+    def test_only_selects_given_columns(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        statement, params = Fish.objects().only("name").compile(cursor)
+
+        assert statement == b'select "fish"."id", "fish"."name" from "fish"'
+        assert [row._fields for row in Fish.objects().only("name").get_all()][0] == ("id", "name")
+
+    def test_defer_leaves_columns_out(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        statement, params = Fish.objects().filter("age", ">", 3).defer("name").compile(cursor)
+
+        assert statement == b'select "fish"."age", "fish"."id" from "fish" where  "fish"."age" > %s'
+        assert params == [3]
+
+    def test_deferred_columns_load_on_access(self, base, cursor, fish_fixtures, monkeypatch):
+        Fish, elements = fish_fixtures
+        lily = Fish.objects().filter("name", "=", "lily").only("name").all()[0]
+        assert lily._values[Fish.__columns__.index["age"]] is DEFERRED
+
+        calls = []
+        fetch = Fish.objects()._fetch_deferred
+        monkeypatch.setattr(Fish.objects(), "_fetch_deferred", lambda inst: calls.append(inst) or fetch(inst))
+
+        assert lily.name.value == "lily"
+        assert calls == []
+        assert lily.age.value == 2
+        assert lily.age.value == 2
+        assert len(calls) == 1
+
+    def test_deferred_instance_has_to_be_loaded_before_write(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        lily = Fish.objects().filter("name", "=", "lily").defer("age").all()[0]
+
+        with pytest.raises(TowelOperationalError):
+            lily.objects().save(on_conflict="update")
+        lily.name.value = "lilly"
+        Fish.objects().bulk_update([lily], fields=["name"])
+
+        lily.objects().load_deferred()
+        lily.objects().save(on_conflict="update")
+        cursor.execute("select name, age from fish where id = %s", [lily.id.value])
+        assert tuple(cursor.fetchone()) == ("lilly", 2)
+
+    def test_foreign_keys_of_related_entities_are_selected(self, base, cursor, fish_and_aquarium):
+        Fish, Aquarium = fish_and_aquarium
+        green = Aquarium(color="green", price=10)
+        green.objects().save()
+        Fish(name="lily", age=2, aquarium_id=green.id.value).objects().save()
+
+        lily, = Fish.objects().only("name").prefetch_related("aquarium_id").all()
+        assert lily.aquarium.color.value == "green"
+        lily, = Fish.objects().defer("aquarium_id", "age").select_related("aquarium_id").all()
+        assert lily.aquarium.color.value == "green"
+        assert lily._values[Fish.__columns__.index["age"]] is DEFERRED
+
+    def test_raises_on_invalid_columns(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        with pytest.raises(TowelAttributeError):
+            Fish.objects().only("color")
+        with pytest.raises(TowelAttributeError):
+            Fish.objects().defer("id")
+
+
+class TestValuesList:
+
+    def test_returns_plain_tuples(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        rows = Fish.objects().filter("age", "<", 10).values_list("name", "age")
+
+        assert sorted(rows) == [("lily", 2), ("sam", 3)]
+        assert all(type(row) is tuple for row in rows)
+
+    def test_flat(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        assert sorted(Fish.objects().values_list("age", flat=True)) == [2, 3, 123, 432]
+
+        with pytest.raises(TowelAttributeError):
+            Fish.objects().values_list("name", "age", flat=True)
+
+    def test_defaults_to_selected_columns(self, base, cursor, fish_fixtures):
+        Fish, elements = fish_fixtures
+        assert sorted(Fish.objects().only("name").values_list())[0] == (1, "lily")
+
+    def test_does_not_build_instances(self, base, cursor, fish_fixtures, monkeypatch):
+        Fish, elements = fish_fixtures
+        monkeypatch.setattr(Fish, "from_values", classmethod(lambda cls, values: pytest.fail("instance built")))
+        assert len(Fish.objects().values_list("name")) == 4
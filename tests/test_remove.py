@@ -25,3 +25,15 @@ class TestUpdate:
         Fish.objects().filter("id", "<", 10).remove()
 
         assert all(x.id > 10 for x in Fish.objects().get_all())
+
+    def test_raises_on_window(self, base, cursor, fish_fixtures):
+        Fish, fix = fish_fixtures
+        with pytest.raises(TowelOperationalError):
+            Fish.objects().filter("age", ">", 2).limit(1).remove()
+        with pytest.raises(TowelOperationalError):
+            Fish.objects().offset(1).remove()
+        with pytest.raises(TowelOperationalError):
+            Fish.objects().paginate(after=fix[0], size=1).remove()
+
+        cursor.execute("select count(*) from fish")
+        assert cursor.fetchone()[0] == 4
@@ -89,3 +89,174 @@ class TestCreateTable:
 
         with pytest.raises(TowelAttributeError):
             Fish.objects().save_from_namedtuple(origin)
+
+
+class TestBulkSave:
+
+    def test_saves_and_assigns_ids(self, base, cursor):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+            age = Column(Integer)
+
+        fishes = [Fish(name=f"fish{i}", age=i) for i in range(5)]
+        Fish.objects().bulk_save(fishes, batch_size=2)
+
+        cursor.execute("select * from fish order by id")
+        rows = cursor.fetchall()
+        assert [row.name for row in rows] == [f.name.value for f in fishes]
+        assert [row.id for row in rows] == [f.id.value for f in fishes]
+
+    def test_builds_multi_row_statement(self, base):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+            age = Column(Integer)
+
+        statement, values = SQL.save_model(Fish(name="lily", age=1), Fish(name="sam", age=2))
+
+        assert statement.as_string(base.db.connection) == \
+            'insert into "fish" (age, name) values(%s, %s), (%s, %s) returning id'
+        assert values == [1, "lily", 2, "sam"]
+
+    def test_raises_on_foreign_instance(self, base, fish_and_aquarium):
+        Fish, Aquarium = fish_and_aquarium
+
+        with pytest.raises(TowelValueError):
+            Fish.objects().bulk_save([Aquarium(color="green")])
+
+    def test_raises_on_saved_instance(self, base):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+
+        with pytest.raises(TowelOperationalError):
+            Fish.objects().bulk_save([Fish(name="lily", id=3)])
+
+
+class TestUpsert:
+
+    @pytest.fixture
+    def Fish(self, base, cursor):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+            age = Column(Integer)
+
+        Fish.objects().create_table()
+        cursor.execute("create unique index on fish (name)")
+        Fish(name="alex", age=22).objects().save()
+        return Fish
+
+    def test_saves_under_given_id(self, Fish, cursor):
+        Fish(name="lily", age=2, id=10).objects().save()
+
+        cursor.execute("select name from fish where id = 10")
+        assert cursor.fetchone().name == "lily"
+
+    def test_generated_ids_follow_given_ones(self, base, Fish, cursor):
+        events = []
+        base.db.add_listener(events.append)
+        Fish(name="lily", age=2, id=10).objects().save()
+        assert [event.operation for event in events] == ["save"]
+        Fish.objects().bulk_upsert([Fish(name="sam", age=3, id=20), Fish(name="dody", age=4, id=15)])
+
+        fish = Fish(name="mia", age=6)
+        fish.objects().save()
+        assert fish.id.value == 21
+        assert Fish.objects().bulk_save([Fish(name="bob", age=7)])[0].id.value == 22
+
+    def test_given_id_below_sequence_keeps_it(self, Fish, cursor):
+        Fish(name="lily", age=2).objects().save()
+        Fish(name="sam", age=3, id=1).objects().save(on_conflict="ignore")
+
+        fish = Fish(name="mia", age=6)
+        fish.objects().save()
+        assert fish.id.value == 3
+
+    def test_raise_in_single_statement(self, Fish, monkeypatch):
+        monkeypatch.setattr(Fish.objects(), "get", lambda pk: pytest.fail("duplicate probe"))
+        with pytest.raises(TowelOperationalError):
+            Fish(name="samanta", age=2, id=1).objects().save()
+
+    def test_conflict_keeps_pending_work_with_savepoints(self, base, Fish, cursor):
+        base.db.savepoints = True
+        Fish(name="lily", age=2).objects().save()
+        with pytest.raises(TowelOperationalError):
+            Fish(name="samanta", age=2, id=1).objects().save()
+        with pytest.raises(TowelOperationalError):
+            Fish.objects().bulk_upsert([Fish(name="sam", age=3), Fish(name="sam", age=4)], on_conflict="raise")
+
+        Fish(name="sam", age=3).objects().save()
+        base.db.commit()
+        cursor.execute("select name from fish order by id")
+        assert [row.name for row in cursor.fetchall()] == ["alex", "lily", "sam"]
+
+    def test_conflict_without_savepoints_needs_rollback(self, base, Fish, cursor):
+        events = []
+        base.db.add_listener(events.append)
+        with pytest.raises(TowelOperationalError):
+            Fish(name="samanta", age=2, id=1).objects().save()
+        assert [event.operation for event in events] == ["save"]
+
+        base.db.rollback()
+        Fish(name="sam", age=3).objects().save()
+        cursor.execute("select name from fish")
+        assert [row.name for row in cursor.fetchall()] == ["sam"]
+
+    def test_rollback_discards_pending_work(self, base, Fish, cursor):
+        base.db.commit()
+        Fish(name="lily", age=2).objects().save()
+        base.db.rollback()
+
+        cursor.execute("select name from fish")
+        assert [row.name for row in cursor.fetchall()] == ["alex"]
+
+    def test_ignore_keeps_existing_row(self, Fish, cursor):
+        Fish(name="samanta", age=2, id=1).objects().save(on_conflict="ignore")
+
+        cursor.execute("select name, age from fish")
+        assert [tuple(row) for row in cursor.fetchall()] == [("alex", 22)]
+
+    def test_update_overwrites_existing_row(self, Fish, cursor):
+        Fish(name="samanta", age=2, id=1).objects().save(on_conflict="update")
+
+        cursor.execute("select id, name, age from fish")
+        assert [tuple(row) for row in cursor.fetchall()] == [(1, "samanta", 2)]
+
+    def test_conflict_on_unique_column(self, Fish, cursor):
+        fish = Fish(name="alex", age=30)
+        fish.objects().save(on_conflict="update", conflict_target="name")
+
+        assert fish.id.value == 1
+        cursor.execute("select id, age from fish")
+        assert [tuple(row) for row in cursor.fetchall()] == [(1, 30)]
+
+    def test_bulk_upsert(self, Fish, cursor):
+        fishes = [Fish(name="alex", age=40), Fish(name="lily", age=2), Fish(name="sam", age=3)]
+        Fish.objects().bulk_upsert(fishes, conflict_target=("name",), batch_size=2)
+
+        assert fishes[0].id.value == 1
+        assert all(fish.id.value for fish in fishes)
+        cursor.execute("select name, age from fish order by id")
+        assert [tuple(row) for row in cursor.fetchall()] == [("alex", 40), ("lily", 2), ("sam", 3)]
+
+    def test_bulk_upsert_ignore(self, Fish, cursor):
+        fishes = [Fish(name="alex", age=40, id=1), Fish(name="lily", age=2, id=5), Fish(name="sam", age=3)]
+        Fish.objects().bulk_upsert(fishes, on_conflict="ignore")
+
+        assert [fish.id.value for fish in fishes][:2] == [1, 5]
+        assert fishes[2].id.value is not None
+        cursor.execute("select name, age from fish order by name")
+        assert [tuple(row) for row in cursor.fetchall()] == [("alex", 22), ("lily", 2), ("sam", 3)]
+
+    def test_bulk_upsert_on_target_with_id(self, Fish, cursor):
+        cursor.execute("create unique index on fish (id, name)")
+        fishes = [Fish(name="lily", age=2), Fish(name="sam", age=3), Fish(name="alex", age=30, id=1)]
+        Fish.objects().bulk_upsert(fishes, conflict_target=("id", "name"))
+
+        assert [fish.id.value for fish in fishes] == [2, 3, 1]
+        cursor.execute("select id, name, age from fish order by id")
+        assert [tuple(row) for row in cursor.fetchall()] == [(1, "alex", 30), (2, "lily", 2), (3, "sam", 3)]
+
+    def test_raises_on_invalid_arguments(self, Fish):
+        with pytest.raises(TowelAttributeError):
+            Fish(name="lily").objects().save(on_conflict="merge")
+        with pytest.raises(TowelAttributeError):
+            Fish(name="lily").objects().save(on_conflict="update", conflict_target="color")
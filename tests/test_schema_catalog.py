@@ -0,0 +1,56 @@
+import pytest
+from towel import *
+
+
+class TestSchemaCatalog:
+
+    def test_loads_existing_tables(self, base, cursor):
+        cursor.execute("create table aquarium (id serial primary key)")
+
+        base.db.reload_schema()
+        assert "aquarium" in base.db.schema
+
+    def test_create_table_registers(self, base):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+
+        assert "fish" not in base.db.schema
+        Fish.objects().create_table()
+        assert "fish" in base.db.schema
+
+    def test_save_records_created_table(self, base):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+
+        Fish(name="lily").objects().save()
+        assert "fish" in base.db.schema
+
+    def test_probes_after_invalidation(self, base):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+
+        Fish.objects().create_table()
+        base.db.invalidate_schema()
+
+        assert "fish" not in base.db.schema
+        assert Fish.objects().table_exists
+        assert "fish" in base.db.schema
+
+    def test_raises_on_missing_table(self, base):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+
+        with pytest.raises(TowelOperationalError):
+            Fish.objects().get(1)
+
+    def test_rollback_recovers_from_missing_table(self, base):
+        class Fish(base):
+            name = Column(VarChar, length=50)
+
+        with pytest.raises(TowelOperationalError):
+            Fish.objects().get(1)
+        base.db.rollback()
+
+        fish = Fish(name="lily")
+        fish.objects().save()
+        assert Fish.objects().get(fish.id.value).name.value == "lily"
@@ -36,3 +36,44 @@ class TestColumnSQL:
         column.column_name = "name"
 
         assert column.sql == "name varchar({})".format(30)
+
+
+class TestCompiledStatements:
+
+    def test_renders_bytes_once(self, base):
+        class Fish(base):
+            name = Column(VarChar, length=30)
+            age = Column(Integer)
+
+        misses = SQL.cache.misses
+        first = SQL.compiled(base.db.connection, "get", Fish)
+        second = SQL.compiled(base.db.connection, "get", Fish(name="lily"))
+
+        assert first == b'select * from "fish" where id = %s'
+        assert second is first
+        assert SQL.cache.misses == misses + 1
+
+    def test_keys_by_shape(self, base):
+        class Fish(base):
+            name = Column(VarChar, length=30)
+            age = Column(Integer)
+
+        by_name = SQL.compiled(base.db.connection, "update_columns_by_id", Fish, ("name",))
+        by_both = SQL.compiled(base.db.connection, "update_columns_by_id", Fish, ("name", "age"))
+
+        assert by_name == b'update "fish" set name=%s where id = %s'
+        assert by_both == b'update "fish" set name=%s, age=%s where id = %s'
+        assert SQL.compiled(base.db.connection, "insert", Fish, 2).count(b"%s") == 4
+
+    def test_bounded(self, base):
+        class Fish(base):
+            pass
+
+        maxsize, SQL.cache.maxsize = SQL.cache.maxsize, 2
+        try:
+            for rows in range(1, 5):
+                SQL.compiled(base.db.connection, "insert", Fish, rows)
+            assert len(SQL.cache) == 2
+            assert SQL.cache.stats["evictions"] >= 2
+        finally:
+            SQL.cache.maxsize = maxsize
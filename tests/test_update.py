@@ -48,3 +48,72 @@ class TestUpdate:
 
         with pytest.raises(TowelAttributeError):
             Fish.objects().update(some="new name")
+
+
+    def test_raises_on_window(self, base, cursor, fish_fixtures):
+        Fish, fix = fish_fixtures
+        with pytest.raises(TowelOperationalError):
+            Fish.objects().order_by("age").limit(1).update(age=100)
+        with pytest.raises(TowelOperationalError):
+            Fish.objects().paginate(after=fix[0], size=1).update(age=100)
+
+        cursor.execute("select count(*) from fish where age = 100")
+        assert cursor.fetchone()[0] == 0
+
+class TestBulkUpdate:
+
+    def test_updates_each_row_with_own_values(self, base, cursor, fish_fixtures):
+        Fish, fix = fish_fixtures
+        for number, fish in enumerate(fix):
+            fish.name.value = f"renamed {number}"
+            fish.age.value = number * 10
+
+        assert Fish.objects().bulk_update(fix, fields=["name", "age"], batch_size=3) == 4
+
+        cursor.execute("select id, name, age from fish order by id")
+        assert [(row.name, row.age) for row in cursor.fetchall()] == \
+               [(f"renamed {number}", number * 10) for number in range(4)]
+
+    def test_updates_only_given_fields(self, base, cursor, fish_fixtures):
+        Fish, fix = fish_fixtures
+        fix[0].name.value = "renamed"
+        fix[0].age.value = 1000
+
+        Fish.objects().bulk_update(fix[:1], fields=["age"])
+
+        cursor.execute("select name, age from fish where id = %s", [fix[0].id.value])
+        assert tuple(cursor.fetchone()) == ("lily", 1000)
+
+    def test_casts_nulls(self, base, cursor, fish_fixtures):
+        Fish, fix = fish_fixtures
+        for fish in fix:
+            fish.age.value = None
+
+        Fish.objects().bulk_update(fix, fields=["age"])
+
+        cursor.execute("select count(*) from fish where age is null")
+        assert cursor.fetchone()[0] == 4
+
+    def test_one_statement_per_batch(self, base, cursor, fish_fixtures, monkeypatch):
+        Fish, fix = fish_fixtures
+        statements = []
+        execute = Fish.objects()._execute
+        monkeypatch.setattr(Fish.objects(), "_execute",
+                            lambda cursor, statement, *args, **kwargs: statements.append(statement) or
+                            execute(cursor, statement, *args, **kwargs))
+
+        Fish.objects().bulk_update(fix, fields=["name"], batch_size=3)
+        assert len(statements) == 2
+
+    def test_raises_on_invalid_arguments(self, base, cursor, fish_fixtures):
+        Fish, fix = fish_fixtures
+        with pytest.raises(TowelAttributeError):
+            Fish.objects().bulk_update(fix, fields=["id"])
+        with pytest.raises(TowelAttributeError):
+            Fish.objects().bulk_update(fix, fields=["color"])
+        with pytest.raises(TowelAttributeError):
+            Fish.objects().bulk_update(fix, fields=[])
+        with pytest.raises(TowelOperationalError):
+            Fish.objects().bulk_update([Fish(name="new")], fields=["name"])
+        with pytest.raises(TowelValueError):
+            fix[0].objects().bulk_update(fix, fields=["name"])
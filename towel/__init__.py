@@ -1,6 +1,12 @@
-from .errors import TowelAttributeError, TowelValueError, TowelOperationalError
+from .errors import TowelAttributeError, TowelValueError, TowelOperationalError, TowelNPlusOneWarning
 from .sql_composer import SQL
+from .query import QuerySet, Param
 from .object_manager import ObjectManager
-from .columns import Column, Field, Integer, VarChar, ForeignKey, Real, Date
+from .async_manager import AsyncObjectManager, AsyncQuerySet
+from .columns import Column, Field, Integer, VarChar, ForeignKey, Real, Date, Index
+from .instrumentation import QueryEvent, SlowQueryLog, QueryMetrics, NPlusOneDetector
 from .database import Database
+from .pool import ConnectionPool
+from .async_pool import AsyncConnectionPool
+from .async_database import AsyncDatabase
 from .model import AbstractBaseModel
@@ -0,0 +1,126 @@
+import contextvars
+import time
+from contextlib import asynccontextmanager
+
+import psycopg2.extras
+
+from . import TowelOperationalError
+from .async_pool import AsyncConnectionPool, wait
+from .database import SchemaCatalog
+from .identity_map import IdentityMap
+from .instrumentation import Instrumentation
+
+
+class AsyncDatabase:
+    """Database for asyncio code, backed by AsyncConnectionPool.
+
+    Each operation checks out its own connection, so one process can have as many queries in flight as
+    the pool has connections. Asynchronous connections always autocommit, transaction() wraps the block
+    in BEGIN/COMMIT on one connection pinned to the current task. Models use it together with AsyncObjectManager"""
+
+    def __init__(self, pool, identity_map_size=None):
+        self.pool = pool
+        self.schema = SchemaCatalog()
+        self.identity_map = IdentityMap(identity_map_size) if identity_map_size else None
+        self.prepared = None
+        self.instrumentation = Instrumentation()
+        self._pinned = contextvars.ContextVar(f"towel_connection_{id(self)}", default=None)
+
+    @classmethod
+    async def connect(cls, *args, identity_map_size=None, **kwargs):
+        """Opens AsyncConnectionPool with given connection and pool arguments and loads schema catalog"""
+        db = cls(await AsyncConnectionPool(*args, **kwargs).open(), identity_map_size=identity_map_size)
+        await db.reload_schema()
+        return db
+
+    @asynccontextmanager
+    async def checkout(self):
+        pinned = self._pinned.get()
+        if pinned is not None:
+            yield pinned
+            return
+
+        async with self.pool.connection() as conn:
+            yield conn
+
+    @asynccontextmanager
+    async def cursor(self, **kwargs):
+        kwargs.setdefault("cursor_factory", psycopg2.extras.NamedTupleCursor)
+        async with self.checkout() as conn:
+            cursor = conn.cursor(**kwargs)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @asynccontextmanager
+    async def transaction(self, pin=True):
+        """Runs the block in a transaction on one connection, rolled back if the block raises.
+        Nested blocks join the outer transaction. Unless pin is False, operations of the current task
+        run on that connection until the block ends"""
+        pinned = self._pinned.get()
+        if pinned is not None:
+            yield pinned
+            return
+
+        async with self.pool.connection() as conn:
+            token = self._pinned.set(conn) if pin else None
+            try:
+                await self.execute(conn.cursor(), "begin", operation="transaction")
+                yield conn
+                await self.execute(conn.cursor(), "commit", operation="transaction")
+            except BaseException:
+                if not conn.closed and not conn.isexecuting():
+                    await self.execute(conn.cursor(), "rollback", operation="transaction")
+                raise
+            finally:
+                if token is not None:
+                    self._pinned.reset(token)
+
+    @asynccontextmanager
+    async def autocommit(self):
+        """Connection for statements which cannot run inside a transaction block. Asynchronous connections
+        always autocommit, so only the block of transaction() is ruled out"""
+        if self._pinned.get() is not None:
+            raise TowelOperationalError("Statement cannot run inside transaction()")
+        async with self.pool.connection() as conn:
+            yield conn
+
+    async def execute(self, cursor, statement, values=None, model=None, operation=None, probe=False):
+        """Sends statement and waits for its result without blocking the loop, reporting it to listeners"""
+        instrumentation = self.instrumentation
+        if not instrumentation:
+            cursor.execute(statement, values)
+            await wait(cursor.connection)
+            return
+
+        started = time.perf_counter()
+        try:
+            cursor.execute(statement, values)
+            await wait(cursor.connection)
+        except Exception as e:
+            instrumentation.emit(cursor, statement, values, False, model, operation, time.perf_counter() - started,
+                                 probe, e)
+            raise
+        instrumentation.emit(cursor, statement, values, False, model, operation, time.perf_counter() - started,
+                             probe)
+
+    def add_listener(self, listener):
+        return self.instrumentation.add(listener)
+
+    def remove_listener(self, listener):
+        self.instrumentation.remove(listener)
+
+    async def kill(self):
+        await self.pool.closeall()
+
+    async def reload_schema(self):
+        async with self.cursor() as cursor:
+            await self.execute(cursor, SchemaCatalog.QUERY, operation="reload_schema", probe=True)
+            self.schema.tables = {row[0] for row in cursor.fetchall()}
+
+    def invalidate_schema(self, tablename=None):
+        self.schema.invalidate(tablename)
+
+    def table_created(self, tablename):
+        self.schema.add(tablename)
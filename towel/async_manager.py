@@ -0,0 +1,398 @@
+import itertools
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extras
+from psycopg2 import sql
+from psycopg2.extensions import encodings
+
+from . import TowelOperationalError, TowelAttributeError, SQL, QuerySet, ObjectManager
+from .explain import Plan
+
+
+class AsyncQuerySet(QuerySet):
+    """QuerySet whose operations are coroutines running on AsyncDatabase"""
+
+    async def get_all(self, limit=None):
+        if self.related_select or self.related_prefetch:
+            raise TowelOperationalError("Related entities can be loaded only by all() or iterate(instances=True)")
+        if limit is not None:
+            return await self.limit(limit).get_all()
+
+        manager = self.manager
+        async with manager.db.cursor() as cursor:
+            await manager._execute(cursor, *self.compile(cursor), operation="get_all")
+            return cursor.fetchall()
+
+    async def all(self):
+        manager = self.manager
+        async with manager.db.cursor() as cursor:
+            statement, values = self.compile(cursor)
+            await manager._execute(cursor, statement, values, operation="all")
+            rows = cursor.fetchall()
+        return await manager._hydrate(rows, self.related_select, self.related_prefetch, self.names)
+
+    async def count(self):
+        return await self._scalar("count")
+
+    async def exists(self):
+        return await self._scalar("exists")
+
+    async def aggregate(self, **aggregates):
+        spec = self._aggregates(aggregates)
+        return dict(zip((alias for _, _, alias in spec), (await self._rows("aggregate", spec))[0]))
+
+    async def annotate(self, **aggregates):
+        return await self._rows("annotate", self._aggregates(aggregates))
+
+    async def _scalar(self, operation):
+        manager = self.manager
+        async with manager.db.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+            await manager._execute(cursor, *self.compile(cursor, operation), operation=operation)
+            return cursor.fetchone()[0]
+
+    async def _rows(self, operation, spec):
+        manager = self.manager
+        async with manager.db.cursor() as cursor:
+            await manager._execute(cursor, *self.compile(cursor, operation, spec), operation=operation)
+            return cursor.fetchall()
+
+    async def values_list(self, *columns, flat=False):
+        names = self._check_columns(columns) if columns else self.names or self.model.__columns__.names
+        if flat and len(names) != 1:
+            raise TowelAttributeError("flat can be used only with a single column")
+
+        manager = self.manager
+        async with manager.db.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+            statement, values = self.compile(cursor, "values", names)
+            await manager._execute(cursor, statement, values, operation="values_list")
+            rows = cursor.fetchall()
+        return [row[0] for row in rows] if flat else rows
+
+    async def explain(self, analyze=False, buffers=False):
+        manager = self.manager
+        async with manager.db.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+            statement, values = self.compile(cursor)
+            await manager._execute(cursor, SQL.explain(analyze, buffers) + statement, values, operation="explain")
+            plan = Plan.from_json(cursor.fetchone()[0], statement.decode(encodings[cursor.connection.encoding]))
+
+            tables = plan.scanned_tables()
+            if tables:
+                await manager._execute(cursor, SQL.TABLE_SIZES, (list(tables),), operation="explain", probe=True)
+                plan.table_sizes = dict(cursor.fetchall())
+        return plan
+
+    async def explain_analyze(self, buffers=False):
+        return await self.explain(analyze=True, buffers=buffers)
+
+    def iterate(self, chunk_size=1000, instances=False):
+        """Asynchronous iterator over rows of get_all(), fetching chunk_size rows at a time from a server-side cursor"""
+        if not isinstance(chunk_size, int) or chunk_size <= 0:
+            raise TowelAttributeError("Chunk size should be positive int")
+        if (self.related_select or self.related_prefetch) and not instances:
+            raise TowelOperationalError("Related entities can be loaded only by all() or iterate(instances=True)")
+
+        return self.manager._stream(self, chunk_size, instances)
+
+    async def update(self, **kwargs):
+        if self.joins:
+            raise TowelOperationalError("Towel currently doesn't support updating with join clause")
+        self._raise_if_windowed("updating")
+
+        manager = self.manager
+        manager._check_update(kwargs)
+        self.model(**kwargs)
+
+        async with manager.db.cursor() as cursor:
+            statement, values = self.compile(cursor, "update", tuple(kwargs))
+            try:
+                await manager._execute(cursor, statement, list(kwargs.values()) + values, operation="update")
+            except psycopg2.Error as e:
+                raise TowelOperationalError(f"{str(e)} was raised during update")
+        manager._forget()
+
+    async def remove(self):
+        self._raise_if_windowed("removing")
+        manager = self.manager
+        async with manager.db.cursor() as cursor:
+            statement, values = self.compile(cursor, "remove")
+            await manager._execute(cursor, statement, values, operation="remove")
+        manager._forget()
+
+
+class AsyncObjectManager(ObjectManager):
+    """Awaitable counterpart of ObjectManager for models whose db is AsyncDatabase.
+
+    Set it as _objects of the base model. Foreign entities which are not loaded yet
+    are returned as awaitables"""
+    query_class = AsyncQuerySet
+    _cursor_names = itertools.count()
+
+    async def create_table(self):
+        async with self.db.transaction():
+            async with self.db.cursor() as cursor:
+                await self._execute(cursor, SQL.create_table(self.model), operation="create_table")
+                for index in self.model.__indexes__:
+                    await self._execute(cursor, SQL.create_index(self.model, index), operation="create_table")
+        self.db.table_created(self.model.tablename())
+
+    async def create_indexes(self, concurrently=False):
+        await self._create_indexes(self.model.__indexes__, concurrently)
+
+    async def ensure_schema(self, concurrently=False):
+        if not await self.table_exists:
+            await self.create_table()
+            return [index.name for index in self.model.__indexes__]
+
+        async with self.db.cursor() as cursor:
+            await self._execute(cursor, SQL.INDEXES, (self.model.tablename(),), operation="ensure_schema", probe=True)
+            existing = {row.indexname for row in cursor.fetchall()}
+        missing = [index for index in self.model.__indexes__ if index.name not in existing]
+        await self._create_indexes(missing, concurrently)
+        return [index.name for index in missing]
+
+    async def save(self, on_conflict="raise", conflict_target=("id",)):
+        self._raise_if_not_inst()
+        target = self._check_conflict(on_conflict, conflict_target)
+        if not await self.table_exists:
+            await self.create_table()
+
+        with_id = self.model.id.value is not None
+        async with self.db.cursor() as cursor:
+            statement = SQL.compiled(cursor, "upsert", self.model, 1, with_id, on_conflict, target)
+            try:
+                await self._execute(cursor, statement, SQL.row_values(self.model, with_id=with_id), operation="save")
+            except psycopg2.Error as e:
+                self._raise_write_error(e)
+            row = cursor.fetchone()
+
+        if row is not None:
+            self.model.id.value = row.id
+        self._forget(self.model.id.value)
+
+    async def bulk_save(self, instances, batch_size=1000):
+        """Inserts instances with one multi-row statement per batch and assigns generated ids back in order"""
+        instances = self._check_bulk_save(instances, batch_size)
+        if not await self.table_exists:
+            await self.create_table()
+
+        async with self.db.transaction():
+            async with self.db.cursor() as cursor:
+                for start in range(0, len(instances), batch_size):
+                    batch = instances[start:start + batch_size]
+                    statement = SQL.compiled(cursor, "insert", self.model, len(batch))
+                    try:
+                        await self._execute(cursor, statement, SQL.row_values(*batch), operation="bulk_save")
+                    except psycopg2.Error as e:
+                        self._raise_write_error(e)
+
+                    for inst, row in zip(batch, cursor.fetchall()):
+                        inst.id.value = row.id
+                        self._forget(row.id)
+
+        return instances
+
+    async def bulk_upsert(self, instances, on_conflict="update", conflict_target=("id",), batch_size=1000):
+        target = self._check_conflict(on_conflict, conflict_target)
+        instances = self._check_bulk_save(instances, batch_size, with_ids=True)
+        if not await self.table_exists:
+            await self.create_table()
+
+        async with self.db.transaction():
+            async with self.db.cursor() as cursor:
+                for with_id, batch in self._upsert_batches(instances, batch_size):
+                    statement = SQL.compiled(cursor, "upsert", self.model, len(batch), with_id, on_conflict, target)
+                    try:
+                        await self._execute(cursor, statement, SQL.row_values(*batch, with_id=with_id),
+                                            operation="bulk_upsert")
+                    except psycopg2.Error as e:
+                        self._raise_write_error(e)
+                    self._assign_ids(batch, cursor.fetchall(), with_id, target)
+
+        return instances
+
+    async def bulk_update(self, instances, fields, batch_size=1000):
+        """Writes given fields of instances with one UPDATE ... FROM (VALUES ...) statement per batch.
+        Returns number of updated rows"""
+        instances, fields = self._check_bulk_update(instances, fields, batch_size)
+
+        updated = 0
+        async with self.db.transaction():
+            async with self.db.cursor() as cursor:
+                for start in range(0, len(instances), batch_size):
+                    batch = instances[start:start + batch_size]
+                    statement = SQL.compiled(cursor, "bulk_update", self.model, fields, len(batch))
+                    try:
+                        await self._execute(cursor, statement, SQL.bulk_update_values(fields, *batch),
+                                            operation="bulk_update")
+                    except psycopg2.Error as e:
+                        raise TowelOperationalError(f"{str(e)} was raised during update")
+                    updated += cursor.rowcount
+
+        for inst in instances:
+            self._forget(inst.id.value)
+        return updated
+
+    def copy_from(self, iterable, size=8192):
+        raise TowelOperationalError("COPY is not supported by asynchronous connections")
+
+    def save_from_namedtuple(self, iterator):
+        raise TowelOperationalError("executemany() is not supported by asynchronous connections, use bulk_save()")
+
+    async def update(self, **kwargs):
+        if isinstance(self.model, type):
+            await self.query().update(**kwargs)
+            return
+
+        self._check_update(kwargs)
+        for key, value in kwargs.items():
+            setattr(self.model, key, value)
+
+        try:
+            async with self.db.cursor() as cursor:
+                await self._execute(cursor, SQL.compiled(cursor, "update_columns_by_id", self.model, tuple(kwargs)),
+                                    list(kwargs.values()) + [self.model.id.value], operation="update")
+        except psycopg2.Error as e:
+            raise TowelOperationalError(f"{str(e)} was raised during update")
+        self._forget(self.model.id.value)
+
+    async def remove(self):
+        if isinstance(self.model, type):
+            await self.query().remove()
+            return
+
+        try:
+            async with self.db.cursor() as cursor:
+                await self._execute(cursor, SQL.compiled(cursor, "remove_one", self.model), (self.model.id.value,),
+                                    operation="remove")
+        except psycopg2.Error as e:
+            raise TowelOperationalError(f"{str(e)} was raised during remove")
+        self._forget(self.model.id.value)
+
+    async def get(self, pk):
+        return await self._get_one(pk)
+
+    async def _get_one(self, pk, operation="get", probe=False):
+        identity_map = self.db.identity_map
+        if identity_map is not None:
+            instance = identity_map.get(self.model_class, pk)
+            if instance is not None:
+                return instance
+
+        async with self.db.cursor() as cursor:
+            await self._execute(cursor, SQL.compiled(cursor, "get", self.model), (pk,), operation=operation,
+                                probe=probe)
+            result = cursor.fetchone()
+        if not result:
+            return None
+
+        instance = self.model.from_namedtuple(result)
+        if identity_map is not None:
+            identity_map.add(instance)
+        return instance
+
+    async def get_many(self, pks):
+        """Instances with given ids fetched in one round trip, in order of requested ids.
+        Ids which don't exist are skipped"""
+        pks = list(dict.fromkeys(pks))
+        found = {instance.id.value: instance for instance in await self._fetch_many(pks)} if pks else {}
+        return [found[pk] for pk in pks if pk in found]
+
+    @property
+    async def table_empty(self):
+        return not await self.query().exists()
+
+    async def estimated_count(self):
+        async with self.db.cursor() as cursor:
+            await self._execute(cursor, SQL.ESTIMATED_COUNT, (self.model.tablename(),), operation="estimated_count")
+            row = cursor.fetchone()
+        if row is None:
+            raise TowelOperationalError("Table doesn't exist")
+        return row[0] if row[0] >= 0 else await self.count()
+
+    @property
+    async def table_exists(self):
+        """Consults schema catalog of the database, probes the server only for tables it doesn't know about"""
+        tablename = self.model.tablename()
+        if tablename in self.db.schema:
+            return True
+
+        async with self.db.cursor() as cursor:
+            await self._execute(cursor, sql.SQL("SELECT to_regclass('public.{}');").format(sql.Identifier(tablename)),
+                                operation="table_exists", probe=True)
+            exists = cursor.fetchone()[0] == tablename
+        if exists:
+            self.db.schema.add(tablename)
+        return exists
+
+    async def _create_indexes(self, indexes, concurrently):
+        async with (self.db.autocommit() if concurrently else self.db.transaction()) as conn:
+            cursor = conn.cursor()
+            for index in indexes:
+                await self._execute(cursor, SQL.create_index(self.model, index, concurrently),
+                                    operation="create_indexes")
+
+    async def _execute(self, cursor, statement, values=None, operation=None, probe=False):
+        try:
+            await self.db.execute(cursor, statement, values, self.model_class, operation, probe)
+        except psycopg2.errors.UndefinedTable:
+            self.db.invalidate_schema()
+            raise TowelOperationalError("Table doesn't exist")
+
+    async def _stream(self, query, chunk_size, instances):
+        name = f"towel_{self.model.tablename()}_{next(self._cursor_names)}"
+        # the generator may be suspended between chunks, so its connection is not pinned to the consuming task
+        async with self.db.transaction(pin=False) as conn:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.NamedTupleCursor)
+            try:
+                statement, values = query.compile(conn)
+                await self._execute(cursor, f"declare {name} no scroll cursor for ".encode() + statement, values,
+                                    operation="iterate")
+                fetch = f"fetch forward {chunk_size} from {name}"
+                while True:
+                    await self._execute(cursor, fetch, operation="iterate")
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    if instances:
+                        rows = await self._hydrate(rows, query.related_select, query.related_prefetch, query.names)
+                    for row in rows:
+                        yield row
+            finally:
+                cursor.close()
+
+    async def load_deferred(self):
+        """Loads columns of the instance left out by only()/defer()"""
+        self._raise_if_not_inst()
+        names = self._deferred_names(self.model)
+        if names:
+            async with self.db.cursor() as cursor:
+                await self._execute(cursor, SQL.compiled(cursor, "get_columns", self.model, names),
+                                    (self.model.id.value,), operation="load_deferred")
+                self._fill_deferred(self.model, names, cursor.fetchone())
+
+    def _fetch_deferred(self, instance):
+        raise TowelOperationalError("Deferred columns of asynchronous models have to be loaded "
+                                    "with await instance.objects().load_deferred()")
+
+    async def _hydrate(self, rows, select, prefetch, names=None):
+        instances = self._build(rows, select, names)
+        for col in prefetch:
+            await self._prefetch(instances, col)
+        return instances
+
+    async def _prefetch(self, instances, column):
+        keys = self._related_keys(instances, column)
+        entities = await column.foreign_entity.objects()._fetch_many(keys) if keys else []
+        self._attach(instances, column, entities)
+
+    async def _fetch_many(self, pks):
+        instances, missing = self._lookup(pks)
+        if missing:
+            instances.extend(self._remember(await self._select_many(missing)))
+        return instances
+
+    async def _select_many(self, pks):
+        async with self.db.cursor() as cursor:
+            await self._execute(cursor, SQL.compiled(cursor, "get_many", self.model), (pks,), operation="get_many")
+            return cursor.fetchall()
@@ -0,0 +1,162 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+from . import TowelOperationalError, TowelAttributeError
+
+
+async def wait(conn):
+    """Drives asynchronous connection until its current operation is done, sleeping on its socket in the event loop"""
+    loop = asyncio.get_running_loop()
+    fd = conn.fileno()
+    while True:
+        state = conn.poll()
+        if state == psycopg2.extensions.POLL_OK:
+            return
+
+        future = loop.create_future()
+
+        def ready(future=future):
+            if not future.done():
+                future.set_result(None)
+
+        if state == psycopg2.extensions.POLL_READ:
+            loop.add_reader(fd, ready)
+            remove = loop.remove_reader
+        elif state == psycopg2.extensions.POLL_WRITE:
+            loop.add_writer(fd, ready)
+            remove = loop.remove_writer
+        else:
+            raise TowelOperationalError(f"Unexpected poll state {state}")
+
+        try:
+            await future
+        finally:
+            remove(fd)
+
+
+class AsyncConnectionPool:
+    """Pool of psycopg2 connections opened in asynchronous mode, to be used from a single event loop.
+
+    Keeps at least minconn connections open and never more than maxconn. Checkout waits up to timeout seconds
+    when the pool is exhausted and connections older than max_lifetime seconds are replaced.
+    Call open() before first use"""
+
+    def __init__(self, *args, minconn=1, maxconn=10, timeout=30.0, max_lifetime=3600.0, **kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise TowelAttributeError("Pool size should satisfy 0 <= minconn <= maxconn and maxconn >= 1")
+
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self._args = args
+        self._kwargs = kwargs
+
+        self._idle = []
+        self._created = {}
+        self._size = 0
+        self._closed = False
+        self._condition = asyncio.Condition()
+
+    async def open(self):
+        while self._size < self.minconn:
+            self._size += 1
+            try:
+                self._idle.append(await self._open())
+            except BaseException:
+                self._size -= 1
+                raise
+        return self
+
+    async def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+
+        async with self._condition:
+            try:
+                await asyncio.wait_for(self._condition.wait_for(self._available), timeout)
+            except asyncio.TimeoutError:
+                raise TowelOperationalError(f"Connection pool exhausted, waited {timeout}s")
+            if self._closed:
+                raise TowelOperationalError("Connection pool is closed")
+
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._size += 1
+
+        if conn is not None and not (conn.closed or self._expired(conn)):
+            return conn
+
+        try:
+            if conn is not None:
+                self._discard(conn)
+            return await self._open()
+        except BaseException:
+            async with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    async def putconn(self, conn, discard=False):
+        if conn.closed or conn.isexecuting():
+            discard = True
+        elif conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.cursor().execute("rollback")
+                await wait(conn)
+            except psycopg2.Error:
+                discard = True
+
+        async with self._condition:
+            if discard or self._closed or self._expired(conn):
+                self._discard(conn)
+                self._size -= 1
+            else:
+                self._idle.append(conn)
+            self._condition.notify()
+
+    @asynccontextmanager
+    async def connection(self, timeout=None):
+        conn = await self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            await self.putconn(conn)
+
+    async def closeall(self):
+        async with self._condition:
+            self._closed = True
+            for conn in self._idle:
+                self._discard(conn)
+            self._size -= len(self._idle)
+            self._idle.clear()
+            self._condition.notify_all()
+
+    @property
+    def stats(self):
+        return {"size": self._size, "idle": len(self._idle), "minconn": self.minconn, "maxconn": self.maxconn}
+
+    def _available(self):
+        return self._closed or bool(self._idle) or self._size < self.maxconn
+
+    async def _open(self):
+        """New connection for a slot already counted in pool size"""
+        conn = psycopg2.connect(*self._args, async_=1, **self._kwargs)
+        try:
+            await wait(conn)
+        except BaseException:
+            conn.close()
+            raise
+        self._created[conn] = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        self._created.pop(conn, None)
+        if not conn.closed:
+            conn.close()
+
+    def _expired(self, conn):
+        return self.max_lifetime is not None and time.monotonic() - self._created.get(conn, 0) > self.max_lifetime
@@ -1,7 +1,21 @@
 import abc
 import datetime
+from collections import namedtuple
+from operator import attrgetter
+from types import MappingProxyType
 
-from . import TowelValueError
+from . import TowelAttributeError, TowelValueError
+
+
+class Deferred:
+    """Marks value of a column which was not selected, loaded from the database on first access"""
+    __slots__ = ()
+
+    def __repr__(self):
+        return "<deferred>"
+
+
+DEFERRED = Deferred()
 
 
 class Field(abc.ABC):
@@ -14,6 +28,15 @@ class Field(abc.ABC):
     def sql(cls):
         pass
 
+    @classmethod
+    def is_valid(cls, value):
+        return value is None or isinstance(value, cls.PYTHON_TYPE)
+
+    @classmethod
+    def encode(cls, value):
+        """Text representation of non-null value as accepted by postgres input functions"""
+        return str(value)
+
     @property
     def value(self):
         return self._value
@@ -62,6 +85,10 @@ class Real(Field):
     def __init__(self, value, **kwargs):
         super().__init__(value, **kwargs)
 
+    @classmethod
+    def encode(cls, value):
+        return repr(value)
+
     @Field.value.setter
     def value(self, new):
         if isinstance(new, self.PYTHON_TYPE) or new is None:
@@ -81,6 +108,10 @@ class Date(Field):
     def __init__(self, value, **kwargs):
         super().__init__(value, **kwargs)
 
+    @classmethod
+    def encode(cls, value):
+        return value.isoformat()
+
     @Field.value.setter
     def value(self, new):
         if isinstance(new, self.PYTHON_TYPE) or new is None:
@@ -128,6 +159,7 @@ class ForeignKey:
     def __init__(self, table, field=None, **kwargs):
         self.table = table
         self.field = (field or self.field)(None)
+        self.SQL_TYPE = self.field.SQL_TYPE
 
     @property
     def value(self):
@@ -137,20 +169,31 @@ class ForeignKey:
     def value(self, new):
         self.field.value = new
 
+    def is_valid(self, value):
+        return self.field.is_valid(value)
+
+    def encode(self, value):
+        return self.field.encode(value)
+
     def sql(self):
         return self.field.sql() + " references " + self.table.tablename() + "(id)"
 
 
 class Column:
+    """Class-level descriptor. Values of model instances live in their row storage,
+    instance access returns a lightweight ColumnValue view over it"""
     field_inst = None
     column_name = None
+    entity_name = None
 
-    def __init__(self, field_class, value=None, **attrs):
+    def __init__(self, field_class, value=None, index=False, unique=False, **attrs):
         if not issubclass(field_class, ForeignKey):
             if isinstance(field_class, type) and not issubclass(field_class, Field):
                 raise TowelValueError(f'{field_class} is not instance of {Field.__name__}')
 
         self.field_class = field_class
+        self.index = index
+        self.unique = unique
         self._attrs = attrs
 
         if issubclass(field_class, ForeignKey):
@@ -163,11 +206,23 @@ class Column:
     def __str__(self):
         return str(self.field_inst)
 
-    def create_duplicate(self):
-        cls = self.__class__(self.field_class, **self._attrs)
-        cls.column_name = self.column_name
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return ColumnValue(self, instance)
 
-        return cls
+    def __set__(self, instance, value):
+        instance._values[instance.__columns__.index[self.column_name]] = self.validate(value)
+        if self.entity_name is not None and instance._related:
+            instance._related.pop(self.entity_name, None)
+
+    def validate(self, value):
+        if not self.field_inst.is_valid(value):
+            raise TowelValueError(f"Value {value} is illegal for column of type {self.field_inst.__class__.__name__}")
+        return value
+
+    def encode(self, value):
+        return self.field_inst.encode(value)
 
     @property
     def value(self):
@@ -183,3 +238,90 @@ class Column:
     @property
     def sql(self):
         return ' '.join((self.column_name, self.field_inst.sql()))
+
+
+class ColumnValue:
+    """View of a single column of a model instance. Created on attribute access, holds no value itself"""
+    __slots__ = ("column", "instance")
+
+    def __init__(self, column, instance):
+        self.column = column
+        self.instance = instance
+
+    def __getattr__(self, item):
+        return getattr(self.column, item)
+
+    def __repr__(self):
+        return f"<{self.column_name}={self.value!r}>"
+
+    @property
+    def value(self):
+        instance = self.instance
+        position = instance.__columns__.index[self.column.column_name]
+        value = instance._values[position]
+        if value is DEFERRED:
+            value = instance._get(position)
+        return value
+
+    @value.setter
+    def value(self, new):
+        self.column.__set__(self.instance, new)
+
+
+class Index(namedtuple("Index", ("columns", "unique", "where", "name"))):
+    """Index declared in __indexes__ of a model. Columns prefixed with "-" are indexed descending,
+    where is SQL predicate of a partial index. Name defaults to <table>_<columns>_idx, or _key for unique ones"""
+    __slots__ = ()
+
+    NAME_LENGTH = 63
+
+    def __new__(cls, *columns, unique=False, where=None, name=None):
+        if not columns:
+            raise TowelAttributeError("Index needs at least one column")
+        return super().__new__(cls, columns, unique, where, name)
+
+    @property
+    def names(self):
+        return tuple(column.lstrip("-") for column in self.columns)
+
+    def named(self, tablename):
+        if self.name:
+            return self
+        name = "_".join((tablename,) + self.names + ("key" if self.unique else "idx",))
+        return self._replace(name=name[:self.NAME_LENGTH])
+
+
+class ColumnRegistry(namedtuple("ColumnRegistry", ("columns", "names", "index", "primary_key", "foreign_keys",
+                                                   "insertable", "insertable_names", "insertable_positions",
+                                                   "defaults", "row_getter"))):
+    """Immutable, ordered view of model columns. Built once per model class by MetaModel"""
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, columns):
+        columns = tuple(sorted(columns, key=lambda col: col.column_name))
+        names = tuple(col.column_name for col in columns)
+        index = MappingProxyType({name: position for position, name in enumerate(names)})
+
+        primary_key = columns[index["id"]] if "id" in index else None
+        foreign_keys = tuple(col for col in columns if issubclass(col.field_class, ForeignKey))
+        insertable = tuple(col for col in columns if col is not primary_key)
+        defaults = tuple(col.value for col in columns)
+
+        return cls(columns, names, index, primary_key, foreign_keys, insertable,
+                   tuple(col.column_name for col in insertable),
+                   tuple(index[col.column_name] for col in insertable),
+                   defaults, cls._row_getter(names))
+
+    @staticmethod
+    def _row_getter(names):
+        """Callable reading values of all columns from a namedtuple row, in registry order"""
+        if not names:
+            return lambda row: ()
+        if len(names) == 1:
+            name = names[0]
+            return lambda row: (getattr(row, name),)
+        return attrgetter(*names)
+
+    def __contains__(self, name):
+        return name in self.index
@@ -0,0 +1,64 @@
+from . import TowelAttributeError
+from .sql_composer import SQL
+
+NULL = "\\N"
+ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+_END = object()
+
+
+class CopyStream:
+    """File-like adapter encoding rows into COPY text format on demand.
+
+    Accepts model instances, namedtuples and plain tuples ordered as insertable columns of the model.
+    Rows are pulled from the source only when psycopg2 asks for more data, so memory doesn't depend on input size"""
+
+    def __init__(self, model, rows):
+        self.model = model
+        self.columns = model.__columns__.insertable
+        self.rows = iter(rows)
+        self.buffer = ""
+        self.error = None
+
+    def read(self, size=-1):
+        chunks = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            row = next(self.rows, _END)
+            if row is _END:
+                break
+            try:
+                line = self.encode(row)
+            except Exception as e:
+                # psycopg2 reports errors of read() as QueryCanceled, the original is raised again by copy_from()
+                self.error = e
+                raise
+            chunks.append(line)
+            length += len(line)
+
+        data = "".join(chunks)
+        if size < 0:
+            self.buffer = ""
+            return data
+        self.buffer = data[size:]
+        return data[:size]
+
+    def encode(self, row):
+        return "\t".join(NULL if value is None else col.encode(value).translate(ESCAPES)
+                         for col, value in zip(self.columns, self._values(row))) + "\n"
+
+    def _values(self, row):
+        if isinstance(row, self.model):
+            values = row._values
+            return SQL._loaded([values[position] for position in self.model.__columns__.insertable_positions])
+
+        if hasattr(row, "_fields"):
+            try:
+                values = [getattr(row, col.column_name) for col in self.columns]
+            except AttributeError as e:
+                raise TowelAttributeError(str(e))
+        elif isinstance(row, (tuple, list)) and len(row) == len(self.columns):
+            values = row
+        else:
+            raise TowelAttributeError(f"{row} can't be copied into {self.model.tablename()}")
+
+        return [col.validate(value) for col, value in zip(self.columns, values)]
@@ -1,10 +1,231 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2.extras
+
+from . import TowelAttributeError, TowelOperationalError
+from .identity_map import IdentityMap
+from .instrumentation import Instrumentation
+from .prepared import PreparedStatements
+
+
+class SchemaCatalog:
+    """Names of tables known to exist in the public schema"""
+    QUERY = "select tablename from pg_catalog.pg_tables where schemaname = 'public'"
+
+    def __init__(self):
+        self.tables = set()
+
+    def __contains__(self, tablename):
+        return tablename in self.tables
+
+    def add(self, tablename):
+        self.tables.add(tablename)
+
+    def invalidate(self, tablename=None):
+        if tablename is None:
+            self.tables.clear()
+        else:
+            self.tables.discard(tablename)
+
+
 class Database:
+    """Wraps either a single connection shared by every manager or a ConnectionPool.
+
+    With a pool each operation checks out its own connection and commits on success,
+    while transaction() pins one connection to the current thread until the block ends.
+
+    A failed statement aborts the transaction of the shared connection until rollback(). With savepoints,
+    writes which can fail on conflicts run under a savepoint keeping pending work, at two extra round trips"""
+    SAVEPOINT = b"savepoint towel_write"
+    ROLLBACK_TO_SAVEPOINT = b"rollback to savepoint towel_write"
+    RELEASE_SAVEPOINT = b"release savepoint towel_write"
+
+    def __init__(self, connection=None, identity_map_size=None, prepare=False, pool=None, savepoints=False):
+        if (connection is None) == (pool is None):
+            raise TowelAttributeError("Either connection or pool should be provided")
+
+        self.pool = pool
+        self._connection = connection
+        self._local = threading.local()
+        self.schema = SchemaCatalog()
+        self.identity_map = IdentityMap(identity_map_size) if identity_map_size else None
+        self.prepared = PreparedStatements() if prepare else None
+        self.savepoints = savepoints
+        self.instrumentation = Instrumentation()
+        self.reload_schema()
+
+    @property
+    def connection(self):
+        if self.pool is None:
+            return self._connection
+
+        pinned = getattr(self._local, "connection", None)
+        if pinned is None:
+            raise TowelOperationalError("Pooled database has connection only inside transaction()")
+        return pinned
+
+    @contextmanager
+    def checkout(self):
+        """Connection for a single operation. Pooled connections are committed and returned when it ends"""
+        pinned = self._connection if self.pool is None else getattr(self._local, "connection", None)
+        if pinned is not None:
+            yield pinned
+            return
+
+        conn = self.pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            self.pool.putconn(conn)
 
-    def __init__(self, connection):
-        self.connection = connection
+    @contextmanager
+    def cursor(self, **kwargs):
+        kwargs.setdefault("cursor_factory", psycopg2.extras.NamedTupleCursor)
+        with self.checkout() as conn:
+            cursor = conn.cursor(**kwargs)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def transaction(self):
+        """Runs the block on one connection and commits it, or rolls back if the block raises.
+        Nested blocks join the outer transaction"""
+        if getattr(self._local, "connection", None) is not None:
+            yield self._local.connection
+            return
+
+        conn = self._connection if self.pool is None else self.pool.getconn()
+        self._local.connection = conn
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._local.connection = None
+            if self.pool is not None:
+                self.pool.putconn(conn)
+
+    @contextmanager
+    def autocommit(self):
+        """Connection in autocommit mode for statements which cannot run inside a transaction block,
+        such as CREATE INDEX CONCURRENTLY. Pending work of a single shared connection is committed first"""
+        if getattr(self._local, "connection", None) is not None:
+            raise TowelOperationalError("Statement cannot run inside transaction()")
+
+        conn = self._connection if self.pool is None else self.pool.getconn()
+        autocommit = conn.autocommit
+        try:
+            conn.commit()
+            conn.autocommit = True
+            yield conn
+        finally:
+            conn.autocommit = autocommit
+            if self.pool is not None:
+                self.pool.putconn(conn)
+
+    @contextmanager
+    def savepoint(self, cursor):
+        """Block whose failed statements don't abort the transaction of the connection, if savepoints are enabled.
+        Pending work of the shared connection or of transaction() is kept by a savepoint, connection without
+        any is rolled back. Autocommit connections and pooled ones checked out for a single operation need neither"""
+        conn = cursor.connection
+        if not self.savepoints or conn.autocommit or \
+                (self.pool is not None and getattr(self._local, "connection", None) is None):
+            yield
+            return
+
+        if conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                yield
+            except psycopg2.Error:
+                conn.rollback()
+                raise
+            return
+
+        self.execute(cursor, self.SAVEPOINT, operation="savepoint", probe=True)
+        try:
+            yield
+        except psycopg2.Error:
+            self.execute(cursor, self.ROLLBACK_TO_SAVEPOINT, operation="savepoint", probe=True)
+            raise
+        self.execute(cursor, self.RELEASE_SAVEPOINT, operation="savepoint", probe=True)
 
     def kill(self):
-        self.connection.close()
+        if self.pool is None:
+            self._connection.close()
+        else:
+            self.pool.closeall()
 
     def commit(self):
-        self.connection.commit()
+        if self.pool is None:
+            self._connection.commit()
+        elif getattr(self._local, "connection", None) is not None:
+            self._local.connection.commit()
+
+    def rollback(self):
+        """Discards pending work. Connection whose transaction was aborted by a failed statement, such as a query
+        of a missing table, can be used again only after it"""
+        if self.pool is None:
+            self._connection.rollback()
+        elif getattr(self._local, "connection", None) is not None:
+            self._local.connection.rollback()
+
+    def execute(self, cursor, statement, values=None, many=False, prepared=False, model=None, operation=None,
+                probe=False, copy=None):
+        """Runs statement on the cursor, as a prepared statement if asked and enabled, or as COPY reading
+        from copy, a (file, size) pair. Every statement of the ORM goes through here, listeners get a QueryEvent
+        of each"""
+        instrumentation = self.instrumentation
+        if not instrumentation:
+            return self._run(cursor, statement, values, many, prepared, copy)
+
+        started = time.perf_counter()
+        try:
+            self._run(cursor, statement, values, many, prepared, copy)
+        except Exception as e:
+            instrumentation.emit(cursor, statement, values, many, model, operation, time.perf_counter() - started,
+                                 probe, e)
+            raise
+        instrumentation.emit(cursor, statement, values, many, model, operation, time.perf_counter() - started, probe)
+
+    def add_listener(self, listener):
+        """Registers callable receiving QueryEvent of every statement, returns it so it can be used as decorator"""
+        return self.instrumentation.add(listener)
+
+    def remove_listener(self, listener):
+        self.instrumentation.remove(listener)
+
+    def reload_schema(self):
+        with self.cursor() as cursor:
+            self.execute(cursor, SchemaCatalog.QUERY, operation="reload_schema", probe=True)
+            self.schema.tables = {row[0] for row in cursor.fetchall()}
+        self._schema_changed()
+
+    def invalidate_schema(self, tablename=None):
+        self.schema.invalidate(tablename)
+        self._schema_changed()
+
+    def table_created(self, tablename):
+        self.schema.add(tablename)
+        self._schema_changed()
+
+    def _run(self, cursor, statement, values, many, prepared, copy):
+        if copy is not None:
+            cursor.copy_expert(statement, *copy)
+        elif prepared and self.prepared is not None:
+            self.prepared.execute(cursor, statement, values)
+        elif many:
+            cursor.executemany(statement, values)
+        else:
+            cursor.execute(statement, values)
+
+    def _schema_changed(self):
+        if self.prepared is not None:
+            self.prepared.invalidate()
@@ -2,4 +2,5 @@ class ORMError(Exception): pass
 class TowelOperationalError(ORMError): pass
 class TowelAttributeError(ORMError): pass
 class TowelValueError(ORMError): pass
+class TowelNPlusOneWarning(UserWarning): pass
 
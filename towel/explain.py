@@ -0,0 +1,112 @@
+import json
+
+
+class PlanNode:
+    """Single node of a query plan, wraps the node object of EXPLAIN (FORMAT JSON) output"""
+    __slots__ = ("raw", "children")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.children = tuple(PlanNode(child) for child in raw.get("Plans", ()))
+
+    def __repr__(self):
+        relation = f" on {self.relation}" if self.relation else ""
+        return f"<{self.node_type}{relation} cost={self.total_cost} rows={self.rows}>"
+
+    def __iter__(self):
+        """The node and all nodes below it, depth first"""
+        yield self
+        for child in self.children:
+            yield from child
+
+    @property
+    def node_type(self):
+        return self.raw["Node Type"]
+
+    @property
+    def relation(self):
+        return self.raw.get("Relation Name")
+
+    @property
+    def total_cost(self):
+        return self.raw["Total Cost"]
+
+    @property
+    def actual_time(self):
+        """Milliseconds spent in the node and below it per loop, None unless the plan was analyzed"""
+        return self.raw.get("Actual Total Time")
+
+    @property
+    def rows(self):
+        """Rows returned by the node, actual ones if the plan was analyzed, otherwise the estimate"""
+        return self.raw.get("Actual Rows", self.raw["Plan Rows"])
+
+    @property
+    def rows_scanned(self):
+        """Rows read by the node before its filter, known only for analyzed plans"""
+        if "Actual Rows" not in self.raw:
+            return None
+        return (self.raw["Actual Rows"] + self.raw.get("Rows Removed by Filter", 0)) * self.raw.get("Actual Loops", 1)
+
+
+class Plan:
+    """Query plan returned by QuerySet.explain().
+
+    Table sizes are row counts of tables read by sequential scans, estimated by planner statistics
+    when the plan was taken, sequential_scans() uses them to tell large tables from small ones"""
+    LARGE_TABLE = 10000
+
+    def __init__(self, raw, statement, table_sizes=None):
+        self.raw = raw
+        self.statement = statement
+        self.root = PlanNode(raw["Plan"])
+        self.table_sizes = table_sizes or {}
+
+    @classmethod
+    def from_json(cls, output, statement, table_sizes=None):
+        """Plan from the single row of EXPLAIN (FORMAT JSON), already decoded by psycopg2 or as text"""
+        if isinstance(output, str):
+            output = json.loads(output)
+        return cls(output[0], statement, table_sizes)
+
+    def __repr__(self):
+        return f"<Plan cost={self.total_cost} rows={self.rows} actual_time={self.actual_time}>"
+
+    def __iter__(self):
+        return iter(self.root)
+
+    @property
+    def analyzed(self):
+        return "Execution Time" in self.raw
+
+    @property
+    def total_cost(self):
+        return self.root.total_cost
+
+    @property
+    def actual_time(self):
+        """Execution time in milliseconds, None unless the plan was analyzed"""
+        return self.raw.get("Execution Time")
+
+    @property
+    def planning_time(self):
+        return self.raw.get("Planning Time")
+
+    @property
+    def rows(self):
+        return self.root.rows
+
+    @property
+    def buffers(self):
+        """Shared buffers hit and read by the whole statement, None unless explained with buffers"""
+        if "Shared Hit Blocks" not in self.root.raw:
+            return None
+        return {"hit": self.root.raw["Shared Hit Blocks"], "read": self.root.raw["Shared Read Blocks"]}
+
+    def scanned_tables(self):
+        return {node.relation for node in self if node.node_type == "Seq Scan"}
+
+    def sequential_scans(self, min_rows=LARGE_TABLE):
+        """Sequential scan nodes reading tables of at least min_rows rows"""
+        return [node for node in self if node.node_type == "Seq Scan" and
+                max(self.table_sizes.get(node.relation, 0), node.rows_scanned or 0) >= min_rows]
@@ -0,0 +1,23 @@
+from .lru import LRUCache
+
+
+class IdentityMap(LRUCache):
+    """LRU cache of model instances keyed by (model, id). Shared by all managers of a Database"""
+
+    def get(self, model, pk):
+        return super().get((model, pk))
+
+    def add(self, instance):
+        self.set((instance.__class__, instance._values[instance.__columns__.index["id"]]), instance)
+
+    def discard(self, model, pk):
+        super().discard((model, pk))
+
+    def invalidate(self, model=None):
+        """Drops every cached instance of the model, or the whole map if model is not given"""
+        if model is None:
+            self.clear()
+            return
+        with self._lock:
+            for key in [key for key in self._entries if key[0] is model]:
+                del self._entries[key]
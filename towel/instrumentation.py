@@ -0,0 +1,171 @@
+import contextvars
+import logging
+import threading
+import warnings
+from collections import Counter, deque, namedtuple
+from contextlib import contextmanager
+
+from psycopg2 import sql
+
+from .errors import TowelNPlusOneWarning, TowelOperationalError
+
+logger = logging.getLogger("towel.queries")
+
+
+class QueryEvent(namedtuple("QueryEvent", ("statement", "params", "model", "operation", "duration", "rows",
+                                           "probe", "error"))):
+    """Single statement run by the ORM. Duration is wall time in seconds, rows is the row count reported by
+    the cursor, or None if the statement failed. Probe marks statements the caller didn't ask for explicitly,
+    such as table existence checks and lazy loads of related entities or deferred columns"""
+    __slots__ = ()
+
+
+class Instrumentation:
+    """Listeners of a database, called with QueryEvent of every statement sent through its execute().
+    Without listeners statements run without any bookkeeping"""
+
+    def __init__(self):
+        self.listeners = ()
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.listeners)
+
+    def add(self, listener):
+        with self._lock:
+            self.listeners += (listener,)
+        return listener
+
+    def remove(self, listener):
+        with self._lock:
+            # bound methods are created on every attribute access and compare equal, not identical
+            self.listeners = tuple(known for known in self.listeners if known != listener)
+
+    def emit(self, cursor, statement, values, many, model, operation, duration, probe, error=None):
+        event = QueryEvent(self.text(cursor, statement), self.count(values, many),
+                           None if model is None else model.tablename(), operation, duration,
+                           None if error is not None or cursor.rowcount < 0 else cursor.rowcount, probe, error)
+        for listener in self.listeners:
+            listener(event)
+
+    @staticmethod
+    def text(cursor, statement):
+        if isinstance(statement, bytes):
+            return statement.decode(errors="replace")
+        if isinstance(statement, sql.Composable):
+            return statement.as_string(cursor)
+        return statement
+
+    @staticmethod
+    def count(values, many):
+        if not values:
+            return 0
+        return sum(len(row) for row in values) if many else len(values)
+
+
+class SlowQueryLog:
+    """Listener logging statements slower than threshold seconds as warnings"""
+
+    def __init__(self, threshold=0.1, log=logger):
+        self.threshold = threshold
+        self.log = log
+
+    def __call__(self, event):
+        if event.duration >= self.threshold:
+            self.log.warning("Slow query %.1f ms, %s.%s, %s rows%s: %s", event.duration * 1000, event.model,
+                             event.operation, event.rows, " (probe)" if event.probe else "", event.statement)
+
+
+class NPlusOneDetector:
+    """Development listener counting statements per logical operation, a block of operation().
+
+    Statement shape, its text without parameter values, run threshold times within one operation is reported
+    as N+1 pattern, typically a related entity or deferred column loaded row by row. Reported with
+    TowelNPlusOneWarning, or TowelOperationalError raised from the offending statement if raise_error is set.
+    Operations are tracked per thread and asyncio task"""
+    HINTS = {"related": ", load related entities with select_related() or prefetch_related()",
+             "load_deferred": ", select the column instead of deferring it",
+             "get": ", fetch the instances with get_many()"}
+
+    def __init__(self, threshold=5, raise_error=False):
+        self.threshold = threshold
+        self.raise_error = raise_error
+        self._shapes = contextvars.ContextVar(f"towel_n_plus_one_{id(self)}", default=None)
+
+    @contextmanager
+    def operation(self):
+        """Block counted as one logical operation, yields Counter of its statements keyed by (model, statement)"""
+        token = self._shapes.set(Counter())
+        try:
+            yield self._shapes.get()
+        finally:
+            self._shapes.reset(token)
+
+    def __call__(self, event):
+        shapes = self._shapes.get()
+        if shapes is None:
+            return
+
+        shape = (event.model, event.statement)
+        shapes[shape] += 1
+        if shapes[shape] == self.threshold:
+            message = (f"Statement of {event.model}.{event.operation} ran {self.threshold} times in one operation"
+                       f"{self.HINTS.get(event.operation, '')}: {event.statement}")
+            if self.raise_error:
+                raise TowelOperationalError(message)
+            warnings.warn(message, TowelNPlusOneWarning, stacklevel=2)
+
+
+class QueryMetrics:
+    """Listener counting calls and latency of statements per model.
+    Quantiles are computed over the last window statements of each model"""
+    QUANTILES = (0.5, 0.99)
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.calls = {}
+        self.seconds = {}
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        model = event.model or ""
+        with self._lock:
+            if model not in self.calls:
+                self.calls[model], self.seconds[model] = 0, 0.0
+                self._latencies[model] = deque(maxlen=self.window)
+            self.calls[model] += 1
+            self.seconds[model] += event.duration
+            self._latencies[model].append(event.duration)
+
+    def quantile(self, model, q):
+        with self._lock:
+            return self._quantile(sorted(self._latencies.get(model, ())), q)
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.seconds.clear()
+            self._latencies.clear()
+
+    def render(self):
+        """Counters as a summary in Prometheus text exposition format"""
+        with self._lock:
+            snapshot = [(model, self.calls[model], self.seconds[model], sorted(self._latencies[model]))
+                        for model in sorted(self.calls)]
+
+        lines = ["# HELP towel_query_seconds Latency of statements run by the ORM, per model",
+                 "# TYPE towel_query_seconds summary"]
+        for model, calls, seconds, latencies in snapshot:
+            label = 'model="' + model.replace("\\", "\\\\").replace('"', '\\"') + '"'
+            for q in self.QUANTILES:
+                lines.append(f'towel_query_seconds{{{label},quantile="{q}"}} {self._quantile(latencies, q)!r}')
+            lines.append(f"towel_query_seconds_sum{{{label}}} {seconds!r}")
+            lines.append(f"towel_query_seconds_count{{{label}}} {calls}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _quantile(latencies, q):
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
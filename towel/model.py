@@ -1,5 +1,65 @@
-from . import TowelAttributeError, Column, ObjectManager, Integer, ForeignKey
+from . import TowelAttributeError, TowelValueError, Column, ObjectManager, Integer, ForeignKey
+from .columns import ColumnRegistry, ColumnValue, DEFERRED, Index
 from collections import namedtuple
+from inspect import isawaitable
+from types import MethodType
+
+
+class hybridmethod:
+    """Method bound to the class when accessed on a class and to the instance when accessed on an instance"""
+
+    def __init__(self, for_class, for_instance=None):
+        self.for_class = for_class
+        self.for_instance = for_instance
+
+    def instancemethod(self, for_instance):
+        self.for_instance = for_instance
+        return self
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return MethodType(self.for_class, owner)
+        return MethodType(self.for_instance, instance)
+
+
+class RelatedEntity:
+    """Exposes foreign model class on the model and related entity on its instances.
+    Entity is fetched on first access and cached on the instance until foreign key value changes"""
+
+    def __init__(self, column):
+        self.column = column
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self.column.foreign_entity
+
+        name = self.column.entity_name
+        cache = instance._related
+        if cache is not None and name in cache:
+            return cache[name]
+
+        pk = instance._get(instance.__columns__.index[self.column.column_name])
+        entity = None if pk is None else self.column.foreign_entity.objects()._get_one(pk, "related", probe=True)
+        if isawaitable(entity):
+            return self._load(instance, entity)
+        self.cache(instance, entity)
+        return entity
+
+    def __set__(self, instance, entity):
+        if entity is not None and not isinstance(entity, self.column.foreign_entity):
+            raise TowelValueError(f"{entity} is not instance of {self.column.foreign_entity.__name__}")
+
+        self.column.__set__(instance, None if entity is None else entity.id.value)
+        self.cache(instance, entity)
+
+    def cache(self, instance, entity):
+        instance._cache_related(self.column.entity_name, entity)
+
+    async def _load(self, instance, pending):
+        """Caches entity fetched by asynchronous manager once it is awaited"""
+        entity = await pending
+        self.cache(instance, entity)
+        return entity
 
 
 class MetaModel(type):
@@ -22,82 +82,130 @@ class MetaModel(type):
                         isinstance(col, Column) and issubclass(col.field_class, ForeignKey)]
             if any(foreigns):
                 for col in foreigns:
-                    body[col.entity_name] = col.foreign_entity
+                    body[col.entity_name] = RelatedEntity(col)
+
+        body.setdefault("__slots__", ())
+        body["__columns__"] = ColumnRegistry.build(cls._collect_columns(bases, body).values())
+        if name != "AbstractBaseModel":
+            body["__indexes__"] = cls._collect_indexes(body, body["__columns__"])
 
         return super().__new__(cls, name, bases, body)
 
+    @staticmethod
+    def _collect_columns(bases, body):
+        """Columns of the new model keyed by name, inherited ones first so body can override them"""
+        columns = {}
+        for base in reversed(bases):
+            for klass in reversed(base.__mro__):
+                registry = klass.__dict__.get("__columns__")
+                if registry:
+                    columns.update((col.column_name, col) for col in registry.columns)
+
+        columns.update((key, value) for key, value in body.items() if isinstance(value, Column))
+        return columns
+
+    @staticmethod
+    def _collect_indexes(body, registry):
+        """Named indexes of the model: columns declared with index or unique, indexes listed in __indexes__
+        and one for every foreign key which is not the leading column of another index"""
+        declared = tuple(body.get("__indexes__", ()))
+        if not all(isinstance(index, Index) for index in declared):
+            raise TowelAttributeError("__indexes__ should contain only Index declarations")
+
+        indexes = [Index(col.column_name, unique=col.unique) for col in registry.columns
+                   if (col.index or col.unique) and col is not registry.primary_key]
+        indexes.extend(declared)
+        leading = {index.names[0] for index in indexes}
+        indexes.extend(Index(col.column_name) for col in registry.foreign_keys if col.column_name not in leading)
+
+        named = {}
+        for index in indexes:
+            index = index.named(body["__tablename__"])
+            missing = [column for column in index.names if column not in registry]
+            if missing:
+                raise TowelAttributeError(f"Index {index.name} refers to unknown columns {', '.join(missing)}")
+            if index.name in named:
+                raise TowelAttributeError(f"Index {index.name} is declared twice, give one of them a name")
+            named[index.name] = index
+        return tuple(named.values())
+
 
 class AbstractBaseModel(metaclass=MetaModel):
+    __slots__ = ("_values", "_related")
     __tablename__ = None
     _objects = ObjectManager
     id = Column(Integer)
 
     def __init__(self, **kwargs):
-        kwargs["id"] = kwargs.get("id", None)
-        for key in kwargs:
-            if key not in dir(self):
+        registry = self.__columns__
+        values = list(registry.defaults)
+        for key, value in kwargs.items():
+            position = registry.index.get(key)
+            if position is None:
                 raise TowelAttributeError(f'"{key} is not defined in {self.__class__.__name__}"')
-            else:
-                inst = getattr(self, key)
-                if isinstance(inst, Column):
-                    column = inst.create_duplicate()
-                    column.value = kwargs.get(key)
-                    setattr(self, key, column)
-
-        if isinstance(self._objects, type):
-            self._objects = self._objects(self)
-        else:
-            self._objects = self._objects.__class__(self)
-        self.objects = self._objects_placeholder
-        self.columns = self._columns_placeholder
-
-        foreigns = [col for col in self.columns() if issubclass(col.field_class, ForeignKey)]
-        if any(foreigns):
-            for col in foreigns:
-                entity = col.foreign_entity.objects().get(col.value)
-                setattr(self, col.entity_name, entity)
+            values[position] = registry.columns[position].validate(value)
+
+        self._init_row(values)
+
+    def _init_row(self, values):
+        self._values = values
+        self._related = None
 
     def __str__(self):
         return (self.__class__.__name__ + "(" +
-                ", ".join(key + "=" + str(getattr(self, key).value) for key in dir(self)
-                          if isinstance(getattr(self, key), Column)) + ")")
+                ", ".join(name + "=" + str(value) for name, value in zip(self.__columns__.names, self._values)) + ")")
 
-    @classmethod
+    @hybridmethod
     def columns(cls):
-        for item in dir(cls):
-            instance = getattr(cls, item)
-            if isinstance(instance, Column):
-                yield instance
+        return cls.__columns__.columns
+
+    @columns.instancemethod
+    def columns(self):
+        return tuple(ColumnValue(col, self) for col in self.__columns__.columns)
 
     @classmethod
     def from_namedtuple(cls, nt):
-        params = {col.column_name: getattr(nt, col.column_name) for col in cls.columns()}
-        return cls(**params)
+        return cls.from_values(list(cls.__columns__.row_getter(nt)))
+
+    @classmethod
+    def from_values(cls, values):
+        """Builds instance from trusted database values listed in registry order, skipping validation"""
+        instance = cls.__new__(cls)
+        instance._init_row(values)
+        return instance
+
+    def _get(self, position):
+        """Value at given registry position, loading deferred columns when it wasn't selected"""
+        value = self._values[position]
+        if value is DEFERRED:
+            value = self.__class__.objects()._fetch_deferred(self)[position]
+        return value
+
+    def _cache_related(self, name, entity):
+        if self._related is None:
+            self._related = {}
+        self._related[name] = entity
 
     def as_namedtuple(self):
-        nt = namedtuple(self.__class__.__name__, [c.column_name for c in self.columns()])
-        for c in self.columns():
-            setattr(nt, c.column_name, c.value)
+        names = self.__columns__.names
+        nt = namedtuple(self.__class__.__name__, names)
+        for position, name in enumerate(names):
+            setattr(nt, name, self._get(position))
         return nt
 
     @classmethod
     def tablename(cls):
         return cls.__tablename__
 
-    @classmethod
+    @hybridmethod
     def objects(cls):
-        if isinstance(cls._objects, type):
-            cls._objects = cls._objects(cls)
-        cls._objects.model = cls
-        return cls._objects
-
-    def _objects_placeholder(self):
-        """Is needed to re-reference object attribute for instances of class"""
-        return self._objects
-
-    def _columns_placeholder(self):
-        """Is needed to re-reference columns attribute for instances of class"""
-        for item in dir(self):
-            instance = getattr(self, item)
-            if isinstance(instance, Column):
-                yield instance
+        manager = cls.__dict__.get("_objects")
+        if not isinstance(manager, ObjectManager):
+            manager_class = cls._objects if isinstance(cls._objects, type) else cls._objects.__class__
+            manager = cls._objects = manager_class(cls)
+        return manager
+
+    @objects.instancemethod
+    def objects(self):
+        """Lightweight handle sharing class-level manager's cursor, created on demand"""
+        return self.__class__.objects().bind(self)
@@ -1,225 +1,586 @@
+import itertools
 import psycopg2
-from collections import namedtuple
 from psycopg2 import sql
 import psycopg2.extras
 import psycopg2.errors
 
-from . import TowelOperationalError, TowelAttributeError, SQL, TowelValueError
-
-ident = sql.Identifier
+from . import TowelOperationalError, TowelAttributeError, SQL, TowelValueError, QuerySet
+from .columns import DEFERRED
+from .copy_stream import CopyStream
 
 
 class ObjectManager:
-    where_clause = None
-    where_values = []
-    join_table = None
-    if_join = False
-    join_clause = None
+    query_class = QuerySet
+    _cursor_names = itertools.count()
 
     def __init__(self, model):
         self.model = model
-        self.connection = model.db.connection
-        self.cursor = self.connection.cursor(cursor_factory=psycopg2.extras.NamedTupleCursor)
 
-    def create_table(self):
-        self.cursor.execute(SQL.create_table(self.model))
-        self.connection.commit()
+    @property
+    def db(self):
+        return self.model.db
+
+    @property
+    def model_class(self):
+        return self.model if isinstance(self.model, type) else self.model.__class__
+
+    def bind(self, instance):
+        """Manager for operations on a single instance"""
+        return self.__class__(instance)
 
-    def save(self):
+    def query(self):
+        """Unfiltered QuerySet over the model class"""
+        return self.query_class(self.model_class)
+
+    def create_table(self):
+        """Creates the table together with its indexes"""
+        with self.db.cursor() as cursor:
+            self._execute(cursor, SQL.create_table(self.model), operation="create_table")
+            for index in self.model.__indexes__:
+                self._execute(cursor, SQL.create_index(self.model, index), operation="create_table")
+        self.db.commit()
+        self.db.table_created(self.model.tablename())
+
+    def create_indexes(self, concurrently=False):
+        """Creates declared indexes of an existing table, already existing ones are skipped.
+        Concurrent build doesn't block writes, it runs outside of transaction in autocommit mode"""
+        self._create_indexes(self.model.__indexes__, concurrently)
+
+    def ensure_schema(self, concurrently=False):
+        """Creates the table if it doesn't exist, otherwise only indexes missing on it.
+        Returns names of created indexes"""
         if not self.table_exists:
             self.create_table()
+            return [index.name for index in self.model.__indexes__]
+
+        with self.db.cursor() as cursor:
+            self._execute(cursor, SQL.INDEXES, (self.model.tablename(),), operation="ensure_schema", probe=True)
+            existing = {row.indexname for row in cursor.fetchall()}
+        missing = [index for index in self.model.__indexes__ if index.name not in existing]
+        self._create_indexes(missing, concurrently)
+        return [index.name for index in missing]
+
+    def save(self, on_conflict="raise", conflict_target=("id",)):
+        """Inserts the instance with one statement. Instance with id set is inserted under that id.
+        Conflicts on conflict_target columns raise, are ignored or update the existing row,
+        whose id is then assigned to the instance"""
         self._raise_if_not_inst()
-        if self.model.id and self.model.id.value:
-            if self.get(self.model.id.value):
-                raise TowelOperationalError("Can't save model with duplicate id")
+        target = self._check_conflict(on_conflict, conflict_target)
+        if not self.table_exists:
+            self.create_table()
 
-        statement, values = SQL.save_model(self.model)
-        try:
-            self.cursor.execute(statement, values)
-        except psycopg2.errors.ForeignKeyViolation as e:
-            raise TowelAttributeError(str(e))
+        with_id = self.model.id.value is not None
+        with self.db.cursor() as cursor:
+            statement = SQL.compiled(cursor, "upsert", self.model, 1, with_id, on_conflict, target)
+            try:
+                with self.db.savepoint(cursor):
+                    self._execute(cursor, statement, SQL.row_values(self.model, with_id=with_id), prepared=True,
+                                  operation="save")
+                    row = cursor.fetchone()
+            except psycopg2.Error as e:
+                self._raise_write_error(e)
 
-        self.model.id.value = self.cursor.fetchone().id
+        if row is not None:
+            self.model.id.value = row.id
+        self._forget(self.model.id.value)
 
-    def save_from_namedtuple(self, iterator):
+    def bulk_save(self, instances, batch_size=1000):
+        """Inserts instances with one multi-row statement per batch and assigns generated ids back in order"""
+        instances = self._check_bulk_save(instances, batch_size)
         if not self.table_exists:
             self.create_table()
 
-        statement = SQL.save_model(self.model)[0]
-        try:
-            src = [[getattr(i, name.column_name) for name in self.model.columns() if name.column_name != "id"] for i in
-                   iterator]
-        except AttributeError as e:
-            raise TowelAttributeError(str(e))
-        self.cursor.executemany(statement, src)
+        with self.db.cursor() as cursor:
+            for start in range(0, len(instances), batch_size):
+                batch = instances[start:start + batch_size]
+                statement = SQL.compiled(cursor, "insert", self.model, len(batch))
+                try:
+                    self._execute(cursor, statement, SQL.row_values(*batch), operation="bulk_save")
+                except psycopg2.Error as e:
+                    self._raise_write_error(e)
 
-    def update(self, **kwargs):
-        if self.if_join:
-            raise TowelOperationalError("Towel currently doesn't support updating with join clause")
+                for inst, row in zip(batch, cursor.fetchall()):
+                    inst.id.value = row.id
+                    self._forget(row.id)
 
-        self._raise_if_table_doesnt_exist()
-        columns = tuple(col.column_name for col in self.model.columns())
-        if not all(column in columns for column in kwargs):
-            raise TowelAttributeError(f"Not all columns provided are defined in model {self.model.__class__.__name__}")
-        if "id" in kwargs:
-            raise TowelAttributeError("Can't update 'id' column")
+        return instances
 
-        def update_if_instance():
-            for key, value in kwargs.items():
-                try:
-                    setattr(getattr(self.model, key), "value", value)
-                except TowelValueError as e:
-                    raise e
+    def bulk_upsert(self, instances, on_conflict="update", conflict_target=("id",), batch_size=1000):
+        """Inserts instances resolving conflicts on conflict_target columns in the database, one statement per batch.
+        Ids of inserted or updated rows are assigned back, instances skipped by "ignore" keep their id"""
+        target = self._check_conflict(on_conflict, conflict_target)
+        instances = self._check_bulk_save(instances, batch_size, with_ids=True)
+        if not self.table_exists:
+            self.create_table()
 
+        with self.db.cursor() as cursor:
             try:
-                self.cursor.execute(*SQL.update(self.model, **kwargs))
+                with self.db.savepoint(cursor):
+                    for with_id, batch in self._upsert_batches(instances, batch_size):
+                        statement = SQL.compiled(cursor, "upsert", self.model, len(batch), with_id, on_conflict,
+                                                 target)
+                        self._execute(cursor, statement, SQL.row_values(*batch, with_id=with_id),
+                                      operation="bulk_upsert")
+                        self._assign_ids(batch, cursor.fetchall(), with_id, target)
             except psycopg2.Error as e:
-                raise TowelOperationalError(f"{str(e)} was raised during update")
+                self._raise_write_error(e)
 
-        def update_if_class():
-            try:
-                self.model(**kwargs)
-            except TowelValueError as e:
-                raise e
+        return instances
+
+    def bulk_update(self, instances, fields, batch_size=1000):
+        """Writes given fields of instances with one UPDATE ... FROM (VALUES ...) statement per batch.
+        Returns number of updated rows"""
+        instances, fields = self._check_bulk_update(instances, fields, batch_size)
 
-            statement, values = self._concatenate_where_clause(*SQL.update(self.model, **kwargs))
+        updated = 0
+        with self.db.cursor() as cursor:
+            for start in range(0, len(instances), batch_size):
+                batch = instances[start:start + batch_size]
+                statement = SQL.compiled(cursor, "bulk_update", self.model, fields, len(batch))
+                try:
+                    self._execute(cursor, statement, SQL.bulk_update_values(fields, *batch), operation="bulk_update")
+                except psycopg2.Error as e:
+                    raise TowelOperationalError(f"{str(e)} was raised during update")
+                updated += cursor.rowcount
+
+        for inst in instances:
+            self._forget(inst.id.value)
+        return updated
+
+    def copy_from(self, iterable, size=8192):
+        """Streams instances, namedtuples or plain tuples into the table with COPY FROM STDIN.
+        Ids are generated by the database and are not assigned back. Returns number of copied rows"""
+        if not isinstance(self.model, type):
+            raise TowelValueError("Method can be applied only to model class")
+        if not self.table_exists:
+            self.create_table()
 
+        stream = CopyStream(self.model, iterable)
+        with self.db.cursor() as cursor:
             try:
-                self.cursor.execute(statement, values)
-            except psycopg2.Error as e:
-                raise TowelOperationalError(f"{str(e)} was raised during update")
+                self.db.execute(cursor, SQL.compiled(cursor, "copy_from", self.model), model=self.model_class,
+                                operation="copy_from", copy=(stream, size))
+            except psycopg2.errors.QueryCanceled:
+                if stream.error is not None:
+                    raise stream.error from None
+                raise
+            except psycopg2.errors.ForeignKeyViolation as e:
+                raise TowelAttributeError(str(e))
+            except psycopg2.errors.UndefinedTable:
+                self.db.invalidate_schema()
+                raise TowelOperationalError("Table doesn't exist")
+            return cursor.rowcount
 
-        if not isinstance(self.model, type):
-            update_if_instance()
-        else:
-            update_if_class()
+    def save_from_namedtuple(self, iterator):
+        if not self.table_exists:
+            self.create_table()
 
-    def remove(self):
-        self._raise_if_table_doesnt_exist()
+        statement = SQL.insert(self.model)
+        try:
+            names = self.model.__columns__.insertable_names
+            src = [[getattr(i, name) for name in names] for i in iterator]
+        except AttributeError as e:
+            raise TowelAttributeError(str(e))
 
-        if not isinstance(self.model, type):
-            try:
-                self.cursor.execute(*SQL.remove_by_id(self.model))
-            except psycopg2.Error as e:
-                raise TowelOperationalError(f"{str(e)} was raised during remove")
-        else:
-            values = []
-            statement, values = self._concatenate_where_clause(SQL.remove(self.model), values,
-                                                               for_join_remove=self.if_join)
+        with self.db.cursor() as cursor:
+            self._execute(cursor, statement, src, many=True, operation="save_from_namedtuple")
 
-            self.cursor.execute(statement, values)
+    def update(self, **kwargs):
+        if isinstance(self.model, type):
+            self.query().update(**kwargs)
+            return
+
+        self._check_update(kwargs)
+        for key, value in kwargs.items():
+            setattr(self.model, key, value)
+
+        try:
+            with self.db.cursor() as cursor:
+                self._execute(cursor, SQL.compiled(cursor, "update_columns_by_id", self.model, tuple(kwargs)),
+                              list(kwargs.values()) + [self.model.id.value], prepared=True, operation="update")
+        except psycopg2.Error as e:
+            raise TowelOperationalError(f"{str(e)} was raised during update")
+        self._forget(self.model.id.value)
+
+    def remove(self):
+        if isinstance(self.model, type):
+            self.query().remove()
+            return
+
+        try:
+            with self.db.cursor() as cursor:
+                self._execute(cursor, SQL.compiled(cursor, "remove_one", self.model), (self.model.id.value,),
+                              prepared=True, operation="remove")
+        except psycopg2.Error as e:
+            raise TowelOperationalError(f"{str(e)} was raised during remove")
+        self._forget(self.model.id.value)
 
     def get_all(self, limit=None):
-        self._raise_if_table_doesnt_exist()
-        if limit is not None and (not isinstance(limit, int) or limit < 0):
-            raise TowelAttributeError("Limit cannot be negative or non-int")
+        return self.query().get_all(limit)
 
-        statement = SQL.select_all(self.model)
+    def iterate(self, chunk_size=1000, instances=False):
+        return self.query().iterate(chunk_size, instances)
 
-        values = []
-        statement, values = self._concatenate_where_clause(statement, values, limit)
+    def all(self):
+        return self.query().all()
 
-        self.cursor.execute(statement, values)
-        return self.cursor.fetchall()
+    def load_deferred(self):
+        """Loads columns of the instance left out by only()/defer()"""
+        self._raise_if_not_inst()
+        if self._deferred_names(self.model):
+            self._fetch_deferred(self.model)
 
-    def get(self, pk):
-        self._raise_if_table_doesnt_exist()
-        self.cursor.execute(SQL.get(self.model), (pk,))
-        result = self.cursor.fetchone()
-        if not result:
-            return None
-        return self.model.from_namedtuple(result)
+    def get_many(self, pks):
+        """Instances with given ids fetched in one round trip, in order of requested ids.
+        Ids which don't exist are skipped"""
+        pks = list(dict.fromkeys(pks))
+        found = {instance.id.value: instance for instance in self._fetch_many(pks)} if pks else {}
+        return [found[pk] for pk in pks if pk in found]
 
     def filter(self, column, operator, value):
-        if operator not in SQL.OPERATORS:
-            raise TowelAttributeError(f"{operator} is illegal SQL operator ({' '.join(SQL.OPERATORS)})")
+        return self.query().filter(column, operator, value)
 
-        if "__" not in column:
-            self._simple_filter(column, operator, value)
-        else:
-            self._join_filter(column, operator, value)
+    def select_related(self, *columns):
+        return self.query().select_related(*columns)
 
-        return self
+    def prefetch_related(self, *columns):
+        return self.query().prefetch_related(*columns)
 
-    @property
-    def table_empty(self):
-        self.cursor.execute(sql.SQL("SELECT COUNT(*) FROM {};").format(sql.Identifier(self.model.tablename())))
-        return bool(self.cursor.fetchone()[0])
+    def count(self):
+        return self.query().count()
 
-    @property
-    def table_exists(self):
-        self.cursor.execute(sql.SQL("SELECT to_regclass('public.{}');").format(sql.Identifier(self.model.tablename())))
-        return self.cursor.fetchone()[0] == self.model.tablename()
+    def exists(self):
+        return self.query().exists()
 
-    def _join_filter(self, column, operator, value):
-        try:
-            self.foreign_column, join_column = column.split("__")
-        except ValueError:
-            raise TowelValueError(f"{column} is not valid column name for filtering")
+    def aggregate(self, **aggregates):
+        return self.query().aggregate(**aggregates)
+
+    def group_by(self, *columns):
+        return self.query().group_by(*columns)
+
+    def only(self, *columns):
+        return self.query().only(*columns)
+
+    def defer(self, *columns):
+        return self.query().defer(*columns)
 
-        # get instance of join model
-        model_foreign_column = getattr(self.model, self.foreign_column)
-        foreign_inst = model_foreign_column.foreign_entity
-        self.join_table = foreign_inst.tablename()
+    def values_list(self, *columns, flat=False):
+        return self.query().values_list(*columns, flat=flat)
 
-        if not self.join_clause:
-            self.join_clause = sql.SQL(" inner join {} on ").format(ident(self.join_table)) + SQL.construct_join_clause(
-                self.join_table,
-                self.model.tablename(),
-                model_foreign_column.column_name)
+    def order_by(self, *columns):
+        return self.query().order_by(*columns)
 
-        self.where_values.append(value)
-        statement = SQL.filter(foreign_inst, join_column, operator)
+    def limit(self, rows):
+        return self.query().limit(rows)
 
-        self._append_where_value(statement)
-        self.if_join = True
+    def offset(self, rows):
+        return self.query().offset(rows)
 
-    def _simple_filter(self, column, operator, value):
-        if not any(column == item.column_name for item in self.model.columns()):
-            raise TowelAttributeError(f"{column} is not defined in model {self.model.__name__}")
+    def paginate(self, after=None, size=100):
+        return self.query().paginate(after, size)
 
-        self.where_values.append(value)
+    def get(self, pk):
+        return self._get_one(pk)
+
+    def _get_one(self, pk, operation="get", probe=False):
+        identity_map = self.db.identity_map
+        if identity_map is not None:
+            instance = identity_map.get(self.model_class, pk)
+            if instance is not None:
+                return instance
+
+        with self.db.cursor() as cursor:
+            self._execute(cursor, SQL.compiled(cursor, "get", self.model), (pk,), prepared=True, operation=operation,
+                          probe=probe)
+            result = cursor.fetchone()
+        if not result:
+            return None
 
-        statement = SQL.filter(self.model, column, operator)
+        instance = self.model.from_namedtuple(result)
+        if identity_map is not None:
+            identity_map.add(instance)
+        return instance
+
+    @property
+    def table_empty(self):
+        return not self.query().exists()
+
+    def estimated_count(self):
+        """Row count estimated by planner statistics, without scanning the table.
+        Counts rows exactly if the table was never analyzed"""
+        with self.db.cursor() as cursor:
+            self._execute(cursor, SQL.ESTIMATED_COUNT, (self.model.tablename(),), operation="estimated_count")
+            row = cursor.fetchone()
+        if row is None:
+            raise TowelOperationalError("Table doesn't exist")
+        return row[0] if row[0] >= 0 else self.count()
 
-        self._append_where_value(statement)
+    @property
+    def table_exists(self):
+        """Consults schema catalog of the database, probes the server only for tables it doesn't know about"""
+        tablename = self.model.tablename()
+        if tablename in self.db.schema:
+            return True
+
+        with self.db.cursor() as cursor:
+            self._execute(cursor, sql.SQL("SELECT to_regclass('public.{}');").format(sql.Identifier(tablename)),
+                          operation="table_exists", probe=True)
+            exists = cursor.fetchone()[0] == tablename
+        if exists:
+            self.db.schema.add(tablename)
+        return exists
+
+    def _create_indexes(self, indexes, concurrently):
+        with (self.db.autocommit() if concurrently else self.db.checkout()) as conn, conn.cursor() as cursor:
+            for index in indexes:
+                self._execute(cursor, SQL.create_index(self.model, index, concurrently),
+                              operation="create_indexes")
+        if not concurrently:
+            self.db.commit()
+
+    def _execute(self, cursor, statement, values=None, many=False, prepared=False, operation=None, probe=False):
+        try:
+            self.db.execute(cursor, statement, values, many, prepared, self.model_class, operation, probe)
+        except psycopg2.errors.UndefinedTable:
+            # the failed statement aborts the transaction of the shared connection, pending work in it is lost
+            # and the connection fails until Database.rollback(), pooled ones are rolled back when returned
+            self.db.invalidate_schema()
+            raise TowelOperationalError("Table doesn't exist")
 
-    def _append_where_value(self, statement):
-        if self.where_clause:
-            self.where_clause += sql.SQL("and") + statement
+    def _stream(self, query, chunk_size, instances):
+        name = f"towel_{self.model.tablename()}_{next(self._cursor_names)}"
+        with self.db.checkout() as conn:
+            cursor = conn.cursor(name=name, cursor_factory=psycopg2.extras.NamedTupleCursor, withhold=conn.autocommit)
+            cursor.itersize = chunk_size
+            try:
+                self._execute(cursor, *query.compile(conn), operation="iterate")
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    if instances:
+                        yield from self._hydrate(rows, query.related_select, query.related_prefetch, query.names)
+                    else:
+                        yield from rows
+            finally:
+                cursor.close()
+
+    def _foreign_column(self, name):
+        registry = self.model.__columns__
+        if name not in registry or registry.columns[registry.index[name]].entity_name is None:
+            raise TowelAttributeError(f"{name} is not foreign key of model {self.model.__name__}")
+        return registry.columns[registry.index[name]]
+
+    def _hydrate(self, rows, select, prefetch, names=None):
+        instances = self._build(rows, select, names)
+        for col in prefetch:
+            self._prefetch(instances, col)
+        return instances
+
+    def _build(self, rows, select, names=None):
+        """Instances from rows, with entities of select_related() columns cut from the same rows.
+        Columns missing from names are left deferred"""
+        if names is None:
+            if not select:
+                return [self.model.from_namedtuple(row) for row in rows]
+            width, project = len(self.model.__columns__.names), None
         else:
-            self.where_clause = statement
+            width, project = len(names), self._projector(names)
+
+        instances = []
+        for row in rows:
+            inst = self.model.from_values(project(row) if project else list(row[:width]))
+            start = width
+            for col in select:
+                foreign = col.foreign_entity
+                end = start + len(foreign.__columns__.names)
+                values = row[start:end]
+                entity = None if values[foreign.__columns__.index["id"]] is None else \
+                    foreign.from_values(list(values))
+                inst._cache_related(col.entity_name, entity)
+                start = end
+            instances.append(inst)
+        return instances
+
+    def _projector(self, names):
+        """Callable placing values of selected columns into a row of deferred values"""
+        registry = self.model.__columns__
+        positions = [registry.index[name] for name in names]
+        template = [DEFERRED] * len(registry.names)
+
+        def values_of(row):
+            values = template.copy()
+            for position, value in zip(positions, row):
+                values[position] = value
+            return values
+
+        return values_of
+
+    def _deferred_names(self, instance):
+        return tuple(name for name, value in zip(instance.__columns__.names, instance._values) if value is DEFERRED)
+
+    def _fill_deferred(self, instance, names, row):
+        if row is None:
+            raise TowelOperationalError(f"Row with id {instance.id.value} doesn't exist anymore")
+        index = instance.__columns__.index
+        for name, value in zip(names, row):
+            instance._values[index[name]] = value
+        return instance._values
+
+    def _fetch_deferred(self, instance):
+        """Loads every deferred column of the instance with one query and returns its values"""
+        names = self._deferred_names(instance)
+        with self.db.cursor() as cursor:
+            self._execute(cursor, SQL.compiled(cursor, "get_columns", self.model, names),
+                          (instance._values[instance.__columns__.index["id"]],), prepared=True,
+                          operation="load_deferred", probe=True)
+            return self._fill_deferred(instance, names, cursor.fetchone())
+
+    def _prefetch(self, instances, column):
+        keys = self._related_keys(instances, column)
+        entities = column.foreign_entity.objects()._fetch_many(keys) if keys else []
+        self._attach(instances, column, entities)
+
+    def _related_keys(self, instances, column):
+        position = self.model.__columns__.index[column.column_name]
+        keys = {inst._values[position] for inst in instances}
+        keys.discard(None)
+        return keys
+
+    def _attach(self, instances, column, entities):
+        position = self.model.__columns__.index[column.column_name]
+        entities = {entity.id.value: entity for entity in entities}
+        for inst in instances:
+            inst._cache_related(column.entity_name, entities.get(inst._values[position]))
+
+    def _fetch_many(self, pks):
+        instances, missing = self._lookup(pks)
+        if missing:
+            instances.extend(self._remember(self._select_many(missing)))
+        return instances
+
+    def _lookup(self, pks):
+        """Instances found in identity map and ids which have to be fetched from the database"""
+        identity_map = self.db.identity_map
+        if identity_map is None:
+            return [], list(pks)
+
+        instances, missing = [], []
+        for pk in pks:
+            instance = identity_map.get(self.model_class, pk)
+            if instance is None:
+                missing.append(pk)
+            else:
+                instances.append(instance)
+        return instances, missing
+
+    def _remember(self, rows):
+        instances = [self.model.from_namedtuple(row) for row in rows]
+        identity_map = self.db.identity_map
+        if identity_map is not None:
+            for instance in instances:
+                identity_map.add(instance)
+        return instances
+
+    def _select_many(self, pks):
+        with self.db.cursor() as cursor:
+            self._execute(cursor, SQL.compiled(cursor, "get_many", self.model), (pks,), operation="get_many")
+            return cursor.fetchall()
+
+    def _forget(self, pk=None):
+        """Drops instance with given id, or every instance of the model, from identity map of the database"""
+        identity_map = self.db.identity_map
+        if identity_map is None:
+            return
+        if pk is None:
+            identity_map.invalidate(self.model_class)
+        else:
+            identity_map.discard(self.model_class, pk)
 
-    def _reset_where_attrs(self):
-        self.where_clause = None
-        self.where_values.clear()
-        self.join_table = None
-        self.if_join = False
-        self.join_clause = None
-        self.foreign_column = None
+    def _check_bulk_save(self, instances, batch_size, with_ids=False):
+        if not isinstance(self.model, type):
+            raise TowelValueError("Method can be applied only to model class")
+        if not isinstance(batch_size, int) or batch_size <= 0:
+            raise TowelAttributeError("Batch size should be positive int")
+
+        instances = list(instances)
+        for inst in instances:
+            if not isinstance(inst, self.model):
+                raise TowelValueError(f"{inst} is not instance of {self.model.__name__}")
+            if inst.id.value is not None and not with_ids:
+                raise TowelOperationalError("Can't bulk save model with id already set")
+        return instances
+
+    def _check_conflict(self, on_conflict, conflict_target):
+        if on_conflict not in SQL.ON_CONFLICT:
+            raise TowelAttributeError(f"{on_conflict} is illegal conflict resolution ({' '.join(SQL.ON_CONFLICT)})")
+
+        target = (conflict_target,) if isinstance(conflict_target, str) else tuple(conflict_target)
+        if not target or not all(column in self.model.__columns__ for column in target):
+            raise TowelAttributeError(f"Conflict target {conflict_target} is not a set of columns "
+                                      f"of model {self.model_class.__name__}")
+        return target
+
+    @staticmethod
+    def _upsert_batches(instances, batch_size):
+        """Batches of instances sharing statement shape, instances with id set are inserted under their ids"""
+        for with_id in (True, False):
+            group = [inst for inst in instances if (inst.id.value is not None) == with_id]
+            for start in range(0, len(group), batch_size):
+                yield with_id, group[start:start + batch_size]
+
+    def _assign_ids(self, batch, rows, with_id, target):
+        """Assigns ids returned by upsert. Rows are matched to instances by values of target columns,
+        rows of a batch inserted with generated ids can't conflict on a target including id and come back in order.
+        Instances with id set conflict on such target only with the row of the same id"""
+        if "id" in target:
+            if not with_id:
+                for inst, row in zip(batch, rows):
+                    inst.id.value = row.id
+        else:
+            positions = [self.model.__columns__.index[name] for name in target]
+            ids = {tuple(getattr(row, name) for name in target): row.id for row in rows}
+            for inst in batch:
+                pk = ids.get(tuple(inst._values[position] for position in positions))
+                if pk is not None:
+                    inst.id.value = pk
+
+        for inst in batch:
+            self._forget(inst.id.value)
+
+    def _raise_write_error(self, error):
+        if isinstance(error, psycopg2.errors.ForeignKeyViolation):
+            raise TowelAttributeError(str(error))
+        if isinstance(error, psycopg2.errors.UniqueViolation):
+            raise TowelOperationalError(f"Can't save model with duplicate key: {error.diag.message_detail}")
+        raise error
+
+    def _check_bulk_update(self, instances, fields, batch_size):
+        if not isinstance(self.model, type):
+            raise TowelValueError("Method can be applied only to model class")
+        if not isinstance(batch_size, int) or batch_size <= 0:
+            raise TowelAttributeError("Batch size should be positive int")
+
+        fields = tuple(fields)
+        if not fields:
+            raise TowelAttributeError("At least one field should be updated")
+        self._check_update(fields)
+
+        instances = list(instances)
+        for inst in instances:
+            if not isinstance(inst, self.model):
+                raise TowelValueError(f"{inst} is not instance of {self.model.__name__}")
+            if inst.id.value is None:
+                raise TowelOperationalError("Can't update model which was not saved")
+        return instances, fields
+
+    def _check_update(self, kwargs):
+        columns = self.model.__columns__
+        if not all(column in columns for column in kwargs):
+            raise TowelAttributeError(f"Not all columns provided are defined in model {self.model_class.__name__}")
+        if "id" in kwargs:
+            raise TowelAttributeError("Can't update 'id' column")
 
     def _raise_if_not_inst(self):
         if isinstance(self.model, type):
             raise TowelValueError("Method can be applied only to model instance")
-
-    def _raise_if_table_doesnt_exist(self):
-        if not self.table_exists:
-            raise TowelOperationalError("Table doesn't exist")
-
-    def _concatenate_where_clause(self, statement, values, limit=None, for_join_remove=False):
-        if self.where_clause:
-            if for_join_remove:
-                self.join_clause = sql.SQL(" using {} ").format(sql.Identifier(self.join_table))
-                self.where_clause += sql.SQL(" and ") + SQL.construct_join_clause(self.join_table,
-                                                                                  self.model.tablename(),
-                                                                                  self.foreign_column)
-            if self.if_join:
-                statement += self.join_clause
-            statement += sql.SQL(" where ") + self.where_clause
-            values.extend(self.where_values)
-        elif limit:
-            statement += SQL.LIMIT
-            values.append(limit)
-
-        self._reset_where_attrs()
-        return statement, values
@@ -0,0 +1,143 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+from . import TowelOperationalError, TowelAttributeError
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections.
+
+    Keeps at least minconn connections open and never more than maxconn. Checkout waits up to timeout seconds
+    when the pool is exhausted. Connections older than max_lifetime seconds are replaced, and connections idle
+    for longer than health_check_interval seconds are pinged before being handed out"""
+
+    def __init__(self, *args, minconn=1, maxconn=10, timeout=30.0, max_lifetime=3600.0,
+                 health_check_interval=30.0, connection_factory=psycopg2.connect, **kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise TowelAttributeError("Pool size should satisfy 0 <= minconn <= maxconn and maxconn >= 1")
+
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self._connect = lambda: connection_factory(*args, **kwargs)
+
+        self._idle = []
+        self._created = {}
+        self._returned = {}
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+        for _ in range(minconn):
+            self._size += 1
+            self._idle.append(self._open())
+
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise TowelOperationalError("Connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    conn = None
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    raise TowelOperationalError(f"Connection pool exhausted, waited {timeout}s")
+
+        try:
+            if conn is None:
+                return self._open()
+            if not self._healthy(conn):
+                self._discard(conn)
+                return self._open()
+            return conn
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def putconn(self, conn, discard=False):
+        if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        with self._condition:
+            if discard or self._closed or conn.closed or self._expired(conn):
+                self._discard(conn)
+                self._size -= 1
+            else:
+                self._returned[conn] = time.monotonic()
+                self._idle.append(conn)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._condition:
+            self._closed = True
+            for conn in self._idle:
+                self._discard(conn)
+            self._size -= len(self._idle)
+            self._idle.clear()
+            self._condition.notify_all()
+
+    @property
+    def stats(self):
+        with self._condition:
+            return {"size": self._size, "idle": len(self._idle), "minconn": self.minconn, "maxconn": self.maxconn}
+
+    def _open(self):
+        """New connection for a slot already counted in pool size"""
+        conn = self._connect()
+        now = time.monotonic()
+        self._created[conn] = now
+        self._returned[conn] = now
+        return conn
+
+    def _discard(self, conn):
+        """Closes connection, the caller decides whether its slot is released"""
+        self._created.pop(conn, None)
+        self._returned.pop(conn, None)
+        if not conn.closed:
+            conn.close()
+
+    def _expired(self, conn):
+        return self.max_lifetime is not None and time.monotonic() - self._created.get(conn, 0) > self.max_lifetime
+
+    def _healthy(self, conn):
+        if conn.closed or self._expired(conn):
+            return False
+        if self.health_check_interval is None or \
+                time.monotonic() - self._returned.get(conn, 0) < self.health_check_interval:
+            return True
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("select 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
@@ -0,0 +1,77 @@
+import hashlib
+import itertools
+import re
+import threading
+import weakref
+
+from psycopg2.extensions import encodings
+
+PLACEHOLDER = re.compile(r"%(s|%)")
+
+
+class PreparedStatements:
+    """Server-side prepared statements tracked per connection.
+
+    Each statement shape is PREPAREd once on a connection and then run with EXECUTE. Names carry a generation,
+    so statements are prepared again after a schema change, and bookkeeping is keyed by backend pid,
+    so they are prepared again after a reconnect. Statements of older generations are deallocated
+    on the next use of their connection"""
+    EXISTING = "select name from pg_prepared_statements where name = any(%s)"
+
+    def __init__(self):
+        self.generation = 0
+        self._connections = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def execute(self, cursor, statement, values):
+        encoding = encodings[cursor.connection.encoding]
+        if not isinstance(statement, bytes):
+            statement = (statement if isinstance(statement, str) else statement.as_string(cursor)).encode(encoding)
+        name = self.name(statement)
+
+        prepared = self._prepared(cursor)
+        if name not in prepared:
+            cursor.execute(f"prepare {name} as {self.to_positional(statement.decode(encoding))}")
+            prepared.add(name)
+
+        if values:
+            cursor.execute(f"execute {name} (" + ", ".join("%s" for _ in values) + ")", values)
+        else:
+            cursor.execute(f"execute {name}")
+
+    def invalidate(self):
+        """Makes every statement to be prepared again on its next use"""
+        with self._lock:
+            self.generation += 1
+
+    def name(self, statement):
+        return f"towel_{self.generation}_{hashlib.md5(statement).hexdigest()}"
+
+    @staticmethod
+    def to_positional(text):
+        """Converts psycopg2 placeholders to numbered parameters of PREPARE"""
+        counter = itertools.count(1)
+        return PLACEHOLDER.sub(lambda match: "%" if match.group(1) == "%" else f"${next(counter)}", text)
+
+    def _prepared(self, cursor):
+        connection = cursor.connection
+        pid = connection.get_backend_pid()
+        with self._lock:
+            known = self._connections.get(connection)
+            if known is not None and known[:2] == (pid, self.generation):
+                return known[2]
+            # statements of a previous backend are gone with it
+            stale = known[2] if known is not None and known[0] == pid else ()
+            prepared = set()
+            self._connections[connection] = (pid, self.generation, prepared)
+
+        if stale:
+            self._deallocate(cursor, stale)
+        return prepared
+
+    def _deallocate(self, cursor, names):
+        """Drops statements of older generations, skipping ones already deallocated outside of the ORM"""
+        cursor.execute(self.EXISTING, (list(names),))
+        existing = [row[0] for row in cursor.fetchall()]
+        if existing:
+            cursor.execute("; ".join(f"deallocate {name}" for name in existing))
@@ -0,0 +1,467 @@
+from collections import namedtuple
+from types import MappingProxyType
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import encodings
+
+from . import TowelOperationalError, TowelAttributeError, TowelValueError, SQL
+from .explain import Plan
+
+Condition = namedtuple("Condition", ["column", "operator", "value", "foreign"])
+
+
+class Param:
+    """Placeholder for a filter value which is supplied later with QuerySet.bind()"""
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"Param({self.name!r})"
+
+
+class QuerySet:
+    """Immutable query over a model class.
+
+    Every refinement returns a new QuerySet and never touches the original, so a query can be defined once at
+    import time and shared between threads. Statements are rendered once per shape of the query and operation,
+    and reused by every QuerySet of the same shape, only parameters are collected on each run"""
+    __slots__ = ("model", "conditions", "related_select", "related_prefetch", "projection", "grouping", "ordering",
+                 "limit_rows", "offset_rows", "after", "bindings")
+
+    WINDOWED = ("select", "values", "count", "exists")
+
+    def __init__(self, model, conditions=(), related_select=(), related_prefetch=(), projection=None, grouping=(),
+                 ordering=(), limit_rows=None, offset_rows=None, after=None, bindings=None):
+        self.model = model
+        self.conditions = conditions
+        self.related_select = related_select
+        self.related_prefetch = related_prefetch
+        self.projection = projection
+        self.grouping = grouping
+        self.ordering = ordering
+        self.limit_rows = limit_rows
+        self.offset_rows = offset_rows
+        self.after = after
+        self.bindings = MappingProxyType(bindings or {})
+
+    def __repr__(self):
+        conditions = ", ".join(f"{c.column} {c.operator} {c.value!r}" for c in self.conditions)
+        return f"<QuerySet {self.model.__name__} [{conditions}]>"
+
+    @property
+    def manager(self):
+        return self.model.objects()
+
+    @property
+    def names(self):
+        """Selected columns in registry order, or None when every column is selected.
+        Foreign keys of related entities are selected even if they were deferred"""
+        if self.projection is None:
+            return None
+        required = {col.column_name for col in self.related_select + self.related_prefetch}
+        return tuple(name for name in self.model.__columns__.names if name in self.projection or name in required)
+
+    @property
+    def shape(self):
+        """Everything the text of statements depends on. Values of filters, window and keyset are left out"""
+        return (self.model, tuple((c.column, c.operator, c.foreign) for c in self.conditions), self.related_select,
+                self.related_prefetch, self.projection, self.grouping, self.ordering, self.limit_rows is not None,
+                self.offset_rows is not None, self.after is not None)
+
+    @property
+    def joins(self):
+        """Foreign key columns the filters join on, in order of first use"""
+        return tuple(dict.fromkeys(c.foreign for c in self.conditions if c.foreign is not None))
+
+    def filter(self, column, operator, value):
+        if operator not in SQL.OPERATORS:
+            raise TowelAttributeError(f"{operator} is illegal SQL operator ({' '.join(SQL.OPERATORS)})")
+
+        foreign, name = self._column(column)
+        condition = Condition(name, operator, value, foreign)
+        if operator in SQL.ARRAY_OPERATORS and not isinstance(value, Param):
+            condition = condition._replace(value=self._array(value))
+        return self._replace(conditions=self.conditions + (condition,))
+
+    def select_related(self, *columns):
+        """Loads entities of given foreign key columns by joining their tables into the same query"""
+        return self._replace(related_select=self.related_select +
+                             tuple(self.manager._foreign_column(column) for column in columns))
+
+    def prefetch_related(self, *columns):
+        """Loads entities of given foreign key columns with one extra query per column"""
+        return self._replace(related_prefetch=self.related_prefetch +
+                             tuple(self.manager._foreign_column(column) for column in columns))
+
+    def only(self, *columns):
+        """Selects just given columns and id, the rest is loaded on first access"""
+        names = self._check_columns(columns)
+        return self._replace(projection=tuple(name for name in self.model.__columns__.names
+                                              if name == "id" or name in names))
+
+    def defer(self, *columns):
+        """Leaves given columns out of the select, they are loaded on first access"""
+        names = self._check_columns(columns)
+        if "id" in names:
+            raise TowelAttributeError("Can't defer 'id' column")
+        return self._replace(projection=tuple(name for name in self.projection or self.model.__columns__.names
+                                              if name not in names))
+
+    def group_by(self, *columns):
+        """Groups rows by given columns, including "fk__column" references, for annotate()"""
+        for column in columns:
+            self._column(column)
+        return self._replace(grouping=self.grouping + columns)
+
+    def order_by(self, *columns):
+        """Orders rows by given columns, "-column" orders descending. Replaces previous ordering"""
+        ordering = []
+        for column in columns:
+            name = column.lstrip("-")
+            self._column(name)
+            ordering.append((name, column.startswith("-")))
+        return self._replace(ordering=tuple(ordering))
+
+    def limit(self, rows):
+        return self._replace(limit_rows=self._window(rows))
+
+    def offset(self, rows):
+        return self._replace(offset_rows=self._window(rows))
+
+    def paginate(self, after=None, size=100):
+        """Page of size rows following the row or instance given as after, by keyset of current ordering and id:
+        WHERE (col, id) > (%s, %s) ORDER BY col, id LIMIT size. Every page costs the same as the first one"""
+        keyset = self._keyset()
+        values = None if after is None else tuple(self._key(after, name) for name, _ in keyset)
+        return self._replace(ordering=keyset, after=values, limit_rows=self._window(size), offset_rows=None)
+
+    def bind(self, **values):
+        """Same query with values for its Param placeholders"""
+        return self._replace(bindings={**self.bindings, **values})
+
+    def params(self, windowed=False):
+        params = []
+        for condition in self.conditions:
+            value = self._bound(condition.value)
+            if condition.operator in SQL.ARRAY_OPERATORS:
+                value = list(self._array(value))
+            params.append(value)
+
+        if self.after is not None:
+            params.extend(self.after)
+        if windowed:
+            params.extend(self._bound(rows) for rows in (self.limit_rows, self.offset_rows) if rows is not None)
+        return params
+
+    def compile(self, context, operation="select", *args):
+        """(statement, params) pair of the query. Statement is rendered to bytes once per shape, operation and
+        encoding and kept in the statement cache of SQL"""
+        connection = getattr(context, "connection", context)
+        key = (self.shape, operation, args, connection.encoding)
+
+        statement = SQL.cache.get(key)
+        if statement is None:
+            statement = getattr(self, "_" + operation)(*args).as_string(context).encode(
+                encodings[connection.encoding])
+            SQL.cache.set(key, statement)
+        return statement, self.params(operation in self.WINDOWED)
+
+    def get_all(self, limit=None):
+        if self.related_select or self.related_prefetch:
+            raise TowelOperationalError("Related entities can be loaded only by all() or iterate(instances=True)")
+        if limit is not None:
+            return self.limit(limit).get_all()
+
+        manager = self.manager
+        with manager.db.cursor() as cursor:
+            manager._execute(cursor, *self.compile(cursor), prepared=True, operation="get_all")
+            return cursor.fetchall()
+
+    def all(self):
+        """Model instances matching the filters, with related entities requested by
+        select_related()/prefetch_related() attached"""
+        manager = self.manager
+        with manager.db.cursor() as cursor:
+            statement, values = self.compile(cursor)
+            manager._execute(cursor, statement, values, prepared=True, operation="all")
+            rows = cursor.fetchall()
+        return manager._hydrate(rows, self.related_select, self.related_prefetch, self.names)
+
+    def count(self):
+        return self._scalar("count")
+
+    def exists(self):
+        return self._scalar("exists")
+
+    def aggregate(self, **aggregates):
+        """Aggregates of matching rows computed by the database, e.g. aggregate(sum="age", max=("age", "id")).
+        Returns dict keyed by column__function"""
+        spec = self._aggregates(aggregates)
+        return dict(zip((alias for _, _, alias in spec), self._rows("aggregate", spec)[0]))
+
+    def annotate(self, **aggregates):
+        """Aggregates per group of group_by() columns, rows ordered by the group columns"""
+        return self._rows("annotate", self._aggregates(aggregates))
+
+    def values_list(self, *columns, flat=False):
+        """Plain tuples of given columns, or of selected columns if none are given, without building instances.
+        With flat and a single column returns list of its values"""
+        names = self._check_columns(columns) if columns else self.names or self.model.__columns__.names
+        if flat and len(names) != 1:
+            raise TowelAttributeError("flat can be used only with a single column")
+
+        manager = self.manager
+        with manager.db.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+            statement, values = self.compile(cursor, "values", names)
+            manager._execute(cursor, statement, values, prepared=True, operation="values_list")
+            rows = cursor.fetchall()
+        return [row[0] for row in rows] if flat else rows
+
+    def explain(self, analyze=False, buffers=False):
+        """Plan of the statement get_all() and all() run, by EXPLAIN (FORMAT JSON).
+        With analyze the statement is executed and the plan carries actual times and rows"""
+        manager = self.manager
+        with manager.db.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+            statement, values = self.compile(cursor)
+            manager._execute(cursor, SQL.explain(analyze, buffers) + statement, values, operation="explain")
+            plan = Plan.from_json(cursor.fetchone()[0], statement.decode(encodings[cursor.connection.encoding]))
+
+            tables = plan.scanned_tables()
+            if tables:
+                manager._execute(cursor, SQL.TABLE_SIZES, (list(tables),), operation="explain", probe=True)
+                plan.table_sizes = dict(cursor.fetchall())
+        return plan
+
+    def explain_analyze(self, buffers=False):
+        return self.explain(analyze=True, buffers=buffers)
+
+    def iterate(self, chunk_size=1000, instances=False):
+        """Streams rows of get_all() through server-side cursor, holding at most chunk_size rows in memory"""
+        if not isinstance(chunk_size, int) or chunk_size <= 0:
+            raise TowelAttributeError("Chunk size should be positive int")
+        if (self.related_select or self.related_prefetch) and not instances:
+            raise TowelOperationalError("Related entities can be loaded only by all() or iterate(instances=True)")
+
+        return self.manager._stream(self, chunk_size, instances)
+
+    def update(self, **kwargs):
+        if self.joins:
+            raise TowelOperationalError("Towel currently doesn't support updating with join clause")
+        self._raise_if_windowed("updating")
+
+        manager = self.manager
+        manager._check_update(kwargs)
+        self.model(**kwargs)
+
+        with manager.db.cursor() as cursor:
+            statement, values = self.compile(cursor, "update", tuple(kwargs))
+            try:
+                manager._execute(cursor, statement, list(kwargs.values()) + values, operation="update")
+            except psycopg2.Error as e:
+                raise TowelOperationalError(f"{str(e)} was raised during update")
+        manager._forget()
+
+    def remove(self):
+        self._raise_if_windowed("removing")
+        manager = self.manager
+        with manager.db.cursor() as cursor:
+            statement, values = self.compile(cursor, "remove")
+            manager._execute(cursor, statement, values, operation="remove")
+        manager._forget()
+
+    def _raise_if_windowed(self, action):
+        """UPDATE and DELETE have no LIMIT, OFFSET or ORDER BY, a window would be silently widened to every row"""
+        if self.limit_rows is not None or self.offset_rows is not None or self.after is not None:
+            raise TowelOperationalError(f"Towel currently doesn't support {action} with limit, offset or paginate()")
+
+    def _bound(self, value):
+        if isinstance(value, Param):
+            if value.name not in self.bindings:
+                raise TowelAttributeError(f"Parameter {value.name} is not bound")
+            return self.bindings[value.name]
+        return value
+
+    @staticmethod
+    def _window(rows):
+        if not isinstance(rows, Param) and (not isinstance(rows, int) or rows < 0):
+            raise TowelAttributeError("Limit cannot be negative or non-int")
+        return rows
+
+    def _keyset(self):
+        """Ordering used for keyset pagination, ending with id so that every row has unique key"""
+        ordering = self.ordering or (("id", False),)
+        if any("__" in name for name, _ in ordering):
+            raise TowelAttributeError("Keyset pagination can be ordered only by columns of the model")
+        if len({descending for _, descending in ordering}) > 1:
+            raise TowelAttributeError("Keyset pagination needs all columns ordered in the same direction")
+        if all(name != "id" for name, _ in ordering):
+            ordering += (("id", ordering[0][1]),)
+        return ordering
+
+    def _key(self, row, name):
+        if isinstance(row, self.model):
+            return row._get(self.model.__columns__.index[name])
+        try:
+            return getattr(row, name)
+        except AttributeError:
+            raise TowelAttributeError(f"{row} has no value of {name} to paginate after")
+
+    def _scalar(self, operation):
+        manager = self.manager
+        with manager.db.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+            manager._execute(cursor, *self.compile(cursor, operation), prepared=True, operation=operation)
+            return cursor.fetchone()[0]
+
+    def _rows(self, operation, spec):
+        manager = self.manager
+        with manager.db.cursor() as cursor:
+            manager._execute(cursor, *self.compile(cursor, operation, spec), prepared=True, operation=operation)
+            return cursor.fetchall()
+
+    def _aggregates(self, aggregates):
+        """Hashable (function, column, alias) triples of aggregate() keyword arguments"""
+        if not aggregates:
+            raise TowelAttributeError("At least one aggregate should be given")
+
+        spec = []
+        for function, columns in aggregates.items():
+            if function not in SQL.AGGREGATES:
+                raise TowelAttributeError(f"{function} is illegal aggregate function ({' '.join(SQL.AGGREGATES)})")
+            for column in (columns,) if isinstance(columns, str) else columns:
+                self._column(column)
+                spec.append((function, column, f"{column}__{function}"))
+        return tuple(spec)
+
+    def _column(self, column):
+        """Foreign key column to join on, or None, and name of the referenced column.
+        "fk__column" references column of the model the foreign key points to"""
+        if "__" not in column:
+            if column not in self.model.__columns__:
+                raise TowelAttributeError(f"{column} is not defined in model {self.model.__name__}")
+            return None, column
+
+        try:
+            foreign_column, join_column = column.split("__")
+        except ValueError:
+            raise TowelValueError(f"{column} is not valid column name for filtering")
+
+        foreign = self.manager._foreign_column(foreign_column)
+        if join_column not in foreign.foreign_entity.__columns__:
+            raise TowelAttributeError(f"{join_column} is not defined in model {foreign.foreign_entity.__name__}")
+        return foreign, join_column
+
+    def _reference(self, column):
+        foreign, name = self._column(column)
+        return SQL.column(foreign.foreign_entity if foreign else self.model, name), foreign
+
+    @staticmethod
+    def _array(value):
+        if not isinstance(value, (list, tuple, set, frozenset)):
+            raise TowelAttributeError(f"{value} should be list, tuple or set of values")
+        return tuple(value)
+
+    def _check_columns(self, columns):
+        registry = self.model.__columns__
+        for column in columns:
+            if column not in registry:
+                raise TowelAttributeError(f"{column} is not defined in model {self.model.__name__}")
+        return tuple(columns)
+
+    def _replace(self, **changes):
+        fields = {"conditions": self.conditions, "related_select": self.related_select,
+                  "related_prefetch": self.related_prefetch, "projection": self.projection,
+                  "grouping": self.grouping, "ordering": self.ordering, "limit_rows": self.limit_rows,
+                  "offset_rows": self.offset_rows, "after": self.after, "bindings": self.bindings}
+        fields.update(changes)
+        return self.__class__(self.model, **fields)
+
+    def _where(self, extra=()):
+        clauses = [SQL.filter(c.foreign.foreign_entity if c.foreign else self.model, c.column, c.operator)
+                   for c in self.conditions]
+        if self.after is not None:
+            clauses.append(SQL.keyset(self.model, self.ordering))
+        clauses.extend(extra)
+        return sql.SQL(" where ") + sql.SQL(" and ").join(clauses) if clauses else sql.Composed([])
+
+    def _order(self):
+        """Joins, ORDER BY, LIMIT and OFFSET of statements returning rows"""
+        references = [(self._reference(name), descending) for name, descending in self.ordering]
+        statement = self._from_joins(outer=[foreign for (_, foreign), _ in references])
+        if references:
+            statement += sql.SQL(" order by ") + sql.SQL(", ").join(
+                reference + sql.SQL(" desc") if descending else reference for (reference, _), descending in references)
+        if self.limit_rows is not None:
+            statement += sql.SQL(" ") + SQL.LIMIT
+        if self.offset_rows is not None:
+            statement += sql.SQL(" ") + SQL.OFFSET
+        return statement
+
+    def _select(self):
+        select, names = self.related_select, self.names
+        if select:
+            statement = SQL.select_related(self.model, select, names)
+        elif names:
+            statement = SQL.select_columns(self.model, names)
+        else:
+            statement = SQL.select_all(self.model)
+        return statement + self._order()
+
+    def _values(self, names):
+        return SQL.select_columns(self.model, names) + self._order()
+
+    def _from_joins(self, outer=()):
+        """Inner joins of filters, then left joins of other foreign key columns the statement reads,
+        which must not drop rows"""
+        joins = self.joins
+        outer = dict.fromkeys(column for column in outer if column is not None and column not in joins)
+        return sql.Composed([SQL.inner_join(self.model, column) for column in joins] +
+                            [SQL.left_join(self.model, column) for column in outer]) + self._where()
+
+    def _count(self):
+        """Count of rows, of those within LIMIT and OFFSET if the query has them"""
+        if self.limit_rows is None and self.offset_rows is None:
+            return sql.SQL("select count(*) from {}").format(sql.Identifier(self.model.tablename())) + \
+                self._from_joins()
+        return sql.SQL("select count(*) from (select 1 from {}").format(sql.Identifier(self.model.tablename())) + \
+            self._order() + sql.SQL(") as windowed")
+
+    def _exists(self):
+        statement = sql.SQL("select exists(select 1 from {}").format(sql.Identifier(self.model.tablename()))
+        if self.limit_rows is None and self.offset_rows is None:
+            return statement + self._from_joins() + sql.SQL(" limit 1)")
+        return statement + self._order() + sql.SQL(")")
+
+    def _aggregate(self, spec, grouping=()):
+        groups = [self._reference(column) for column in grouping]
+        aggregates = [self._reference(column) for _, column, _ in spec]
+        fields = [sql.SQL("{} as {}").format(reference, sql.Identifier(column))
+                  for (reference, _), column in zip(groups, grouping)]
+        fields.extend(SQL.aggregate(function, reference, alias)
+                      for (function, _, alias), (reference, _) in zip(spec, aggregates))
+
+        statement = sql.SQL("select ") + sql.SQL(", ").join(fields) + \
+            sql.SQL(" from {}").format(sql.Identifier(self.model.tablename())) + \
+            self._from_joins(outer=[foreign for _, foreign in groups + aggregates])
+        if groups:
+            references = sql.SQL(", ").join(reference for reference, _ in groups)
+            statement += sql.SQL(" group by ") + references + sql.SQL(" order by ") + references
+        return statement
+
+    def _annotate(self, spec):
+        return self._aggregate(spec, self.grouping)
+
+    def _update(self, columns):
+        return SQL.update_columns(self.model, columns) + self._where()
+
+    def _remove(self):
+        joins = self.joins
+        statement = SQL.remove(self.model)
+        if joins:
+            statement += sql.SQL("using {} ").format(
+                sql.SQL(", ").join(sql.Identifier(column.foreign_entity.tablename()) for column in joins))
+        tablename = self.model.tablename()
+        return statement + self._where([SQL.construct_join_clause(column.foreign_entity.tablename(), tablename,
+                                                                  column.column_name) for column in joins])
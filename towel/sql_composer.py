@@ -1,47 +1,183 @@
 from psycopg2 import sql
+from psycopg2.extensions import encodings
 
-from . import TowelAttributeError
+from . import TowelAttributeError, TowelOperationalError
+from .columns import DEFERRED
+from .lru import LRUCache
 
 
 class SQL:
+    cache = LRUCache(maxsize=1024)
+
     CREATE_TABLE = "create table {} "
     SELECT_ALL = "select {}.* from {}"
     LIMIT = sql.SQL("limit %s")
+    OFFSET = sql.SQL("offset %s")
     GET_BY_PK = "select * from {} where id = %s"
+    GET_BY_PKS = "select * from {} where id = any(%s)"
     UPDATE = "update {} set "
     REMOVE = "delete from {} "
-    REMOVE_BY_ID = REMOVE + " where id = %s"
+    WHERE_ID = " where id = %s"
+    BULK_UPDATE = "update {} set {} from (values {}) as v ({}) where {}.id = v.id"
+    REMOVE_BY_ID = REMOVE + WHERE_ID
+    COPY_FROM = "copy {} ({}) from stdin"
 
-    OPERATORS = ("<", ">", "<=", ">=", "=", "<>")
+    OPERATORS = ("<", ">", "<=", ">=", "=", "<>", "in")
+    ON_CONFLICT = ("raise", "ignore", "update")
+    AGGREGATES = ("count", "sum", "avg", "min", "max")
+    ESTIMATED_COUNT = "select reltuples::bigint from pg_catalog.pg_class " \
+                      "where relname = %s and relnamespace = 'public'::regnamespace"
+    ARRAY_OPERATORS = {"in": "= any(%s)"}
+    TABLE_SIZES = "select relname, reltuples::bigint from pg_catalog.pg_class " \
+                  "where relname = any(%s) and relnamespace = 'public'::regnamespace"
+    INDEXES = "select indexname from pg_catalog.pg_indexes where schemaname = 'public' and tablename = %s"
+    ADVANCE_SEQUENCE = "with written as ({}), advanced as (select setval(seq, top) as value from " \
+                       "(select pg_get_serial_sequence(quote_ident({}), 'id')::regclass as seq, max(id) as top " \
+                       "from written) as serial where top > coalesce(pg_sequence_last_value(seq), 0)) " \
+                       "select written.*, advanced.value as advanced from written left join advanced on true"
 
     @classmethod
-    def INSERT(cls, columns):
-        statement = ("insert into {} " + "(" + ", ".join(
-            column.column_name for column in columns if column.column_name != "id") + ") values")
+    def INSERT(cls, registry):
+        statement = "insert into {} " + "(" + ", ".join(registry.insertable_names) + ") values"
+        return statement
+
+    @classmethod
+    def compiled(cls, context, operation, model, *args):
+        """Statement built by SQL.<operation>(model, *args), rendered to bytes once and then memoized
+        per model, operation and arguments shaping the statement (row count, column set, operator)"""
+        model = model if isinstance(model, type) else model.__class__
+        connection = getattr(context, "connection", context)
+        key = (model, operation, args, connection.encoding)
+
+        statement = cls.cache.get(key)
+        if statement is None:
+            statement = getattr(cls, operation)(model, *args).as_string(context).encode(
+                encodings[connection.encoding])
+            cls.cache.set(key, statement)
         return statement
 
     @classmethod
     def create_table(cls, model):
-        data = [item.sql for item in model.columns() if item.column_name != "id"]
-        if not getattr(model, "id"):
+        registry = model.__columns__
+        data = [item.sql for item in registry.insertable]
+        if not registry.primary_key:
             raise TowelAttributeError("ID column was not set")
         data.insert(0, "id SERIAL PRIMARY KEY")
         columns = ', '.join(data)
         return sql.SQL(cls.CREATE_TABLE + "(" + columns + ")").format(sql.Identifier(model.tablename()))
 
+    @staticmethod
+    def explain(analyze=False, buffers=False):
+        """Prefix turning a rendered statement into EXPLAIN of it with JSON output"""
+        return ("explain (format json" + (", analyze" if analyze else "") + (", buffers" if buffers else "") +
+                ") ").encode()
+
+    @classmethod
+    def create_index(cls, model, index, concurrently=False):
+        columns = [sql.SQL("{} desc").format(sql.Identifier(column[1:])) if column.startswith("-")
+                   else sql.Identifier(column) for column in index.columns]
+        statement = sql.SQL("create " + ("unique " if index.unique else "") + "index " +
+                            ("concurrently " if concurrently else "") + "if not exists {} on {} (").format(
+            sql.Identifier(index.name), sql.Identifier(model.tablename())) + sql.SQL(", ").join(columns) + sql.SQL(")")
+        if index.where:
+            statement += sql.SQL(" where " + index.where)
+        return statement
+
+    @classmethod
+    def insert(cls, model, rows=1):
+        registry = model.__columns__
+        placeholders = "(" + ', '.join("%s" for _ in registry.insertable_names) + ")"
+        return sql.SQL(cls.INSERT(registry) + ", ".join(placeholders for _ in range(rows)) + " returning id").format(
+            sql.Identifier(model.tablename()))
+
     @classmethod
-    def save_model(cls, model):
-        values = [item.value for item in model.columns() if item.column_name != "id"]
-        placeholders = ', '.join("%s" for _ in range(len(values)))
-        return sql.SQL(cls.INSERT(model.columns()) + "(" + placeholders + ") returning id").format(
-            sql.Identifier(model.tablename())), values
+    def save_model(cls, model, *models):
+        """Single or multi-row insert of instances of the same model, values are flattened row by row"""
+        return cls.insert(model, rows=1 + len(models)), cls.row_values(model, *models)
+
+    @classmethod
+    def row_values(cls, *models, with_id=False):
+        registry = models[0].__columns__
+        positions = ((registry.index["id"],) if with_id else ()) + registry.insertable_positions
+        return cls._loaded([row[position] for row in (m._values for m in models) for position in positions])
+
+    @classmethod
+    def upsert(cls, model, rows, with_id, on_conflict, target):
+        """Multi-row insert resolving conflicts on target columns in the database. "raise" leaves conflict to fail,
+        "ignore" skips conflicting rows and "update" overwrites the rest of their columns.
+        Returns id and target columns of written rows. Rows inserted under given ids move the id sequence
+        past them in the same statement, so ids generated later don't collide with them"""
+        registry = model.__columns__
+        names = (("id",) if with_id else ()) + registry.insertable_names
+        placeholders = "(" + ", ".join("%s" for _ in names) + ")"
+        statement = sql.SQL("insert into {} ({}) values ").format(
+            sql.Identifier(model.tablename()), sql.SQL(", ").join(map(sql.Identifier, names))) + \
+            sql.SQL(", ".join(placeholders for _ in range(rows)))
+
+        if on_conflict != "raise":
+            statement += sql.SQL(" on conflict ({}) ").format(sql.SQL(", ").join(map(sql.Identifier, target)))
+            if on_conflict == "update":
+                # with nothing else to overwrite, a no-op update still returns conflicting rows
+                updated = [name for name in registry.insertable_names if name not in target] or target[:1]
+                statement += sql.SQL("do update set ") + sql.SQL(", ").join(
+                    sql.SQL("{} = excluded.{}").format(sql.Identifier(name), sql.Identifier(name)) for name in updated)
+            else:
+                statement += sql.SQL("do nothing")
+
+        returning = ("id",) + tuple(name for name in target if name != "id")
+        statement += sql.SQL(" returning ") + sql.SQL(", ").join(map(sql.Identifier, returning))
+        if with_id:
+            statement = sql.SQL(cls.ADVANCE_SEQUENCE).format(statement, sql.Literal(model.tablename()))
+        return statement
+
+    @classmethod
+    def copy_from(cls, model):
+        return sql.SQL(cls.COPY_FROM).format(sql.Identifier(model.tablename()),
+                                             sql.SQL(", ").join(map(sql.Identifier, model.__columns__.insertable_names)))
 
     @classmethod
     def update(cls, model, **kwargs):
-        columns = ', '.join([item + "=%s" for item in kwargs if item != "id"])
-        values = list(kwargs.values())
-        return sql.SQL(cls.UPDATE + columns).format(
-            sql.Identifier(model.tablename())), values
+        return cls.update_columns(model, tuple(kwargs)), list(kwargs.values())
+
+    @classmethod
+    def update_by_id(cls, model, **kwargs):
+        return cls.update_columns_by_id(model, tuple(kwargs)), list(kwargs.values()) + [model.id.value]
+
+    @classmethod
+    def update_columns(cls, model, columns):
+        columns = ', '.join([item + "=%s" for item in columns if item != "id"])
+        return sql.SQL(cls.UPDATE + columns).format(sql.Identifier(model.tablename()))
+
+    @classmethod
+    def update_columns_by_id(cls, model, columns):
+        return cls.update_columns(model, columns) + sql.SQL(cls.WHERE_ID)
+
+    @classmethod
+    def bulk_update(cls, model, columns, rows):
+        """Update of given columns taking per-row values from a VALUES list of (id, *columns),
+        each placeholder cast to SQL type of its column"""
+        registry = model.__columns__
+        names = ("id",) + tuple(columns)
+        casts = ", ".join("%s::" + registry.columns[registry.index[name]].field_inst.SQL_TYPE for name in names)
+        tablename = sql.Identifier(model.tablename())
+        return sql.SQL(cls.BULK_UPDATE).format(
+            tablename,
+            sql.SQL(", ").join(sql.SQL("{} = v.{}").format(sql.Identifier(name), sql.Identifier(name))
+                               for name in columns),
+            sql.SQL(", ".join("(" + casts + ")" for _ in range(rows))),
+            sql.SQL(", ").join(map(sql.Identifier, names)),
+            tablename)
+
+    @classmethod
+    def bulk_update_values(cls, columns, *models):
+        positions = [models[0].__columns__.index[name] for name in ("id",) + tuple(columns)]
+        return cls._loaded([row[position] for row in (m._values for m in models) for position in positions])
+
+    @staticmethod
+    def _loaded(values):
+        if DEFERRED in values:
+            raise TowelOperationalError("Deferred columns have to be loaded before they are written")
+        return values
 
     @classmethod
     def remove(cls, model):
@@ -49,19 +185,93 @@ class SQL:
 
     @classmethod
     def remove_by_id(cls, model):
-        return sql.SQL(cls.REMOVE_BY_ID).format(sql.Identifier(model.tablename())), (model.id.value,)
+        return cls.remove_one(model), (model.id.value,)
+
+    @classmethod
+    def remove_one(cls, model):
+        return sql.SQL(cls.REMOVE_BY_ID).format(sql.Identifier(model.tablename()))
 
     @classmethod
     def get(cls, model):
         return sql.SQL(cls.GET_BY_PK).format(sql.Identifier(model.tablename()))
 
+    @classmethod
+    def get_columns(cls, model, names):
+        return sql.SQL("select {} from {} where id = %s").format(
+            sql.SQL(", ").join(map(sql.Identifier, names)), sql.Identifier(model.tablename()))
+
+    @classmethod
+    def get_many(cls, model):
+        return sql.SQL(cls.GET_BY_PKS).format(sql.Identifier(model.tablename()))
+
+    @classmethod
+    def select_related(cls, model, columns, names=None):
+        """Columns of the model followed by columns of each related model, joined under foreign key column alias"""
+        tablename = model.tablename()
+        fields = [sql.SQL("{}.{}").format(sql.Identifier(tablename), sql.Identifier(name))
+                  for name in names or model.__columns__.names]
+        joins = []
+        for column in columns:
+            alias = column.column_name
+            foreign = column.foreign_entity
+            fields.extend(sql.SQL("{}.{} as {}").format(sql.Identifier(alias), sql.Identifier(name),
+                                                        sql.Identifier(alias + "__" + name))
+                          for name in foreign.__columns__.names)
+            joins.append(sql.SQL(" left join {} as {} on ").format(sql.Identifier(foreign.tablename()),
+                                                                  sql.Identifier(alias)) +
+                         cls.construct_join_clause(alias, tablename, column.column_name))
+
+        return sql.SQL("select ") + sql.SQL(", ").join(fields) + \
+            sql.SQL(" from {}").format(sql.Identifier(tablename)) + sql.Composed(joins)
+
+    @classmethod
+    def select_columns(cls, model, names):
+        tablename = sql.Identifier(model.tablename())
+        return sql.SQL("select ") + sql.SQL(", ").join(sql.SQL("{}.{}").format(tablename, sql.Identifier(name))
+                                                       for name in names) + sql.SQL(" from {}").format(tablename)
+
     @classmethod
     def select_all(cls, model):
         return sql.SQL(cls.SELECT_ALL).format(sql.Identifier(model.tablename()), sql.Identifier(model.tablename()))
 
+    @classmethod
+    def column(cls, model, name):
+        return sql.SQL("{}.{}").format(sql.Identifier(model.tablename()), sql.Identifier(name))
+
+    @classmethod
+    def keyset(cls, model, ordering):
+        """Row comparison selecting rows after the key of the previous page, ordering shares one direction"""
+        operator = " < " if ordering[0][1] else " > "
+        return sql.SQL(" (") + sql.SQL(", ").join(cls.column(model, name) for name, _ in ordering) + \
+            sql.SQL(")" + operator + "(" + ", ".join("%s" for _ in ordering) + ")")
+
+    @classmethod
+    def aggregate(cls, function, reference, alias):
+        if function not in cls.AGGREGATES:
+            raise TowelAttributeError(f"{function} is illegal aggregate function ({' '.join(cls.AGGREGATES)})")
+        return sql.SQL(function + "({}) as {}").format(reference, sql.Identifier(alias))
+
     @classmethod
     def filter(cls, model, column, operator):
-        return sql.SQL(" {}.{} " + operator + " %s").format(sql.Identifier(model.tablename()), sql.Identifier(column))
+        """Condition on a column. Array operators take all values in one array parameter,
+        so the statement doesn't depend on number of values"""
+        condition = cls.ARRAY_OPERATORS.get(operator) or operator + " %s"
+        return sql.SQL(" {}.{} " + condition).format(sql.Identifier(model.tablename()), sql.Identifier(column))
+
+    @classmethod
+    def inner_join(cls, model, column):
+        return cls._join("inner", model, column)
+
+    @classmethod
+    def left_join(cls, model, column):
+        """Join keeping rows whose foreign key is NULL, for columns which are read but not filtered on"""
+        return cls._join("left", model, column)
+
+    @classmethod
+    def _join(cls, kind, model, column):
+        foreign = column.foreign_entity.tablename()
+        return sql.SQL(" " + kind + " join {} on ").format(sql.Identifier(foreign)) + \
+            cls.construct_join_clause(foreign, model.tablename(), column.column_name)
 
     @classmethod
     def construct_join_clause(cls, join_table, tablename, column_name):